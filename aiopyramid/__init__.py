@@ -3,6 +3,7 @@ Run pyramid app using asyncio
 """
 
 from .config import CoroutineOrExecutorMapper
+from .request import aio_json, aio_params
 
 
 def includeme(config):
@@ -12,3 +13,5 @@ def includeme(config):
     """
 
     config.set_view_mapper(CoroutineOrExecutorMapper)
+    config.add_request_method(aio_params, 'aio_params')
+    config.add_request_method(aio_json, 'aio_json')
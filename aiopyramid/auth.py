@@ -3,14 +3,34 @@ Utilities for making :ref:`Pyramid <pyramid:index>` authentication
 and authorization work with Aiopyramid.
 """
 
+import asyncio
+import functools
+import hashlib
 
-from .helpers import spawn_greenlet_on_scope_error, synchronize
+import greenlet
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.interfaces import IAuthenticationPolicy, IAuthorizationPolicy
+from pyramid.security import Allow
+from pyramid.traversal import is_nonstr_iter
+
+try:
+    from pyramid.interfaces import ISecurityPolicy
+except ImportError:  # Pyramid < 2.0
+    ISecurityPolicy = None
+
+from .helpers import spawn_greenlet, spawn_greenlet_on_scope_error, synchronize
+from .traversal import lineage
+
+MEMO_KEY = 'aiopyramid.auth'
+
+_MISSING = object()
 
 
 def coroutine_callback_authentication_policy_factory(
     policy_class,
     coroutine=None,
     *args,
+    principals_cache=None,
     **kwargs
 ):
     """
@@ -20,6 +40,8 @@ def coroutine_callback_authentication_policy_factory(
     :param policy_class: The AuthenticationPolicy to wrap.
     :param coroutine coroutine: If provided this is passed to
     the AuthenticationPolicy as the callback argument.
+    :param principals_cache: Optional :class:`~aiopyramid.cache.LRUCache`
+    passed to :class:`~aiopyramid.auth.CoroutineAuthenticationPolicyProxy`.
 
     Extra arguments and keyword arguments are passed to
     the AuthenticationPolicy, so if the AuthenticationPolicy expects
@@ -37,12 +59,28 @@ def coroutine_callback_authentication_policy_factory(
         policy = policy_class(callback=coroutine, *args, **kwargs)
     else:
         policy = policy_class(*args, **kwargs)
-    return CoroutineAuthenticationPolicyProxy(policy)
+    return CoroutineAuthenticationPolicyProxy(
+        policy,
+        principals_cache=principals_cache,
+    )
 
 
 authn_policy_factory = coroutine_callback_authentication_policy_factory
 
 
+def _done(value):
+    """
+    Returns `value` as the callers of the proxy expect it, i.e. wrapped in a
+    finished future when called from a :term:`coroutine`.
+    """
+
+    if greenlet.getcurrent().parent is None:
+        future = asyncio.Future()
+        future.set_result(value)
+        return future
+    return value
+
+
 class CoroutineAuthenticationPolicyProxy:
     """
     This authentication policy proxies calls to another policy that uses
@@ -50,31 +88,358 @@ class CoroutineAuthenticationPolicyProxy:
     :term:`synchronized coroutine`, this class handles the case where the
     callback fails due to a :class:`~aiopyramid.exceptions.ScopeError` and
     generates the appropriate ``Aiopyramid`` architecture.
+
+    The userids and principals of a request are looked up once and
+    remembered until :meth:`remember` or :meth:`forget` is called for the
+    request. A `principals_cache` additionally keeps what the callback of
+    the policy returns between requests, keyed by the arguments it is called
+    with. The policy still verifies the credentials of every request, and
+    failed lookups are not cached.
     """
 
-    def __init__(self, policy):
+    def __init__(self, policy, principals_cache=None):
         """
         :param class policy: The authentication policy to wrap.
+        :param principals_cache: Optional
+            :class:`~aiopyramid.cache.LRUCache` for the results of the
+            callback of `policy` across requests.
         """
 
         self._policy = policy
+        self.principals_cache = principals_cache
+        if principals_cache is None:
+            return
+        if getattr(policy, 'check', None) is not None:
+            # e.g. BasicAuthAuthenticationPolicy, whose check is passed the
+            # username and password and verifies them
+            policy.check = self._caching(policy.check)
+        elif getattr(policy, 'callback', None) is not None:
+            # called with the userid once the policy verified the request
+            policy.callback = self._caching(policy.callback)
+
+    def _caching(self, callback):
+        cache = self.principals_cache
+
+        @functools.wraps(callback)
+        def _caching_callback(userid, *args):
+            # the arguments between the userid and the request are
+            # credentials, only their digest is kept
+            credentials = hashlib.sha256(
+                repr(args[:-1]).encode('utf-8'),
+            ).hexdigest()
+            key = ('callback', userid, credentials)
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = callback(userid, *args)
+                if value is not None:
+                    cache.set(key, value)
+            return value
+
+        return _caching_callback
+
+    def _memo(self, request):
+        return request.environ.setdefault(MEMO_KEY, {}).setdefault(self, {})
+
+    def _clear(self, request):
+        request.environ.get(MEMO_KEY, {}).pop(self, None)
+
+    def invalidate(self, userid=None):
+        """
+        Drops the cached callback results for `userid` from the
+        `principals_cache`, or of every userid if `userid` is
+        `None`. Call this when the roles of a user change.
+        """
+
+        cache = self.principals_cache
+        if cache is None:
+            return
+        if userid is None:
+            cache.clear()
+        else:
+            cache.discard_if(lambda key: key[1] == userid)
+
+    def _memoized(self, name, request):
+        try:
+            return _done(self._memo(request)[name])
+        except KeyError:
+            return self._lookup(name, request)
+
+    @spawn_greenlet_on_scope_error
+    def _lookup(self, name, request):
+        memo = self._memo(request)
+        if name in memo:
+            return memo[name]
+        value = getattr(self._policy, name)(request)
+        memo[name] = value
+        return value
+
+    def _unauthenticated_userid(self, request):
+        memo = self._memo(request)
+        try:
+            return memo['unauthenticated_userid']
+        except KeyError:
+            userid = self._policy.unauthenticated_userid(request)
+            memo['unauthenticated_userid'] = userid
+            return userid
 
     @spawn_greenlet_on_scope_error
     def remember(self, request, principal, **kwargs):
+        self._clear(request)
         return self._policy.remember(request, principal, **kwargs)
 
     @spawn_greenlet_on_scope_error
     def forget(self, request):
+        if self.principals_cache is not None:
+            self.invalidate(self._unauthenticated_userid(request))
+        self._clear(request)
         return self._policy.forget(request)
 
-    @spawn_greenlet_on_scope_error
     def unauthenticated_userid(self, request):
-        return self._policy.unauthenticated_userid(request)
+        return self._memoized('unauthenticated_userid', request)
 
-    @spawn_greenlet_on_scope_error
     def authenticated_userid(self, request):
-        return self._policy.authenticated_userid(request)
+        return self._memoized('authenticated_userid', request)
 
-    @spawn_greenlet_on_scope_error
     def effective_principals(self, request):
-        return self._policy.effective_principals(request)
+        return self._memoized('effective_principals', request)
+
+
+@asyncio.coroutine
+def _resolve(result):
+    if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+        result = yield from result
+    return result
+
+
+class CoroutineSecurityPolicyProxy:
+    """
+    Proxies a security policy in the style of Pyramid's ``ISecurityPolicy``
+    whose methods may be :term:`coroutines <coroutine>`.
+
+    Called from a :term:`coroutine`, every method returns a coroutine that
+    can be awaited directly. Called from framework code running in a
+    :term:`greenlet`, e.g. through :attr:`pyramid.request.Request.identity`,
+    every method waits on the policy through a single synchronized call.
+    The identity and authenticated userid of a request are looked up once
+    and remembered until :meth:`remember` or :meth:`forget` is called.
+    """
+
+    def __init__(self, policy):
+        """
+        :param policy: The security policy to wrap.
+        """
+
+        self._policy = policy
+
+    def _memo(self, request):
+        return request.environ.setdefault(MEMO_KEY, {}).setdefault(self, {})
+
+    def _clear(self, request):
+        request.environ.get(MEMO_KEY, {}).pop(self, None)
+
+    def _memoized(self, name, request):
+        try:
+            return _done(self._memo(request)[name])
+        except KeyError:
+            return self._lookup(name, request)
+
+    @synchronize(strict=False)
+    @asyncio.coroutine
+    def _lookup(self, name, request):
+        value = yield from _resolve(getattr(self._policy, name)(request))
+        self._memo(request)[name] = value
+        return value
+
+    def identity(self, request):
+        return self._memoized('identity', request)
+
+    def authenticated_userid(self, request):
+        return self._memoized('authenticated_userid', request)
+
+    @synchronize(strict=False)
+    @asyncio.coroutine
+    def permits(self, request, context, permission):
+        return (yield from _resolve(
+            self._policy.permits(request, context, permission)
+        ))
+
+    @synchronize(strict=False)
+    @asyncio.coroutine
+    def remember(self, request, userid, **kw):
+        self._clear(request)
+        return (yield from _resolve(
+            self._policy.remember(request, userid, **kw)
+        ))
+
+    @synchronize(strict=False)
+    @asyncio.coroutine
+    def forget(self, request, **kw):
+        self._clear(request)
+        return (yield from _resolve(self._policy.forget(request, **kw)))
+
+
+def _acl_coroutine(acl):
+    """
+    Returns a coroutine for an `__acl__` that is a :term:`coroutine` or a
+    :term:`synchronized coroutine` method, otherwise `None`. Synchronized
+    coroutines are checked first because :func:`functools.wraps` makes them
+    look like coroutine functions.
+    """
+
+    wrapped = getattr(acl, '__wrapped__', None)
+    if wrapped is not None and asyncio.iscoroutinefunction(wrapped):
+        owner = getattr(acl, '__self__', None)
+        if owner is not None:
+            return wrapped(owner)
+        return wrapped()
+    if asyncio.iscoroutinefunction(acl):
+        return acl()
+    return None
+
+
+@asyncio.coroutine
+def _location_acl(location, semaphore):
+    try:
+        acl = location.__acl__
+    except AttributeError:
+        return None
+    if acl and callable(acl):
+        yield from semaphore.acquire()
+        try:
+            pending = _acl_coroutine(acl)
+            if pending is None:
+                acl = yield from spawn_greenlet(acl)
+            else:
+                acl = yield from pending
+        finally:
+            semaphore.release()
+    return acl
+
+
+def _acl_permits(acls, principals, permission):
+    # same rules as pyramid.authorization.ACLAuthorizationPolicy.permits
+    for acl in acls:
+        if acl is None:
+            continue
+        for ace_action, ace_principal, ace_permissions in acl:
+            if ace_principal in principals:
+                if not is_nonstr_iter(ace_permissions):
+                    ace_permissions = [ace_permissions]
+                if permission in ace_permissions:
+                    return ace_action == Allow
+    return False
+
+
+@asyncio.coroutine
+def _bounded(semaphore, func, *args):
+    yield from semaphore.acquire()
+    try:
+        return (yield from spawn_greenlet(func, *args))
+    finally:
+        semaphore.release()
+
+
+@asyncio.coroutine
+def _check_acls(request, checks, principals, semaphore):
+    contexts = []
+    seen = set()
+    for permission, context in checks:
+        if id(context) not in seen:
+            seen.add(id(context))
+            contexts.append(context)
+    lineages = yield from asyncio.gather(
+        *[lineage(context, request) for context in contexts]
+    )
+    lineages = {
+        id(context): chain for context, chain in zip(contexts, lineages)
+    }
+
+    # every location is asked for its ACL once, however many checks share it
+    locations = {}
+    for chain in lineages.values():
+        for location in chain:
+            locations.setdefault(id(location), location)
+    keys = list(locations)
+    acls = yield from asyncio.gather(
+        *[_location_acl(locations[key], semaphore) for key in keys]
+    )
+    acls = dict(zip(keys, acls))
+
+    return [
+        _acl_permits(
+            [acls[id(location)] for location in lineages[id(context)]],
+            principals,
+            permission,
+        )
+        for permission, context in checks
+    ]
+
+
+@asyncio.coroutine
+def has_permissions(request, checks, limit=10):
+    """
+    A :term:`coroutine` that checks many permissions at once, e.g. to filter
+    a listing, and returns a list of booleans in the order of `checks`.
+
+    :param request: The current request.
+    :param checks: A list of ``(permission, context)`` pairs. A `context`
+        of `None` stands for ``request.context``.
+    :param int limit: Maximum number of ACLs or policy checks awaited at
+        the same time.
+
+    The principals of the request are computed once. With Pyramid's
+    :class:`~pyramid.authorization.ACLAuthorizationPolicy`, the `__acl__` of
+    every location in the lineages of the contexts is looked up once and
+    :term:`coroutine` or :term:`synchronized coroutine` ACLs are awaited
+    concurrently. Other authorization policies are called concurrently in
+    their own :term:`greenlets <greenlet>`.
+
+    .. code-block:: python
+
+        allowed = yield from has_permissions(
+            request,
+            [('view', item) for item in items],
+        )
+        items = [item for item, ok in zip(items, allowed) if ok]
+    """
+
+    checks = [
+        (permission, request.context if context is None else context)
+        for permission, context in checks
+    ]
+    semaphore = asyncio.Semaphore(limit)
+    registry = request.registry
+
+    authn = registry.queryUtility(IAuthenticationPolicy)
+    if authn is None:
+        security = None
+        if ISecurityPolicy is not None:
+            security = registry.queryUtility(ISecurityPolicy)
+        if security is None:
+            return [True] * len(checks)
+        permits = yield from asyncio.gather(*[
+            _bounded(semaphore, security.permits, request, context, permission)
+            for permission, context in checks
+        ])
+        return [bool(permitted) for permitted in permits]
+
+    if isinstance(authn, CoroutineAuthenticationPolicyProxy):
+        principals = yield from _resolve(authn.effective_principals(request))
+    else:
+        principals = yield from spawn_greenlet(
+            authn.effective_principals,
+            request,
+        )
+
+    authz = registry.getUtility(IAuthorizationPolicy)
+    if (
+        isinstance(authz, ACLAuthorizationPolicy) and
+        type(authz).permits is ACLAuthorizationPolicy.permits
+    ):
+        return (yield from _check_acls(request, checks, principals, semaphore))
+
+    permits = yield from asyncio.gather(*[
+        _bounded(semaphore, authz.permits, context, principals, permission)
+        for permission, context in checks
+    ])
+    return [bool(permitted) for permitted in permits]
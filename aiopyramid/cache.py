@@ -0,0 +1,74 @@
+"""
+Small in-process caches used by ``Aiopyramid``.
+
+These caches are not thread-safe. They are meant to be used from the thread
+running the event loop, which is where :term:`coroutines <coroutine>` and
+request :term:`greenlets <greenlet>` run.
+"""
+
+import collections
+import time
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Mapping with a maximum size that evicts the least recently used entries
+    first and, optionally, entries older than `ttl` seconds.
+
+    :param int maxsize: Maximum number of entries.
+    :param float ttl: Seconds an entry stays valid, `None` for no expiry.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires is not None and expires <= self.clock():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        return entry[1]
+
+    def discard_if(self, predicate):
+        """ Removes every entry whose key satisfies `predicate`. """
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def keys(self):
+        return list(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
@@ -3,11 +3,32 @@ This module provides view mappers for running views in asyncio.
 """
 import asyncio
 import inspect
+import io
 
 from pyramid.config.views import DefaultViewMapper
 from pyramid.exceptions import ConfigurationError
 
-from .helpers import synchronize, is_generator
+from .helpers import synchronize, is_generator, bind_context
+
+
+def _rewind_body(request):
+    """
+    Rewinds the body of `request` when that does not require reading it.
+
+    Bodies that would have to be copied first, e.g. the input stream of
+    uWSGI, are left to :func:`~aiopyramid.request.aio_params`,
+    :func:`~aiopyramid.request.aio_json` and
+    :class:`~aiopyramid.multipart.MultipartReader`, which read large bodies
+    in the executor.
+    """
+
+    if not request.is_body_readable:
+        return
+    if (
+        request.is_body_seekable
+        or isinstance(request.body_file_raw, io.BytesIO)
+    ):
+        request.make_body_seekable()
 
 
 class AsyncioMapperBase(DefaultViewMapper):
@@ -21,9 +42,7 @@ class AsyncioMapperBase(DefaultViewMapper):
 
         def coroutine_view(context, request):
 
-            # Trigger loading of post data to avoid synchronization problems
-            # This must be done in a non-async context
-            request.params.__getitem__ = request.params.__getitem__
+            _rewind_body(request)
 
             return view(context, request)
 
@@ -35,9 +54,7 @@ class AsyncioMapperBase(DefaultViewMapper):
 
         def executor_view(context, request):
 
-            # Trigger loading of post data to avoid synchronization problems
-            # This must be done in a non-async context
-            request.params.__getitem__ = request.params.__getitem__
+            _rewind_body(request)
 
             # since we are running in a new thread,
             # remove the old wsgi.file_wrapper for uwsgi
@@ -47,7 +64,7 @@ class AsyncioMapperBase(DefaultViewMapper):
                 return view(context, request)
 
             exe = synchronizer(asyncio.get_event_loop().run_in_executor)
-            return exe(None, view, context, request)
+            return exe(None, bind_context(view), context, request)
 
         return executor_view
 
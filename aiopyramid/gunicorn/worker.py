@@ -1,12 +1,22 @@
 import asyncio
+import os
+import signal
+import time
 
 from aiohttp_wsgi.wsgi import WSGIHandler, ReadBuffer
 from aiohttp.worker import GunicornWebWorker
-from aiohttp.web import Application, Response, HTTPRequestEntityTooLarge
+from aiohttp.web import (
+    Application,
+    HTTPRequestEntityTooLarge,
+    Response,
+    StreamResponse,
+)
 
 from aiopyramid.helpers import (
     spawn_greenlet,
 )
+from aiopyramid.log import batch_logger
+from aiopyramid.profiler import profile_in_background
 
 
 def _run_application(application, environ):
@@ -29,6 +39,15 @@ def _run_application(application, environ):
     response_body = []
     # Run the application.
     body_iterable = application(environ, start_response)
+    if hasattr(body_iterable, '__anext__'):
+        # streamed by the handler
+        assert response_status is not None, "application did not call start_response()"  # noqa
+        return (
+            response_status,
+            response_reason,
+            response_headers,
+            body_iterable,
+        )
     try:
         response_body.extend(body_iterable)
         assert response_status is not None, "application did not call start_response()"  # noqa
@@ -85,11 +104,25 @@ class AiopyramidWSGIHandler(WSGIHandler):
             environ = self._get_environ(request, body, content_length)
             environ['async.writer'] = request.writer
             environ['async.protocol'] = request.protocol
+            environ['aiohttp.request'] = request
+            # the body is already buffered in a seekable file
+            environ['webob.is_body_seekable'] = True
             status, reason, headers, body = yield from spawn_greenlet(
                 _run_application,
                 self._application,
                 environ,
             )
+            serve_websocket = environ.get('aiopyramid.websocket')
+            if serve_websocket is not None and status == 101:
+                return (yield from serve_websocket(headers))
+            if hasattr(body, '__anext__'):
+                return (yield from self.stream_response(
+                    request,
+                    status,
+                    reason,
+                    headers,
+                    body,
+                ))
             # All done!
             return Response(
                 status=status,
@@ -101,9 +134,94 @@ class AiopyramidWSGIHandler(WSGIHandler):
         finally:
             yield from body_buffer.close()
 
+    @asyncio.coroutine
+    def stream_response(self, request, status, reason, headers, body):
+        """
+        Writes each chunk of an asynchronous `body` as it is produced and
+        closes `body` when the client disconnects.
+        """
+        response = StreamResponse(status=status, reason=reason)
+        for name, value in headers:
+            if name.lower() != 'content-length':
+                response.headers.add(name, value)
+        try:
+            yield from response.prepare(request)
+            while True:
+                try:
+                    chunk = yield from body.__anext__()
+                except StopAsyncIteration:
+                    yield from response.write_eof()
+                    break
+                transport = request.transport
+                if transport is None or transport.is_closing():
+                    # the client went away
+                    break
+                if chunk:
+                    yield from response.write(chunk)
+        finally:
+            if hasattr(body, 'aclose'):
+                yield from body.aclose()
+        return response
+
 
 class AsyncGunicornWorker(GunicornWebWorker):
 
+    # Directory for profiles taken when the worker receives SIGUSR2,
+    # profiling is disabled when this is None.
+    profile_directory = None
+    profile_duration = 30
+    profile_interval = 0.005
+
+    # Write the access log in batches from a background thread instead of
+    # from the event loop, extra options are passed to BatchingHandler.
+    batch_access_log = False
+    batch_access_log_options = {}
+
+    _profiler = None
+    _access_log_handler = None
+
+    def init_signals(self):
+        super().init_signals()
+        self.loop.add_signal_handler(
+            signal.SIGUSR2,
+            self.handle_profile,
+            signal.SIGUSR2,
+            None,
+        )
+
+    def handle_profile(self, sig, frame):
+        if self.profile_directory is None:
+            self.log.info('Profiling is disabled, ignoring SIGUSR2.')
+            return
+        if self._profiler is not None and self._profiler.running:
+            self.log.info('Profiler is already running.')
+            return
+        path = os.path.join(
+            self.profile_directory,
+            'aiopyramid-{}-{}.collapsed'.format(self.pid, int(time.time())),
+        )
+        self.log.info(
+            'Profiling worker %s for %s seconds.',
+            self.pid,
+            self.profile_duration,
+        )
+        self._profiler = profile_in_background(
+            self.profile_duration,
+            path,
+            interval=self.profile_interval,
+        )
+
+    def handle_usr1(self, sig, frame):
+        super().handle_usr1(sig, frame)
+        if self._access_log_handler is not None:
+            self._access_log_handler.reopen_files()
+
+    @asyncio.coroutine
+    def close(self):
+        yield from super().close()
+        if self._access_log_handler is not None:
+            self._access_log_handler.flush(self.cfg.graceful_timeout)
+
     def make_handler(self, app):
         aio_app = Application()
         aio_app.router.add_route(
@@ -115,6 +233,15 @@ class AsyncGunicornWorker(GunicornWebWorker):
             ),
         )
         access_log = self.log.access_log if self.cfg.accesslog else None
+        if (
+            access_log is not None
+            and self.batch_access_log
+            and self._access_log_handler is None
+        ):
+            self._access_log_handler = batch_logger(
+                access_log,
+                **self.batch_access_log_options
+            )
         return aio_app.make_handler(
             loop=self.loop,
             logger=self.log,
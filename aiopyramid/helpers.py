@@ -6,6 +6,12 @@ import logging
 import greenlet
 from pyramid.exceptions import ConfigurationError
 
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+from . import tracking
 from .exceptions import ScopeError
 
 SCOPE_ERROR_MESSAGE = '''
@@ -45,13 +51,23 @@ def spawn_greenlet(func, *args, **kwargs):
     """
 
     g = greenlet.greenlet(func)
-    result = g.switch(*args, **kwargs)
-    while True:
-        if isinstance(result, asyncio.Future):
-            result = yield from result
-        else:
-            break
-    return result
+    if contextvars is not None:
+        # new greenlets start with an empty context
+        g.gr_context = contextvars.copy_context()
+    tracker = tracking.tracker
+    if tracker is not None:
+        tracker.track_greenlet(g)
+    try:
+        result = g.switch(*args, **kwargs)
+        while True:
+            if isinstance(result, asyncio.Future):
+                result = yield from result
+            else:
+                break
+        return result
+    finally:
+        if tracker is not None:
+            tracker.release_greenlet(g)
 
 
 @asyncio.coroutine
@@ -64,12 +80,14 @@ def run_in_greenlet(back, future, func, *args, **kwargs):
     """
     try:
         result = yield from func(*args, **kwargs)
+    except asyncio.CancelledError:
+        # not an Exception since Python 3.8
+        future.cancel()
     except Exception as ex:
         future.set_exception(ex)
     else:
         future.set_result(result)
-    finally:
-        return back.switch()
+    return back.switch()
 
 
 def synchronize(*args, strict=True):
@@ -116,6 +134,8 @@ def synchronize(*args, strict=True):
                         **kwargs
                     )
                 )
+                if tracking.tracker is not None:
+                    tracking.tracker.track_task(this, sub_task)
                 while not future.done():
                     this.parent.switch(sub_task)
                 return future.result()
@@ -158,6 +178,18 @@ def spawn_greenlet_on_scope_error(func):
     return _run_or_return_future
 
 
+def bind_context(func):
+    """
+    Binds `func` to a copy of the current :mod:`contextvars` context, so that
+    context variables survive the hop into another thread. Returns `func`
+    unchanged on Pythons without :mod:`contextvars`.
+    """
+
+    if contextvars is None:
+        return func
+    return functools.partial(contextvars.copy_context().run, func)
+
+
 def use_executor(*args, executor=None):
     """
     A decorator for running a callback in the executor.
@@ -174,11 +206,11 @@ def use_executor(*args, executor=None):
             loop = asyncio.get_event_loop()
             r = yield from loop.run_in_executor(
                 executor,
-                functools.partial(
+                bind_context(functools.partial(
                     callback,
                     *args,
                     **kwargs
-                )
+                ))
             )
             return r
         return _wrapped_function
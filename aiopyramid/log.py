@@ -0,0 +1,216 @@
+"""
+Logging that does not block the event loop.
+
+Writing a log record to a file or a pipe from the thread running the event
+loop turns every disk or pipe stall into request latency.
+:class:`BatchingHandler` only appends records to a bounded in-memory buffer
+and hands them to the real handlers in batches from a background thread.
+"""
+
+import collections
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+DROP = 'drop'
+BLOCK = 'block'
+
+
+class BatchingHandler(logging.Handler):
+    """
+    Buffers records and passes them to `targets` in batches from a
+    background thread.
+
+    :param targets: The :class:`logging.Handler` instances that do the
+        actual writing.
+    :param int capacity: Maximum number of records held in memory.
+    :param int batch_size: Number of buffered records that triggers a flush
+        before `flush_interval` has passed.
+    :param float flush_interval: Maximum number of seconds a record waits in
+        the buffer.
+    :param str overflow: What to do with a record when the buffer is full,
+        either ``'drop'`` it and count it in :attr:`dropped`, or ``'block'``
+        until there is room.
+    """
+
+    def __init__(
+        self,
+        *targets,
+        capacity=10000,
+        batch_size=500,
+        flush_interval=0.5,
+        overflow=DROP,
+        level=logging.NOTSET
+    ):
+        super().__init__(level)
+        if overflow not in (DROP, BLOCK):
+            raise ValueError('Unknown overflow policy {}.'.format(overflow))
+        self.targets = list(targets)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self._buffer = collections.deque()
+        self._pending = 0
+        self._closed = False
+        self._pid = None
+        self._thread = None
+        self._condition = threading.Condition()
+        # held while the writer thread of a process starts
+        self._start_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # the handler may be created before gunicorn forks its workers
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                # started by another thread in the meantime
+                return
+            self._condition = threading.Condition()
+            self._buffer = collections.deque()
+            self._pending = 0
+            self._thread = threading.Thread(
+                target=self._run,
+                name='aiopyramid-log',
+                daemon=True,
+            )
+            self._thread.start()
+            self._pid = pid
+
+    def prepare(self, record):
+        """
+        Merges the message arguments and the exception text into `record`
+        so that it does not hold on to objects that may change before the
+        record is written.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info
+                )
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self._closed:
+            return
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        self._ensure_thread()
+        with self._condition:
+            while len(self._buffer) >= self.capacity:
+                if self.overflow == DROP:
+                    self.dropped += 1
+                    return
+                self._condition.wait()
+            self._buffer.append(record)
+            self._pending += 1
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+
+    def _run(self):
+        condition = self._condition
+        while True:
+            with condition:
+                if len(self._buffer) < self.batch_size and not self._closed:
+                    condition.wait(self.flush_interval)
+                batch = self._buffer
+                self._buffer = collections.deque()
+                closed = self._closed
+                # wake producers waiting for room
+                condition.notify_all()
+            if batch:
+                self._write(batch)
+                with condition:
+                    self._pending -= len(batch)
+                    condition.notify_all()
+            if closed:
+                break
+
+    def _write(self, batch):
+        for record in batch:
+            for target in self.targets:
+                if record.levelno >= target.level:
+                    try:
+                        target.handle(record)
+                    except Exception:
+                        target.handleError(record)
+        for target in self.targets:
+            try:
+                target.flush()
+            except Exception:
+                log.exception('Error flushing %r.', target)
+        self.written += len(batch)
+        self.batches += 1
+
+    def flush(self, timeout=None):
+        """ Waits until every buffered record has been written. """
+        if self._thread is None or self._pid != os.getpid():
+            return
+        with self._condition:
+            self._condition.notify_all()
+            self._condition.wait_for(lambda: not self._pending, timeout)
+
+    def reopen_files(self):
+        """ Reopens the files of the target handlers, e.g. after rotation. """
+        for target in self.targets:
+            if isinstance(target, logging.FileHandler):
+                target.acquire()
+                try:
+                    if target.stream:
+                        target.close()
+                        target.stream = target._open()
+                finally:
+                    target.release()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        for target in self.targets:
+            target.close()
+        super().close()
+
+    def stats(self):
+        return {
+            'buffered': len(self._buffer),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+        }
+
+
+def batch_logger(logger, **kwargs):
+    """
+    Moves the handlers of `logger` behind a single :class:`BatchingHandler`
+    and returns it. Keyword arguments are passed to the
+    :class:`BatchingHandler`.
+
+    .. code-block:: python
+
+        # In your app constructor
+        batch_logger(logging.getLogger())
+    """
+
+    if isinstance(logger, str):
+        logger = logging.getLogger(logger)
+    handler = BatchingHandler(*logger.handlers, **kwargs)
+    for target in list(logger.handlers):
+        logger.removeHandler(target)
+    logger.addHandler(handler)
+    return handler
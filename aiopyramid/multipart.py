@@ -0,0 +1,275 @@
+"""
+Streaming reader for ``multipart/form-data`` request bodies.
+
+WebOb parses multipart bodies all at once when :attr:`request.POST
+<webob.request.BaseRequest.POST>` is first accessed, which blocks the event
+loop for the whole upload. :class:`MultipartReader` reads the body in chunks
+in the executor and hands out one part at a time, so file parts can be
+written to disk without holding up other requests:
+
+.. code-block:: python
+
+    @asyncio.coroutine
+    def upload(request):
+        reader = MultipartReader(request, max_part_size=2 ** 30)
+        while True:
+            part = yield from reader.next_part()
+            if part is None:
+                break
+            if part.filename:
+                yield from part.save(os.path.join(UPLOADS, part.filename))
+            else:
+                fields[part.name] = yield from part.text()
+"""
+
+import asyncio
+import cgi
+
+from pyramid.httpexceptions import (
+    HTTPBadRequest,
+    HTTPRequestEntityTooLarge,
+)
+
+CRLF = b'\r\n'
+
+
+class BodyPart:
+    """
+    A single part of a multipart body. Parts must be read in order; asking
+    the reader for the next part skips whatever is left of this one.
+    """
+
+    def __init__(self, reader, headers):
+        self._reader = reader
+        self.headers = headers
+        self.size = 0
+        self.finished = False
+        disposition, params = cgi.parse_header(
+            headers.get('content-disposition', ''),
+        )
+        self.disposition = disposition
+        self.name = params.get('name')
+        self.filename = params.get('filename')
+        self.content_type = headers.get('content-type', 'text/plain')
+
+    @asyncio.coroutine
+    def read_chunk(self):
+        """ Returns the next chunk of the part, ``b''`` at the end. """
+        if self.finished:
+            return b''
+        data, self.finished = yield from self._reader._read_part_data()
+        self.size += len(data)
+        limit = self._reader.max_part_size
+        if limit is not None and self.size > limit:
+            raise HTTPRequestEntityTooLarge(
+                'Part {} is larger than {} bytes.'.format(self.name, limit)
+            )
+        return data
+
+    @asyncio.coroutine
+    def read(self):
+        """ Returns the rest of the part as bytes. """
+        chunks = []
+        while True:
+            chunk = yield from self.read_chunk()
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    @asyncio.coroutine
+    def text(self, encoding='utf-8'):
+        return (yield from self.read()).decode(encoding)
+
+    @asyncio.coroutine
+    def save(self, target):
+        """
+        Writes the rest of the part to `target` in the executor and returns
+        the number of bytes in the part. `target` is a path or a file-like
+        object. A `write` method that returns a :term:`coroutine` is awaited
+        instead.
+        """
+
+        loop = asyncio.get_event_loop()
+        executor = self._reader.executor
+        close = isinstance(target, str)
+        if close:
+            target = yield from loop.run_in_executor(
+                executor,
+                open,
+                target,
+                'wb',
+            )
+        try:
+            while True:
+                chunk = yield from self.read_chunk()
+                if not chunk:
+                    break
+                if asyncio.iscoroutinefunction(target.write):
+                    yield from target.write(chunk)
+                else:
+                    yield from loop.run_in_executor(
+                        executor,
+                        target.write,
+                        chunk,
+                    )
+        finally:
+            if close:
+                yield from loop.run_in_executor(executor, target.close)
+        return self.size
+
+    @asyncio.coroutine
+    def release(self):
+        """ Skips the rest of the part. """
+        while not self.finished:
+            data, self.finished = yield from self._reader._read_part_data()
+
+    def __repr__(self):
+        return '<BodyPart {} {}>'.format(self.name, self.filename)
+
+
+class MultipartReader:
+    """
+    Reads the parts of a ``multipart/form-data`` request one at a time.
+
+    :param request: The request to read.
+    :param int chunk_size: Number of bytes read from the body at a time.
+    :param int max_part_size: Maximum size of a single part in bytes,
+        larger parts raise
+        :class:`~pyramid.httpexceptions.HTTPRequestEntityTooLarge`.
+    :param int max_header_size: Maximum size of the headers of a part.
+    :param executor: Executor used for reading and writing files, `None`
+        for the default executor of the loop.
+    """
+
+    def __init__(
+        self,
+        request,
+        chunk_size=65536,
+        max_part_size=None,
+        max_header_size=16384,
+        executor=None,
+    ):
+        content_type, params = cgi.parse_header(
+            request.headers.get('Content-Type', ''),
+        )
+        boundary = params.get('boundary')
+        if not content_type.startswith('multipart/') or not boundary:
+            raise HTTPBadRequest('Expected a multipart body.')
+        self.request = request
+        self.chunk_size = chunk_size
+        self.max_part_size = max_part_size
+        self.max_header_size = max_header_size
+        self.executor = executor
+        self._body = request.body_file
+        self._delimiter = b'--' + boundary.encode('latin-1')
+        self._buffer = bytearray()
+        self._eof = False
+        self._started = False
+        self._done = False
+        self._part = None
+
+    @asyncio.coroutine
+    def _fill(self):
+        if self._eof:
+            raise HTTPBadRequest('Unexpected end of multipart body.')
+        data = yield from asyncio.get_event_loop().run_in_executor(
+            self.executor,
+            self._body.read,
+            self.chunk_size,
+        )
+        if not data:
+            self._eof = True
+        self._buffer.extend(data)
+
+    @asyncio.coroutine
+    def _read_until(self, marker, limit):
+        while True:
+            index = self._buffer.find(marker)
+            if index >= 0:
+                data = bytes(self._buffer[:index])
+                del self._buffer[:index + len(marker)]
+                return data
+            if len(self._buffer) > limit:
+                raise HTTPBadRequest('Malformed multipart body.')
+            yield from self._fill()
+
+    @asyncio.coroutine
+    def _read_part_data(self):
+        """
+        Returns the next chunk of the current part and whether the part is
+        finished.
+        """
+
+        marker = CRLF + self._delimiter
+        while True:
+            index = self._buffer.find(marker)
+            if index >= 0:
+                data = bytes(self._buffer[:index])
+                del self._buffer[:index + len(marker)]
+                yield from self._read_delimiter_end()
+                return data, True
+            # keep enough bytes to recognize a delimiter split across reads
+            keep = len(marker) - 1
+            if len(self._buffer) > keep:
+                end = len(self._buffer) - keep
+                data = bytes(self._buffer[:end])
+                del self._buffer[:end]
+                return data, False
+            yield from self._fill()
+
+    @asyncio.coroutine
+    def _read_delimiter_end(self):
+        while len(self._buffer) < 2:
+            yield from self._fill()
+        if self._buffer[:2] == b'--':
+            self._done = True
+            del self._buffer[:]
+        else:
+            # ignore transport padding after the delimiter
+            yield from self._read_until(CRLF, self.max_header_size)
+
+    @asyncio.coroutine
+    def _read_headers(self):
+        raw = yield from self._read_until(
+            CRLF + CRLF,
+            self.max_header_size,
+        )
+        headers = {}
+        for line in raw.decode('utf-8', 'replace').split('\r\n'):
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise HTTPBadRequest('Malformed multipart header.')
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    @asyncio.coroutine
+    def next_part(self):
+        """ Returns the next :class:`BodyPart`, or `None` at the end. """
+        if self._part is not None:
+            yield from self._part.release()
+            self._part = None
+        if not self._started:
+            self._started = True
+            # skip the preamble
+            yield from self._read_until(
+                self._delimiter,
+                self.max_header_size,
+            )
+            yield from self._read_delimiter_end()
+        if self._done:
+            return None
+        headers = yield from self._read_headers()
+        self._part = BodyPart(self, headers)
+        return self._part
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        part = yield from self.next_part()
+        if part is None:
+            raise StopAsyncIteration
+        return part
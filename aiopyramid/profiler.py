@@ -0,0 +1,176 @@
+"""
+A sampling profiler that understands the ``Aiopyramid`` architecture.
+
+Ordinary profilers see a request as two unrelated stacks: the
+:term:`greenlet` running framework code, which is suspended inside a
+:term:`synchronized coroutine`, and the event loop running the
+:term:`coroutine` through :func:`~aiopyramid.helpers.run_in_greenlet`.
+:class:`SamplingProfiler` splices the suspended greenlet's stack in place of
+the event loop machinery so that each sample is one logical trace for the
+request, and writes the result in the collapsed-stack format used by
+flamegraph tools.
+"""
+
+import collections
+import logging
+import os
+import sys
+import threading
+
+from . import helpers
+
+log = logging.getLogger(__name__)
+
+_RUN_IN_GREENLET = getattr(
+    helpers.run_in_greenlet,
+    '__wrapped__',
+    helpers.run_in_greenlet,
+).__code__
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread, by default the thread that creates the
+    profiler, from a background thread every `interval` seconds.
+
+    Sampling is opt-in and only costs anything while the profiler is
+    running, so it is safe to attach to a production worker for a short
+    time. See :func:`profile_in_background`.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        if thread_id is None:
+            thread_id = threading.get_ident()
+        self.thread_id = thread_id
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            raise RuntimeError('Profiler is already running.')
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='aiopyramid-profiler',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """ Records the current logical stack of the profiled thread. """
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = tuple(self._label(code) for code in _logical_stack(frame))
+        self.stacks[stack] += 1
+        self.samples += 1
+
+    def _label(self, code):
+        try:
+            return self._labels[code]
+        except KeyError:
+            label = self._labels[code] = '{} ({}:{})'.format(
+                code.co_name,
+                _short_filename(code.co_filename),
+                code.co_firstlineno,
+            )
+            return label
+
+    def collapsed(self):
+        """ Yields the samples as lines in collapsed-stack format. """
+        for stack, count in self.stacks.most_common():
+            yield '{} {}\n'.format(';'.join(stack), count)
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as output:
+            output.writelines(self.collapsed())
+
+
+def _frames(frame):
+    """ Returns the frames from `frame` to the root of its stack. """
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _logical_stack(frame):
+    """
+    Returns the code objects of the logical stack ending in `frame`,
+    outermost first.
+
+    If the stack is running a :term:`coroutine` for a request
+    :term:`greenlet`, the frames of the event loop below
+    :func:`~aiopyramid.helpers.run_in_greenlet` are replaced with the stack
+    of the greenlet that is waiting for the coroutine.
+    """
+    frames = _frames(frame)
+    for index in range(len(frames) - 1, -1, -1):
+        if frames[index].f_code is _RUN_IN_GREENLET:
+            back = frames[index].f_locals.get('back')
+            waiting = getattr(back, 'gr_frame', None)
+            if waiting is not None:
+                frames = _frames(waiting) + frames[index:]
+            break
+    return [f.f_code for f in frames]
+
+
+def _short_filename(filename):
+    """ Strips the longest matching `sys.path` entry from `filename`. """
+    best = ''
+    for entry in sys.path:
+        if entry and filename.startswith(entry) and len(entry) > len(best):
+            best = entry
+    return filename[len(best):].lstrip(os.sep) or filename
+
+
+def profile_in_background(duration, path, interval=0.005, thread_id=None):
+    """
+    Profiles the current thread for `duration` seconds and writes the
+    collapsed stacks to `path`. Returns immediately with the running
+    :class:`SamplingProfiler`.
+    """
+
+    profiler = SamplingProfiler(interval=interval, thread_id=thread_id)
+
+    def _finish():
+        profiler._stopped.wait(duration)
+        profiler.stop()
+        try:
+            profiler.write_collapsed(path)
+        except OSError:
+            log.exception('Unable to write profile to %s.', path)
+        else:
+            log.info(
+                'Wrote %s samples to %s.',
+                profiler.samples,
+                path,
+            )
+
+    profiler.start()
+    threading.Thread(
+        target=_finish,
+        name='aiopyramid-profiler-timer',
+        daemon=True,
+    ).start()
+    return profiler
@@ -0,0 +1,136 @@
+"""
+Renderer wrappers that keep expensive rendering off the event loop.
+
+:ref:`Pyramid <pyramid:index>` renders the value returned by a
+:term:`view callable` in the request :term:`greenlet`, which runs on the
+thread of the event loop. Rendering a large template or encoding a large
+JSON document there stalls every other request in the worker.
+:class:`OffloadingRendererFactory` wraps a renderer factory so that large
+values, or renderers that have been slow, render in the executor instead.
+
+Renderers wrapped this way may also return a :term:`coroutine` or a future,
+e.g. from a template engine with asynchronous rendering, which is awaited.
+"""
+
+import asyncio
+import functools
+import time
+
+import greenlet
+
+from .helpers import bind_context, synchronize
+
+
+@synchronize
+@asyncio.coroutine
+def _wait(awaitable):
+    return (yield from awaitable)
+
+
+@synchronize
+@asyncio.coroutine
+def _run_in_executor(executor, func, *args):
+    return (yield from asyncio.get_event_loop().run_in_executor(
+        executor,
+        bind_context(functools.partial(func, *args)),
+    ))
+
+
+class OffloadingRenderer:
+    """
+    Renders values with `renderer` in the request greenlet or, when
+    :meth:`should_offload` says so, in the executor.
+    """
+
+    def __init__(
+        self,
+        renderer,
+        min_items=1000,
+        min_duration=0.002,
+        alpha=0.2,
+        executor=None,
+    ):
+        self.renderer = renderer
+        self.min_items = min_items
+        self.min_duration = min_duration
+        self.alpha = alpha
+        self.executor = executor
+        # moving average of the time spent rendering, in seconds
+        self.average = 0.0
+        self.offloaded = 0
+
+    def should_offload(self, value):
+        if self.min_duration is not None and self.average >= self.min_duration:
+            return True
+        if self.min_items is None:
+            return False
+        try:
+            return len(value) >= self.min_items
+        except TypeError:
+            return False
+
+    def _render(self, value, system):
+        start = time.perf_counter()
+        result = self.renderer(value, system)
+        duration = time.perf_counter() - start
+        self.average += self.alpha * (duration - self.average)
+        return result
+
+    def __call__(self, value, system):
+        if greenlet.getcurrent().parent is None:
+            # called from a coroutine, there is no greenlet to wait in
+            return self._render(value, system)
+        if self.should_offload(value):
+            self.offloaded += 1
+            result = _run_in_executor(
+                self.executor,
+                self._render,
+                value,
+                system,
+            )
+        else:
+            result = self._render(value, system)
+        if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+            result = _wait(result)
+        return result
+
+
+class OffloadingRendererFactory:
+    """
+    Wraps a :term:`renderer factory` so that its renderers run in the
+    executor for values with at least `min_items` items, or once their
+    average render time reaches `min_duration` seconds. Either threshold is
+    disabled by passing `None`.
+
+    .. code-block:: python
+
+        from pyramid.renderers import JSON
+
+        config.add_renderer('json', OffloadingRendererFactory(JSON()))
+
+    Register the wrapped factory under another name to offload rendering
+    only for the views that use that name.
+    """
+
+    def __init__(
+        self,
+        factory,
+        min_items=1000,
+        min_duration=0.002,
+        alpha=0.2,
+        executor=None,
+    ):
+        self.factory = factory
+        self.min_items = min_items
+        self.min_duration = min_duration
+        self.alpha = alpha
+        self.executor = executor
+
+    def __call__(self, info):
+        return OffloadingRenderer(
+            self.factory(info),
+            min_items=self.min_items,
+            min_duration=self.min_duration,
+            alpha=self.alpha,
+            executor=self.executor,
+        )
@@ -0,0 +1,65 @@
+"""
+Request methods for reading the body of a request from a :term:`coroutine`.
+
+``Aiopyramid`` does not parse the body before running a view. Coroutine
+views that need it use these methods, which parse large bodies in the
+executor instead of on the event loop. They are added to the request by
+``config.include('aiopyramid')``:
+
+.. code-block:: python
+
+    @asyncio.coroutine
+    def my_view(request):
+        params = yield from request.aio_params()
+        data = yield from request.aio_json()
+"""
+
+import asyncio
+
+from .helpers import bind_context
+
+# Bodies larger than this many bytes, or of unknown length, are parsed in
+# the executor.
+EXECUTOR_THRESHOLD = 65536
+
+JSON_KEY = 'aiopyramid.json_body'
+
+
+@asyncio.coroutine
+def _parse(request, func, threshold):
+    length = request.content_length
+    if length is None or length > threshold:
+        loop = asyncio.get_event_loop()
+        return (yield from loop.run_in_executor(None, bind_context(func)))
+    return func()
+
+
+@asyncio.coroutine
+def aio_params(request, threshold=EXECUTOR_THRESHOLD):
+    """
+    A :term:`coroutine` returning :attr:`request.params
+    <webob.request.BaseRequest.params>` with the body parsed in the
+    executor when it is larger than `threshold` bytes.
+    """
+
+    if request.is_body_readable:
+        yield from _parse(request, lambda: request.POST, threshold)
+    return request.params
+
+
+@asyncio.coroutine
+def aio_json(request, threshold=EXECUTOR_THRESHOLD):
+    """
+    A :term:`coroutine` returning :attr:`request.json_body
+    <pyramid.request.Request.json_body>` decoded in the executor when the
+    body is larger than `threshold` bytes. The result is kept for the rest
+    of the request.
+    """
+
+    try:
+        return request.environ[JSON_KEY]
+    except KeyError:
+        pass
+    value = yield from _parse(request, lambda: request.json_body, threshold)
+    request.environ[JSON_KEY] = value
+    return value
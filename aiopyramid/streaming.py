@@ -0,0 +1,351 @@
+"""
+Streaming response bodies produced by asynchronous iterators.
+
+A :term:`coroutine` view can return a response whose `app_iter` is an
+:class:`AsyncAppIter`, or use one of the streaming renderers, to send a body
+chunk by chunk as it is produced instead of building it in memory first.
+The `gunicorn`_ worker writes each chunk to the client as soon as it is
+available. Other servers iterate the body synchronously, waiting on each
+chunk from the request :term:`greenlet`.
+
+.. code-block:: python
+
+    # In the app constructor
+    config.add_renderer('jsonstream', JSONStream())
+
+    ...
+
+    @view_config(route_name='rows', renderer='jsonstream')
+    @asyncio.coroutine
+    def rows(request):
+        cursor = yield from db.execute('SELECT * FROM big_table')
+        return cursor  # any asynchronous iterable of rows
+
+.. _gunicorn: http://gunicorn.org/
+"""
+
+import asyncio
+import json
+
+import greenlet
+from pyramid.response import Response
+
+from .helpers import synchronize
+
+
+def _aiter(iterable):
+    """ Returns an asynchronous iterator over `iterable`. """
+    if hasattr(iterable, '__aiter__'):
+        return iterable.__aiter__()
+    return _SyncIterator(iter(iterable))
+
+
+class _SyncIterator:
+    """ Asynchronous iterator over a regular iterator. """
+
+    def __init__(self, iterator):
+        self._iterator = iterator
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+@synchronize
+@asyncio.coroutine
+def _next(iterator):
+    return (yield from iterator.__anext__())
+
+
+@synchronize
+@asyncio.coroutine
+def _close(app_iter):
+    yield from app_iter.aclose()
+
+
+class AsyncAppIter:
+    """
+    `app_iter` over an asynchronous iterable of bytes or strings.
+
+    The worker reads it asynchronously. Iterating it like a regular
+    `app_iter` waits on every chunk through a :term:`synchronized coroutine`,
+    so that must happen in a child :term:`greenlet`.
+    """
+
+    def __init__(self, iterable, encoding='utf-8'):
+        self._iterator = _aiter(iterable)
+        self.encoding = encoding
+        self.closed = False
+
+    def _encode(self, chunk):
+        if isinstance(chunk, str):
+            return chunk.encode(self.encoding)
+        return chunk
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        return self._encode((yield from self._iterator.__anext__()))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self._encode(_next(self._iterator))
+        except StopAsyncIteration:
+            raise StopIteration
+
+    @asyncio.coroutine
+    def aclose(self):
+        """ Closes the underlying iterator, e.g. an async generator. """
+        if self.closed:
+            return
+        self.closed = True
+        aclose = getattr(self._iterator, 'aclose', None)
+        if aclose is not None:
+            yield from aclose()
+
+    def close(self):
+        if self.closed:
+            return
+        if greenlet.getcurrent().parent is None:
+            asyncio.ensure_future(self.aclose())
+        else:
+            _close(self)
+
+
+class StreamingResponse(Response):
+    """
+    :class:`~pyramid.response.Response` that streams the chunks of an
+    asynchronous iterable.
+    """
+
+    def __init__(self, iterable, **kw):
+        super().__init__(app_iter=AsyncAppIter(iterable), **kw)
+
+
+class _Serializing:
+    """
+    Asynchronous iterator that serializes items from `source` and joins
+    them into chunks of about `chunk_size` bytes.
+    """
+
+    def __init__(self, source, dumps, start, separator, end, chunk_size):
+        self._source = _aiter(source)
+        self._dumps = dumps
+        self._start = start
+        self._separator = separator
+        self._end = end
+        self._chunk_size = chunk_size
+        self._first = True
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        chunk = []
+        size = 0
+        if self._first and self._start:
+            chunk.append(self._start)
+        while size < self._chunk_size:
+            try:
+                item = yield from self._source.__anext__()
+            except StopAsyncIteration:
+                self._done = True
+                chunk.append(self._end)
+                break
+            if not self._first:
+                chunk.append(self._separator)
+            self._first = False
+            data = self._dumps(item)
+            chunk.append(data)
+            size += len(data)
+        return ''.join(chunk)
+
+    @asyncio.coroutine
+    def aclose(self):
+        aclose = getattr(self._source, 'aclose', None)
+        if aclose is not None:
+            yield from aclose()
+
+
+class _StreamRenderer:
+    """ Base for renderer factories of streamed JSON. """
+
+    content_type = 'application/json'
+    start = ''
+    separator = ''
+    end = ''
+
+    def __init__(self, serializer=json.dumps, chunk_size=16384, **kw):
+        self.serializer = serializer
+        self.chunk_size = chunk_size
+        self.kw = kw
+
+    def _dumps(self, item):
+        return self.serializer(item, **self.kw)
+
+    def __call__(self, info):
+        def _render(value, system):
+            request = system.get('request')
+            if request is not None:
+                response = request.response
+                if response.content_type == response.default_content_type:
+                    response.content_type = self.content_type
+            return AsyncAppIter(_Serializing(
+                value,
+                self._dumps,
+                self.start,
+                self.separator,
+                self.end,
+                self.chunk_size,
+            ))
+        return _render
+
+
+class JSONStream(_StreamRenderer):
+    """
+    Renderer factory that streams an iterable or asynchronous iterable as a
+    JSON array. Extra keyword arguments are passed to the `serializer`.
+
+    :param int chunk_size: Approximate number of bytes sent at a time.
+    """
+
+    start = '['
+    separator = ','
+    end = ']'
+
+
+class NDJSONStream(_StreamRenderer):
+    """
+    Renderer factory that streams an iterable or asynchronous iterable as
+    newline delimited JSON, one document per item.
+    """
+
+    content_type = 'application/x-ndjson'
+
+    def _dumps(self, item):
+        return super()._dumps(item) + '\n'
+
+
+class Event:
+    """
+    A Server-Sent Event. `data` that is not a string is encoded as JSON.
+    """
+
+    __slots__ = ('data', 'event', 'id', 'retry')
+
+    def __init__(self, data='', event=None, id=None, retry=None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+    def encode(self):
+        lines = []
+        if self.event is not None:
+            lines.append('event: {}'.format(self.event))
+        if self.id is not None:
+            lines.append('id: {}'.format(self.id))
+        if self.retry is not None:
+            lines.append('retry: {:d}'.format(self.retry))
+        data = self.data
+        if not isinstance(data, str):
+            data = json.dumps(data)
+        lines.extend('data: ' + line for line in data.split('\n'))
+        return '\n'.join(lines) + '\n\n'
+
+
+class _EventStream:
+    """
+    Asynchronous iterator that encodes the items of `source` as events and
+    produces a comment whenever `source` has been quiet for `heartbeat`
+    seconds.
+    """
+
+    def __init__(self, source, heartbeat, retry):
+        self._source = _aiter(source)
+        self._heartbeat = heartbeat
+        self._retry = retry
+        self._pending = None
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        if self._retry is not None:
+            retry, self._retry = self._retry, None
+            return 'retry: {:d}\n\n'.format(retry)
+        if not self._heartbeat:
+            item = yield from self._source.__anext__()
+        else:
+            if self._pending is None:
+                self._pending = asyncio.ensure_future(
+                    self._source.__anext__(),
+                )
+            done, _ = yield from asyncio.wait(
+                [self._pending],
+                timeout=self._heartbeat,
+            )
+            if not done:
+                # keeps proxies from closing the connection and lets the
+                # worker notice clients that went away
+                return ':\n\n'
+            pending, self._pending = self._pending, None
+            item = pending.result()
+        if isinstance(item, Event):
+            return item.encode()
+        return Event(item).encode()
+
+    @asyncio.coroutine
+    def aclose(self):
+        pending, self._pending = self._pending, None
+        if pending is not None and not pending.done():
+            pending.cancel()
+            yield from asyncio.wait([pending])
+        aclose = getattr(self._source, 'aclose', None)
+        if aclose is not None:
+            yield from aclose()
+
+
+class EventStreamResponse(Response):
+    """
+    :class:`~pyramid.response.Response` that sends the items of an
+    asynchronous iterable as `Server-Sent Events`_.
+
+    Items are :class:`Event` objects or the data of an event, which is
+    encoded as JSON unless it is a string.
+
+    :param float heartbeat: Seconds of silence after which a comment is sent
+        to keep the connection open, `None` to disable heartbeats.
+    :param int retry: Reconnection time in milliseconds sent to the client
+        before the first event.
+
+    .. _Server-Sent Events:
+        https://html.spec.whatwg.org/multipage/server-sent-events.html
+    """
+
+    def __init__(self, iterable, heartbeat=15.0, retry=None, **kw):
+        kw.setdefault('content_type', 'text/event-stream')
+        kw.setdefault('charset', 'utf-8')
+        super().__init__(
+            app_iter=AsyncAppIter(_EventStream(iterable, heartbeat, retry)),
+            **kw
+        )
+        self.cache_control = 'no-cache'
+        # tell nginx not to buffer the stream
+        self.headers['X-Accel-Buffering'] = 'no'
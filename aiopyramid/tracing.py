@@ -0,0 +1,234 @@
+"""
+Lightweight tracing spans that follow a request across the bridges that
+``Aiopyramid`` owns.
+
+The current request id and span are kept in :mod:`contextvars`, which
+``Aiopyramid`` carries from the event loop into the request
+:term:`greenlet` spawned by :func:`~aiopyramid.helpers.spawn_greenlet`, from
+the greenlet into the task that runs a :term:`synchronized coroutine`, and
+into the threads used by :func:`~aiopyramid.helpers.use_executor` and
+executor views. Spans opened anywhere along the way nest under the span of
+the request. Requires Python 3.7 or later.
+
+Include this module to open a span for every request:
+
+.. code-block:: python
+
+    config.include('aiopyramid.tracing')
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
+import random
+import time
+import uuid
+
+log = logging.getLogger(__name__)
+
+request_id = contextvars.ContextVar('aiopyramid.request_id', default=None)
+current_span = contextvars.ContextVar('aiopyramid.span', default=None)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+_exporter = None
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """
+    A timed operation. Times are measured with :func:`time.perf_counter`.
+    """
+
+    __slots__ = (
+        'name', 'trace_id', 'span_id', 'parent_id', 'request_id',
+        'timestamp', 'start', 'end', 'tags', '_token',
+    )
+
+    def __init__(self, name, parent=None, tags=None):
+        self.name = name
+        self.span_id = next(_span_ids)
+        if parent is None:
+            self.trace_id = random.getrandbits(64)
+            self.parent_id = None
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self.request_id = request_id.get()
+        self.tags = tags or {}
+        self.timestamp = time.time()
+        self.end = None
+        self._token = None
+        self.start = time.perf_counter()
+
+    @property
+    def duration(self):
+        """ Duration in seconds, `None` while the span is open. """
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    @property
+    def duration_us(self):
+        """ Duration in microseconds, `None` while the span is open. """
+        if self.end is None:
+            return None
+        return int(round((self.end - self.start) * 1000000))
+
+    def finish(self):
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        if self._token is not None:
+            current_span.reset(self._token)
+            self._token = None
+        exporter = _exporter
+        if exporter is not None:
+            try:
+                exporter.export(self)
+            except Exception:
+                log.exception('Error exporting %r.', self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.tags.setdefault('error', exc_type.__name__)
+        self.finish()
+
+    def __repr__(self):
+        return '<Span {} {} {}us>'.format(
+            self.name,
+            self.span_id,
+            self.duration_us,
+        )
+
+
+def span(name, **tags):
+    """
+    Opens a :class:`Span` as a child of the current span and makes it the
+    current span until it is finished. Use it as a context manager in
+    regular functions and :term:`coroutines <coroutine>` alike:
+
+    .. code-block:: python
+
+        with span('db.query', table='users'):
+            rows = yield from query()
+    """
+
+    new = Span(name, parent=current_span.get(), tags=tags)
+    new._token = current_span.set(new)
+    return new
+
+
+def traced(*args, name=None):
+    """
+    Decorator that runs a function or :term:`coroutine` inside a
+    :func:`span` named after it.
+    """
+
+    def _wrapper(func):
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            @asyncio.coroutine
+            def _traced_coroutine(*args, **kwargs):
+                with span(span_name):
+                    return (yield from func(*args, **kwargs))
+            return _traced_coroutine
+
+        @functools.wraps(func)
+        def _traced(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return _traced
+
+    try:
+        return _wrapper(args[0])
+    except IndexError:
+        return _wrapper
+
+
+def set_exporter(exporter):
+    """
+    Sets the object whose ``export(span)`` method receives every finished
+    :class:`Span`, or `None` to stop exporting.
+    """
+    global _exporter
+    _exporter = exporter
+
+
+class InMemoryExporter:
+    """ Collects finished spans in memory, e.g. for tests. """
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, finished):
+        self.spans.append(finished)
+
+    def named(self, name):
+        return [s for s in self.spans if s.name == name]
+
+    def clear(self):
+        del self.spans[:]
+
+
+class LoggingExporter:
+    """
+    Writes finished spans to a logger. Pair it with
+    :class:`~aiopyramid.log.BatchingHandler` to keep the writes off the
+    event loop.
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or log
+        self.level = level
+
+    def export(self, finished):
+        self.logger.log(
+            self.level,
+            'span=%s trace=%x id=%s parent=%s request=%s duration_us=%s %s',
+            finished.name,
+            finished.trace_id,
+            finished.span_id,
+            finished.parent_id,
+            finished.request_id,
+            finished.duration_us,
+            ' '.join(
+                '{}={}'.format(k, v) for k, v in sorted(finished.tags.items())
+            ),
+        )
+
+
+def tracing_tween_factory(handler, registry):
+    """
+    :term:`tween` that sets :data:`request_id` from the ``X-Request-ID``
+    header, or a new id, and opens a ``request`` span around the request.
+    """
+
+    def tracing_tween(request):
+        rid = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        token = request_id.set(rid)
+        try:
+            with span(
+                'request',
+                method=request.method,
+                path=request.path,
+            ) as request_span:
+                response = handler(request)
+                request_span.tags['status'] = response.status_code
+                response.headers.setdefault(REQUEST_ID_HEADER, rid)
+                return response
+        finally:
+            request_id.reset(token)
+
+    return tracing_tween
+
+
+def includeme(config):
+    config.add_tween('aiopyramid.tracing.tracing_tween_factory')
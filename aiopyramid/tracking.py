@@ -0,0 +1,213 @@
+"""
+Tracking for the tasks and greenlets that bridge a request between
+:term:`greenlets <greenlet>` and the :mod:`asyncio` event loop.
+
+When a request greenlet is abandoned, e.g. because the client disconnected
+or a :term:`tween` raised, the task created by
+:func:`~aiopyramid.helpers.synchronize` and the greenlet it will switch back
+into can stay alive and pin memory. :class:`BridgeTracker` registers every
+such bridge with the request that owns it and flags the ones that outlive
+their request.
+
+Tracking is disabled by default. Enable it with :func:`enable` or by
+including this module in the app constructor:
+
+.. code-block:: python
+
+    config.include('aiopyramid.tracking')
+
+The ``aiopyramid.tracking.collect`` setting controls whether leaked bridges
+are cancelled and collected or only reported.
+"""
+
+import asyncio
+import logging
+import weakref
+
+import greenlet
+from pyramid.settings import asbool
+
+log = logging.getLogger(__name__)
+
+tracker = None
+
+try:
+    _current_task = asyncio.current_task
+except AttributeError:
+    # before Python 3.7
+    _current_task = asyncio.Task.current_task
+
+
+def _alive(bridge):
+    if isinstance(bridge, greenlet.greenlet):
+        return not bridge.dead
+    return not bridge.done()
+
+
+class BridgeTracker:
+    """
+    Registers bridge tasks and greenlets with the request greenlet that owns
+    them and flags the bridges that are still alive when the request is
+    finished.
+
+    :param bool collect: Cancel leaked tasks and kill leaked greenlets
+        instead of only reporting them.
+    """
+
+    def __init__(self, collect=False):
+        self.collect = collect
+        self.leaked_tasks = 0
+        self.leaked_greenlets = 0
+        self.collected = 0
+        self._owners = weakref.WeakKeyDictionary()
+        self._bridges = weakref.WeakKeyDictionary()
+        self._requests = weakref.WeakKeyDictionary()
+        self._orphans = weakref.WeakKeyDictionary()
+
+    def owner(self, bridge):
+        """ Returns the request greenlet that owns `bridge`. """
+        return self._owners.get(bridge)
+
+    def track_request(self, g, description=None):
+        if g not in self._bridges:
+            self._bridges[g] = weakref.WeakSet()
+        if description is not None:
+            self._requests[g] = description
+
+    def track_greenlet(self, g):
+        """
+        Registers a greenlet spawned by
+        :func:`~aiopyramid.helpers.spawn_greenlet`. A greenlet spawned
+        from a bridge task belongs to the request that owns the task,
+        otherwise it is a new request.
+        """
+        task = _current_task()
+        owner = self._owners.get(task) if task is not None else None
+        if owner is None:
+            self.track_request(g)
+        else:
+            self._add(owner, g)
+
+    def track_task(self, g, task):
+        """ Registers a task created on behalf of greenlet `g`. """
+        owner = self._owners.get(g, g)
+        self.track_request(owner)
+        self._add(owner, task)
+
+    def _add(self, owner, bridge):
+        self._owners[bridge] = owner
+        self._bridges[owner].add(bridge)
+
+    def release_greenlet(self, g):
+        """
+        Called when :func:`~aiopyramid.helpers.spawn_greenlet` stops
+        driving `g`. A request greenlet that is not dead at this point has
+        been abandoned.
+        """
+        if g in self._bridges:
+            self.finish_request(g, abandoned=not g.dead)
+
+    def finish_request(self, g, abandoned=False):
+        """ Flags the bridges of request `g` that are still alive. """
+        bridges = self._bridges.pop(g, None)
+        description = self._requests.pop(g, None) or repr(g)
+        if bridges is None:
+            return
+        leaked = [bridge for bridge in bridges if _alive(bridge)]
+        if abandoned:
+            leaked.append(g)
+        for bridge in leaked:
+            if isinstance(bridge, greenlet.greenlet):
+                self.leaked_greenlets += 1
+            else:
+                self.leaked_tasks += 1
+            log.warning('%r outlived request %s.', bridge, description)
+            if self.collect:
+                self._collect(bridge)
+            else:
+                self._orphans[bridge] = description
+
+    def _collect(self, bridge):
+        if isinstance(bridge, greenlet.greenlet):
+            # greenlets must be killed from the event loop so that
+            # control returns here once they are dead
+            asyncio.get_event_loop().call_soon(self._kill, bridge)
+        else:
+            bridge.cancel()
+            self.collected += 1
+
+    def _kill(self, g):
+        if g.dead:
+            self.collected += 1
+            return
+        try:
+            g.throw()
+        except Exception:
+            log.exception('Error collecting %r.', g)
+        if g.dead:
+            self.collected += 1
+        else:
+            log.warning('Unable to collect %r.', g)
+
+    def report(self):
+        """
+        Returns a list of ``(bridge, request)`` pairs for the bridges that
+        outlived their request and are still alive.
+        """
+        return [
+            (bridge, description)
+            for bridge, description in list(self._orphans.items())
+            if _alive(bridge)
+        ]
+
+    def stats(self):
+        return {
+            'requests': len(self._bridges),
+            'leaked_tasks': self.leaked_tasks,
+            'leaked_greenlets': self.leaked_greenlets,
+            'collected': self.collected,
+            'orphans': len(self.report()),
+        }
+
+
+def enable(collect=False):
+    """ Starts tracking bridges, returns the :class:`BridgeTracker`. """
+    global tracker
+    tracker = BridgeTracker(collect=collect)
+    return tracker
+
+
+def disable():
+    global tracker
+    tracker = None
+
+
+def bridge_tracking_tween_factory(handler, registry):
+    """
+    :term:`tween` that registers the current request with the tracker so
+    that leaks are reported with the request they belong to. This also
+    covers servers such as `uWSGI` that spawn request greenlets without
+    :func:`~aiopyramid.helpers.spawn_greenlet`.
+    """
+
+    def bridge_tracking_tween(request):
+        current = tracker
+        if current is None:
+            return handler(request)
+        this = greenlet.getcurrent()
+        current.track_request(
+            this,
+            '{} {}'.format(request.method, request.path_qs),
+        )
+        try:
+            return handler(request)
+        finally:
+            current.finish_request(this)
+
+    return bridge_tracking_tween
+
+
+def includeme(config):
+    settings = config.get_settings()
+    enable(collect=asbool(settings.get('aiopyramid.tracking.collect')))
+    config.add_tween('aiopyramid.tracking.bridge_tracking_tween_factory')
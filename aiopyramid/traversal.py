@@ -1,25 +1,135 @@
 """
-The aiopyramid.traversal module is deprecated, use aiopyramid.helpers.synchronize instead.
-See http://aiopyramid.readthedocs.io/features.html#traversal.
-"""  # NOQA
+Traversal for resource trees whose `__getitem__` is a :term:`coroutine`.
+
+:class:`AsyncioTraverser` can optionally keep the resource chains it resolves
+in a :class:`TraversalCache`, so that warm paths skip `__getitem__`
+altogether and new paths only fetch the segments past their longest warm
+prefix.
+"""
 
 import asyncio
-import warnings
+import weakref
 
 from pyramid.traversal import (
     ResourceTreeTraverser as TraverserBase,
     is_nonstr_iter,
+    resource_path_tuple,
     split_path_info,
 )
 from pyramid.exceptions import URLDecodeError
 from pyramid.interfaces import VH_ROOT_KEY
 from pyramid.compat import decode_path_info
 
+from .cache import LRUCache
 from .helpers import synchronize
 
 SLASH = "/"
 
-warnings.warn(__doc__, DeprecationWarning)
+_caches = weakref.WeakSet()
+
+
+class TraversalCache:
+    """
+    Cache of resolved resource chains keyed by the root and the virtual
+    path that led to them.
+
+    Roots are identified by their ``__cache_key__`` attribute, or by what
+    the `root_key` callable returns for them. Paths below roots without a
+    key are not cached, since an app may build a new root per request or
+    per tenant.
+
+    Every prefix of a traversed path is stored, so a request for
+    ``/a/b/c/d`` only awaits `__getitem__` for ``d`` once ``/a/b/c`` is
+    cached. Cached resources are shared between requests, so they should not
+    hold request-specific state, and roots with the same key should be the
+    same object that their cached resources point to with `__parent__`.
+
+    :param int maxsize: Maximum number of cached paths.
+    :param float ttl: Seconds a cached path stays valid, `None` for no
+        expiry.
+    :param root_key: Called with the root, returns the key of the resources
+        below it, or `None` to not cache them.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, root_key=None):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        if root_key is not None:
+            self.root_key = root_key
+        _caches.add(self)
+
+    def root_key(self, root):
+        return getattr(root, '__cache_key__', None)
+
+    def lookup(self, root, vpath_tuple):
+        """
+        Returns the resources for the longest cached prefix of
+        `vpath_tuple`, not including `root`.
+        """
+        root_key = self.root_key(root)
+        if root_key is None:
+            return ()
+        for length in range(len(vpath_tuple), 0, -1):
+            chain = self.entries.get((root_key, vpath_tuple[:length]))
+            if chain is not None:
+                self.hits += 1
+                return chain
+        self.misses += 1
+        return ()
+
+    def store(self, root, vpath_tuple, chain, start=0):
+        """
+        Stores every prefix of `vpath_tuple` longer than `start` segments.
+        `chain` holds the resource found for each segment.
+        """
+        root_key = self.root_key(root)
+        if root_key is None:
+            return
+        chain = tuple(chain)
+        for length in range(start + 1, len(vpath_tuple) + 1):
+            self.entries.set(
+                (root_key, tuple(vpath_tuple[:length])),
+                chain[:length],
+            )
+
+    def invalidate(self, path=None):
+        """
+        Drops `path` and everything below it. `path` is a string or a tuple
+        of segments, `None` drops everything.
+        """
+        if path is None:
+            self.entries.clear()
+            return
+        if isinstance(path, str):
+            path = split_path_info(path)
+        path = tuple(path)
+        size = len(path)
+        self.entries.discard_if(lambda key: key[1][:size] == path)
+
+    def invalidate_resource(self, resource):
+        """ Drops the path of `resource` and everything below it. """
+        self.invalidate(resource_path_tuple(resource)[1:])
+
+
+def invalidate_traversal(path=None):
+    """
+    Drops `path`, or the path of a resource, and everything below it from
+    every :class:`TraversalCache`. Resources call this when they change:
+
+    .. code-block:: python
+
+        @asyncio.coroutine
+        def rename(self, name):
+            yield from self.save(name=name)
+            invalidate_traversal(self)
+    """
+
+    for cache in list(_caches):
+        if path is None or isinstance(path, (str, tuple, list)):
+            cache.invalidate(path)
+        else:
+            cache.invalidate_resource(path)
 
 
 @synchronize
@@ -34,61 +144,103 @@ def traverse(
     vroot_tuple,
     root,
     subpath,
+    cache=None,
 ):
     """
     A version of :func:`pyramid.traversal.traverse` that expects `__getitem__`
     to be a :term:`coroutine`.
+
+    Resources that can resolve several segments at once implement a
+    :term:`coroutine` ``__traverse__(segments)``, which is awaited instead
+    of `__getitem__`. It receives the remaining segments up to the next view
+    selector and returns the resources for as many of them as it could
+    resolve, in order. Traversal continues from the last returned resource,
+    and an empty result means the first segment was not found.
+
+    When a :class:`TraversalCache` is passed as `cache`, traversal resumes
+    from the longest cached prefix of `vpath_tuple` and stores the resources
+    it finds.
     """
 
-    for segment in vpath_tuple:
+    chain = []
+    if i:
+        # the cache is keyed by paths from the root
+        cache = None
+    if cache is not None:
+        chain = list(cache.lookup(root, vpath_tuple))
+        if chain:
+            i = len(chain)
+            ob = chain[-1]
+            if vroot_idx >= 0 and vroot_idx < len(chain):
+                vroot = chain[vroot_idx]
+    cached = len(chain)
+
+    view_name = None
+    while i < len(vpath_tuple):
+        segment = vpath_tuple[i]
         if segment[:2] == view_selector:
-            return {
-                'context': ob,
-                'view_name': segment[2:],
-                'subpath': vpath_tuple[i + 1:],
-                'traversed': vpath_tuple[:vroot_idx + i + 1],
-                'virtual_root': vroot,
-                'virtual_root_path': vroot_tuple,
-                'root': root,
-            }
+            view_name = segment[2:]
+            break
+
+        bulk = getattr(ob, '__traverse__', None)
+        if bulk is not None:
+            segments = []
+            for name in vpath_tuple[i:]:
+                if name[:2] == view_selector:
+                    break
+                segments.append(name)
+            found = yield from bulk(tuple(segments))
+            found = list(found)[:len(segments)]
+            if not found:
+                view_name = segment
+                break
+            for tsugi in found:
+                if i == vroot_idx:
+                    vroot = tsugi
+                ob = tsugi
+                chain.append(ob)
+                i += 1
+            continue
+
         try:
             getitem = ob.__getitem__
         except AttributeError:
-            return {
-                'context': ob,
-                'view_name': segment,
-                'subpath': vpath_tuple[i + 1:],
-                'traversed': vpath_tuple[:vroot_idx + i + 1],
-                'virtual_root': vroot,
-                'virtual_root_path': vroot_tuple,
-                'root': root,
-            }
+            view_name = segment
+            break
 
         try:
             tsugi = yield from getitem(segment)
         except KeyError:
-            return {
-                'context': ob,
-                'view_name': segment,
-                'subpath': vpath_tuple[i + 1:],
-                'traversed': vpath_tuple[:vroot_idx + i + 1],
-                'virtual_root': vroot,
-                'virtual_root_path': vroot_tuple,
-                'root': root,
-            }
+            view_name = segment
+            break
         if i == vroot_idx:
             vroot = tsugi
         ob = tsugi
+        chain.append(ob)
         i += 1
 
+    if cache is not None and len(chain) > cached:
+        cache.store(root, vpath_tuple[:len(chain)], chain, start=cached)
+
+    if view_name is None:
+        return {
+            'context': ob,
+            'view_name': "",
+            'subpath': subpath,
+            'traversed': vpath_tuple,
+            'virtual_root': vroot,
+            'virtual_root_path': vroot_tuple,
+            'root': root
+        }
+
     return {
         'context': ob,
-        'view_name': "",
-        'subpath': subpath,
-        'traversed': vpath_tuple,
+        'view_name': view_name,
+        'subpath': vpath_tuple[i + 1:],
+        'traversed': vpath_tuple[:vroot_idx + i + 1],
         'virtual_root': vroot,
         'virtual_root_path': vroot_tuple,
-        'root': root
+        'root': root,
     }
 
 
@@ -96,8 +248,13 @@ class AsyncioTraverser(TraverserBase):
     """
     Traversal algorithm patched from the default traverser to execute
     __getitem__ as a coroutine.
+
+    Set :attr:`cache` to a :class:`TraversalCache` to reuse resolved
+    resources between requests.
     """
 
+    cache = None
+
     def __call__(self, request):
         environ = request.environ
         matchdict = request.matchdict
@@ -161,6 +318,7 @@ class AsyncioTraverser(TraverserBase):
                 vroot_tuple,
                 root,
                 subpath,
+                cache=self.cache,
             )
 
         return {
@@ -172,3 +330,141 @@ class AsyncioTraverser(TraverserBase):
             'virtual_root_path': vroot_tuple,
             'root': root
         }
+
+
+class _Located:
+    """
+    Stands in for a resource whose parents have already been resolved, so
+    that Pyramid can generate its url without touching `__parent__`.
+    """
+
+    def __init__(self, resource, parent):
+        self.__dict__['_resource'] = resource
+        self.__parent__ = parent
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+
+def _lineage_memo(request):
+    if request is None:
+        return {}
+    return request.environ.setdefault('aiopyramid.lineage', {})
+
+
+@asyncio.coroutine
+def _resolve_parent(resource):
+    parent = getattr(resource, '__parent__', None)
+    if asyncio.iscoroutinefunction(parent):
+        parent = parent()
+    if asyncio.iscoroutine(parent) or isinstance(parent, asyncio.Future):
+        parent = yield from parent
+    return parent
+
+
+@asyncio.coroutine
+def _lineage(resource, request, memo):
+    parent = yield from _resolve_parent(resource)
+    if parent is None:
+        return (resource,)
+    return (resource,) + (yield from _memoized_lineage(parent, request, memo))
+
+
+@asyncio.coroutine
+def _memoized_lineage(resource, request, memo):
+    # resources that share a parent wait on the same lookup
+    pending = memo.get(id(resource))
+    if pending is None:
+        pending = asyncio.ensure_future(_lineage(resource, request, memo))
+        memo[id(resource)] = pending
+    try:
+        return (yield from pending)
+    except Exception:
+        memo.pop(id(resource), None)
+        raise
+
+
+@asyncio.coroutine
+def lineage(resource, request=None):
+    """
+    A :term:`coroutine` version of :func:`pyramid.location.lineage` that
+    returns a tuple of `resource` and its parents, up to the root.
+
+    `__parent__` may be a :term:`coroutine` method, a coroutine or a future,
+    which is awaited. When `request` is passed, lineages are memoized for the
+    rest of the request, so resources that share parents only look them up
+    once.
+    """
+
+    return (yield from _memoized_lineage(
+        resource,
+        request,
+        _lineage_memo(request),
+    ))
+
+
+@asyncio.coroutine
+def find_resource(resource, path, request=None):
+    """
+    A :term:`coroutine` version of :func:`pyramid.traversal.find_resource`
+    for resources whose `__getitem__` or `__traverse__` is a
+    :term:`coroutine`. Raises :class:`KeyError` if `path` cannot be
+    resolved.
+    """
+
+    if isinstance(path, str):
+        absolute = path.startswith(SLASH)
+        segments = split_path_info(path)
+    else:
+        path = tuple(path)
+        absolute = path[:1] == ('',)
+        segments = tuple(segment for segment in path if segment)
+    if absolute:
+        resource = (yield from lineage(resource, request))[-1]
+    if not segments:
+        return resource
+    info = yield from traverse.__wrapped__(
+        0,
+        resource,
+        AsyncioTraverser.VIEW_SELECTOR,
+        segments,
+        -1,
+        resource,
+        (),
+        resource,
+        (),
+    )
+    if info['view_name']:
+        raise KeyError(info['view_name'])
+    return info['context']
+
+
+@asyncio.coroutine
+def resource_url(request, resource, *elements, **kw):
+    """
+    A :term:`coroutine` version of
+    :meth:`pyramid.request.Request.resource_url` that resolves the parents
+    of `resource` with :func:`lineage`.
+    """
+
+    return (yield from resource_urls(request, [resource], *elements, **kw))[0]
+
+
+@asyncio.coroutine
+def resource_urls(request, resources, *elements, **kw):
+    """
+    Returns the urls of `resources`, resolving their lineages concurrently.
+    Arguments are the same as for
+    :meth:`pyramid.request.Request.resource_url`.
+    """
+
+    lineages = yield from asyncio.gather(
+        *[lineage(resource, request) for resource in resources]
+    )
+    urls = []
+    for chain in lineages:
+        located = None
+        for resource in reversed(chain):
+            located = _Located(resource, located)
+        urls.append(request.resource_url(located, *elements, **kw))
+    return urls
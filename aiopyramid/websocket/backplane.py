@@ -0,0 +1,246 @@
+"""
+Relay of websocket broadcasts between worker processes on the same host.
+
+Every worker, e.g. every `AsyncGunicornWorker`, holds only the websockets
+connected to it. A :class:`Backplane` attached to a
+:class:`~aiopyramid.websocket.hub.Hub` connects the workers to each other
+over Unix domain sockets in a shared directory, so a publish in one worker
+reaches the subscribers of every worker in a single hop, without a broker.
+
+Each worker listens on its own socket in the directory and connects to the
+sockets of the workers already there, keeping one connection per pair of
+workers.
+Messages published within one pass of the event loop are batched, and the
+batch is encoded once and written to every peer. Peers hand the messages to
+their hub, which frames them once for all local subscribers.
+
+.. code-block:: python
+
+    # In the app constructor
+    from aiopyramid.websocket.backplane import Backplane
+    from aiopyramid.websocket.hub import default_hub
+
+    Backplane(default_hub, '/run/myapp/backplane')
+
+The backplane starts in the worker on the first join or publish.
+"""
+
+import asyncio
+import atexit
+import glob
+import logging
+import os
+import struct
+
+log = logging.getLogger(__name__)
+
+BATCH_HEADER = struct.Struct('!I')
+RECORD_HEADER = struct.Struct('!BHI')
+
+TEXT = 0
+BINARY = 1
+
+
+def encode_batch(messages):
+    """ Encodes a list of `(topic, message)` pairs into one packet. """
+    parts = []
+    for topic, message in messages:
+        topic = topic.encode('utf-8')
+        if isinstance(message, str):
+            kind = TEXT
+            message = message.encode('utf-8')
+        else:
+            kind = BINARY
+            message = bytes(message)
+        parts.append(RECORD_HEADER.pack(kind, len(topic), len(message)))
+        parts.append(topic)
+        parts.append(message)
+    body = b''.join(parts)
+    return BATCH_HEADER.pack(len(body)) + body
+
+
+def decode_batch(body):
+    """ Returns the `(topic, message)` pairs in the body of a packet. """
+    messages = []
+    offset = 0
+    view = memoryview(body)
+    while offset < len(body):
+        kind, topic_size, size = RECORD_HEADER.unpack_from(body, offset)
+        offset += RECORD_HEADER.size
+        topic = str(view[offset:offset + topic_size], 'utf-8')
+        offset += topic_size
+        message = bytes(view[offset:offset + size])
+        offset += size
+        if kind == TEXT:
+            message = message.decode('utf-8')
+        messages.append((topic, message))
+    return messages
+
+
+class _PeerProtocol(asyncio.Protocol):
+    """
+    Connection to another worker. The first packet in each direction is
+    the name of the sending worker.
+    """
+
+    def __init__(self, backplane, outbound):
+        self.backplane = backplane
+        self.outbound = outbound
+        self.name = None
+        self.transport = None
+        self.buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        name = self.backplane.name.encode('utf-8')
+        transport.write(BATCH_HEADER.pack(len(name)) + name)
+
+    def connection_lost(self, exc):
+        self.backplane._remove_peer(self)
+
+    def data_received(self, data):
+        self.buffer.extend(data)
+        while len(self.buffer) >= BATCH_HEADER.size:
+            size, = BATCH_HEADER.unpack_from(self.buffer)
+            end = BATCH_HEADER.size + size
+            if len(self.buffer) < end:
+                break
+            body = bytes(self.buffer[BATCH_HEADER.size:end])
+            del self.buffer[:end]
+            if self.name is None:
+                self.name = body.decode('utf-8')
+                self.backplane._add_peer(self)
+            else:
+                self.backplane.receive(body)
+
+
+class Backplane:
+    """
+    Relays the messages published on `hub` to the other workers that use
+    `directory`.
+
+    :param hub: The :class:`~aiopyramid.websocket.hub.Hub` to relay.
+    :param str directory: Directory of the sockets of the workers, which
+        must be private to the application.
+    :param str name: Name of the socket of this worker, by default its pid.
+    :param int max_buffer: Number of bytes buffered for a peer above which
+        batches for it are dropped.
+    """
+
+    def __init__(self, hub, directory, name=None, max_buffer=4194304):
+        self.hub = hub
+        self.directory = directory
+        self.name = name
+        self.max_buffer = max_buffer
+        # connections to other workers by name
+        self.peers = {}
+        self.path = None
+        self.server = None
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self._starting = None
+        self._batch = []
+        self._flush_scheduled = False
+        hub.backplane = self
+
+    def ensure_started(self):
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self.start())
+        return self._starting
+
+    @asyncio.coroutine
+    def start(self):
+        """ Listens for other workers and connects to those present. """
+        loop = asyncio.get_event_loop()
+        os.makedirs(self.directory, exist_ok=True)
+        if self.name is None:
+            self.name = str(os.getpid())
+        self.path = os.path.join(self.directory, self.name + '.sock')
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = yield from loop.create_unix_server(
+            lambda: _PeerProtocol(self, False),
+            self.path,
+        )
+        atexit.register(self._unlink)
+        for path in glob.glob(os.path.join(self.directory, '*.sock')):
+            if path == self.path:
+                continue
+            try:
+                yield from loop.create_unix_connection(
+                    lambda: _PeerProtocol(self, True),
+                    path,
+                )
+            except (ConnectionRefusedError, FileNotFoundError):
+                # left behind by a worker that died
+                log.info('Removing stale backplane socket %s.', path)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def _add_peer(self, peer):
+        other = self.peers.get(peer.name)
+        if other is not None:
+            # both workers connected to each other while starting, keep the
+            # connection made by the worker whose name sorts first
+            keep_outbound = self.name < peer.name
+            if peer.outbound != keep_outbound:
+                peer.transport.close()
+                return
+            other.transport.close()
+        self.peers[peer.name] = peer
+
+    def _remove_peer(self, peer):
+        if self.peers.get(peer.name) is peer:
+            del self.peers[peer.name]
+
+    def _unlink(self):
+        try:
+            os.unlink(self.path)
+        except (FileNotFoundError, TypeError):
+            pass
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        for peer in list(self.peers.values()):
+            peer.transport.close()
+        self._unlink()
+
+    def send(self, topic, message):
+        """ Queues `message` for the next batch to the other workers. """
+        self._batch.append((topic, message))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_event_loop().call_soon(self._schedule_flush)
+
+    def _schedule_flush(self):
+        starting = self.ensure_started()
+        if starting.done():
+            self.flush()
+        else:
+            starting.add_done_callback(lambda future: self.flush())
+
+    def flush(self):
+        self._flush_scheduled = False
+        batch, self._batch = self._batch, []
+        if not batch or not self.peers:
+            return
+        packet = encode_batch(batch)
+        for peer in list(self.peers.values()):
+            transport = peer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                self.dropped += len(batch)
+                continue
+            transport.write(packet)
+        self.sent += len(batch)
+
+    def receive(self, body):
+        for topic, message in decode_batch(body):
+            self.received += 1
+            self.hub.publish_local(topic, message)
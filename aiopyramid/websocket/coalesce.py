@@ -0,0 +1,163 @@
+"""
+Coalescing of frequent outbound websocket messages.
+
+Every call to ``send`` frames a message and writes it to the transport on
+its own. A :class:`CoalescingSender` instead holds the messages sent within
+`interval` seconds and writes all their frames to the transport at once,
+copying them into one chunk except for payloads too large to copy.
+Messages sent with a key replace the pending message with the same key, so a
+client that is sent a stream of updates only receives the latest value of
+each key per flush. With `pack`, the messages of a flush are also packed
+into a single message, and thus a single frame.
+
+:class:`~aiopyramid.websocket.view.WebsocketConnectionView` uses a sender
+for its :meth:`send` when its ``coalesce`` attribute is set:
+
+.. code-block:: python
+
+    class TickerWebsocket(WebsocketConnectionView):
+        coalesce = {'interval': 0.05, 'max_batch': 100}
+
+        @asyncio.coroutine
+        def on_tick(self, symbol, price):
+            yield from self.send(
+                json.dumps({'symbol': symbol, 'price': price}),
+                key=symbol,
+            )
+"""
+
+import asyncio
+
+from .hub import frame_chunks, get_transport, record_activity
+
+
+class CoalescingSender:
+    """
+    Batches the messages sent to `ws`.
+
+    :param float interval: Seconds a message may wait for others before the
+        pending messages are flushed.
+    :param int max_batch: Number of pending messages at which they are
+        flushed without waiting for `interval`.
+    :param combine: Called with the pending message and a new one with the
+        same key, returns the message that replaces both. By default the
+        new message replaces the pending one.
+    :param pack: Called with the list of messages of a flush, returns the
+        single message to send in their place, e.g. a JSON array.
+    """
+
+    def __init__(
+        self,
+        ws,
+        interval=0.01,
+        max_batch=64,
+        combine=None,
+        pack=None,
+    ):
+        self.ws = ws
+        self.interval = interval
+        self.max_batch = max_batch
+        self.combine = combine
+        self.pack = pack
+        self.pending = []
+        # position in pending of the message for each key
+        self.positions = {}
+        self.queued = 0
+        # frames not sent because their messages were merged or packed
+        self.frames_saved = 0
+        self.frames = 0
+        self.writes = 0
+        self.dropped = 0
+        self._handle = None
+        self._sending = None
+
+    def send(self, message, key=None):
+        """
+        Queues `message` for the next flush. A pending message with the same
+        `key` is replaced by `message` and keeps its place in the batch.
+        """
+
+        self.queued += 1
+        if key is not None:
+            position = self.positions.get(key)
+            if position is not None:
+                self.frames_saved += 1
+                if self.combine is not None:
+                    message = self.combine(self.pending[position], message)
+                self.pending[position] = message
+                return
+            self.positions[key] = len(self.pending)
+        self.pending.append(message)
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self._handle is None:
+            self._handle = asyncio.get_event_loop().call_later(
+                self.interval,
+                self.flush,
+            )
+
+    def flush(self):
+        """ Sends the pending messages now. """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self.pending:
+            return
+        messages, self.pending = self.pending, []
+        self.positions = {}
+        if self.pack is not None:
+            self.frames_saved += len(messages) - 1
+            messages = [self.pack(messages)]
+        transport = get_transport(self.ws)
+        if transport is None:
+            # e.g. uWSGI, whose send already writes in batches
+            self._sending = asyncio.ensure_future(
+                self._send_all(messages, self._sending),
+            )
+            return
+        if transport.is_closing():
+            self.dropped += len(messages)
+            return
+        # one write unless some payloads are too large to copy
+        chunks = frame_chunks(messages)
+        for chunk in chunks:
+            transport.write(chunk)
+        record_activity(self.ws)
+        self.frames += len(messages)
+        self.writes += len(chunks)
+
+    @asyncio.coroutine
+    def _send_all(self, messages, previous):
+        if previous is not None:
+            # keep the order of the flushes
+            yield from asyncio.wait([previous])
+        for sent, message in enumerate(messages):
+            if not getattr(self.ws, 'open', True):
+                self.dropped += len(messages) - sent
+                return
+            try:
+                yield from self.ws.send(message)
+            except Exception:
+                # closed in the meantime
+                self.dropped += len(messages) - sent
+                return
+            self.frames += 1
+            self.writes += 1
+
+    @asyncio.coroutine
+    def close(self):
+        """ Flushes the pending messages and waits until they are sent. """
+        self.flush()
+        if self._sending is not None:
+            yield from asyncio.wait([self._sending])
+            self._sending = None
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'pending': len(self.pending),
+            'frames': self.frames,
+            'writes': self.writes,
+            'dropped': self.dropped,
+            'frames_saved': self.frames_saved,
+        }
@@ -0,0 +1,110 @@
+"""
+permessage-deflate compression for websockets served by the `gunicorn`
+worker.
+
+aiohttp accepts the permessage-deflate offer of the client as it is and
+compresses every message. :class:`DeflateWebSocketResponse` lets the server
+choose the size of its compression window and whether it keeps the window
+between messages, and sends messages smaller than a threshold uncompressed.
+
+The memory a connection uses for compression is roughly
+``2 ** (window_bits + 2) + 2 ** (mem_level + 9)`` bytes while it compresses.
+Without context takeover the compressor is freed after every message, so
+idle connections cost nothing but every message is compressed from scratch.
+"""
+
+import zlib
+
+from aiohttp import hdrs
+from aiohttp.http_websocket import WebSocketWriter, ws_ext_gen
+from aiohttp.web import WebSocketResponse
+
+
+class DeflateWriter(WebSocketWriter):
+    """
+    Writer that compresses messages of at least `threshold` bytes with a
+    compressor of `mem_level`.
+    """
+
+    def __init__(self, stream, *, threshold=0, mem_level=8, **kw):
+        super().__init__(stream, **kw)
+        self.threshold = threshold
+        self.mem_level = mem_level
+
+    def _send_frame(self, message, opcode):
+        if not self.compress or opcode >= 8:
+            return super()._send_frame(message, opcode)
+        if len(message) < self.threshold:
+            # messages are compressed one by one, a small one may skip it
+            compress, self.compress = self.compress, 0
+            try:
+                return super()._send_frame(message, opcode)
+            finally:
+                self.compress = compress
+        if self._compressobj is None:
+            self._compressobj = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION,
+                zlib.DEFLATED,
+                -self.compress,
+                self.mem_level,
+            )
+        try:
+            return super()._send_frame(message, opcode)
+        finally:
+            if self.notakeover:
+                self._compressobj = None
+
+
+class DeflateWebSocketResponse(WebSocketResponse):
+    """
+    :class:`aiohttp.web.WebSocketResponse` that negotiates permessage-deflate
+    on the terms of the server.
+
+    :param int window_bits: Largest compression window, from 9 to 15.
+    :param int threshold: Messages smaller than this many bytes are sent
+        uncompressed.
+    :param bool no_context_takeover: Start every message with an empty
+        window, trading compression ratio for memory.
+    :param int mem_level: zlib memory level of the compressor, from 1 to 9.
+    """
+
+    def __init__(
+        self,
+        *,
+        window_bits=15,
+        threshold=128,
+        no_context_takeover=False,
+        mem_level=8,
+        **kw
+    ):
+        if not 9 <= window_bits <= 15:
+            raise ValueError('window_bits must be between 9 and 15.')
+        kw.setdefault('compress', True)
+        super().__init__(**kw)
+        self.window_bits = window_bits
+        self.threshold = threshold
+        self.no_context_takeover = no_context_takeover
+        self.mem_level = mem_level
+
+    def _pre_start(self, request):
+        protocol, writer = super()._pre_start(request)
+        if not self._compress:
+            # not offered by the client or disabled
+            return protocol, writer
+        window_bits = min(self._compress, self.window_bits)
+        notakeover = writer.notakeover or self.no_context_takeover
+        self.headers[hdrs.SEC_WEBSOCKET_EXTENSIONS] = ws_ext_gen(
+            compress=window_bits,
+            isserver=True,
+            server_notakeover=notakeover,
+        )
+        self._compress = window_bits
+        writer = DeflateWriter(
+            writer.stream,
+            limit=writer._limit,
+            compress=window_bits,
+            notakeover=notakeover,
+            threshold=self.threshold,
+            mem_level=self.mem_level,
+        )
+        return protocol, writer
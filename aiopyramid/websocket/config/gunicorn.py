@@ -4,10 +4,23 @@ import functools
 
 import websockets
 import gunicorn  # noqa
+from aiohttp import WSMsgType
+from aiohttp.web import (
+    Response as AiohttpResponse,
+    WebSocketResponse,
+)
 
+from pyramid.httpexceptions import HTTPServiceUnavailable
 from pyramid.response import Response
+from pyramid.settings import asbool
 
 from aiopyramid.config import AsyncioMapperBase
+from aiopyramid.websocket.compression import DeflateWebSocketResponse
+from aiopyramid.websocket.helpers import as_buffer
+
+# environ key of the coroutine function the worker calls to serve a
+# websocket with aiohttp
+NATIVE_WEBSOCKET_KEY = 'aiopyramid.websocket'
 
 
 def _connection_closed_to_none(func):
@@ -50,6 +63,22 @@ def _use_bytes(func):
     return _use_bytes_inner
 
 
+def _send_buffers(func):
+    """
+    Lets `send` of the websockets library, which only takes `str` and
+    `bytes`, also take other objects supporting the buffer protocol.
+    """
+
+    @asyncio.coroutine
+    @functools.wraps(func)
+    def _send_buffers_inner(data):
+        if not isinstance(data, (str, bytes)):
+            data = bytes(as_buffer(data))
+        yield from func(data)
+
+    return _send_buffers_inner
+
+
 class HandshakeInterator:
 
     def __init__(self, app_iter):
@@ -93,27 +122,206 @@ class SwitchProtocolsResponse(Response):
             self.app_iter.close = switch_protocols
 
 
+class AiohttpWebsocket:
+    """
+    ``ws`` interface over an :class:`aiohttp.web.WebSocketResponse`.
+
+    A reader task receives from the response while the connection is open,
+    so pings from the client are answered and pongs noticed even when the
+    view only sends. Up to `max_queue` messages wait for :meth:`recv`,
+    beyond that the reader stops reading from the connection.
+    """
+
+    def __init__(self, response, transport, use_bytes=False, max_queue=64):
+        self.response = response
+        self.transport = transport
+        self.use_bytes = use_bytes
+        self.messages = asyncio.Queue(maxsize=max_queue)
+        self._pong_waiters = []
+        self._reader = None
+        self._eof = False
+
+    @property
+    def open(self):
+        return not self.response.closed
+
+    def start(self):
+        """ Starts the reader task if it is not running yet. """
+        if self._reader is None:
+            self._reader = asyncio.ensure_future(self._read())
+
+    @asyncio.coroutine
+    def _read(self):
+        try:
+            while True:
+                msg = yield from self.response.receive()
+                if msg.type == WSMsgType.PING:
+                    self.response.pong(msg.data)
+                elif msg.type == WSMsgType.PONG:
+                    waiters, self._pong_waiters = self._pong_waiters, []
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(None)
+                elif msg.type == WSMsgType.TEXT:
+                    data = msg.data
+                    if self.use_bytes:
+                        data = str.encode(data)
+                    yield from self.messages.put(data)
+                elif msg.type == WSMsgType.BINARY:
+                    yield from self.messages.put(msg.data)
+                else:
+                    # closing, closed or failed
+                    break
+        finally:
+            self._eof = True
+            for waiter in self._pong_waiters:
+                waiter.cancel()
+            self._pong_waiters = []
+            if not self.messages.full():
+                # wakes up a waiting recv
+                self.messages.put_nowait(None)
+
+    @asyncio.coroutine
+    def recv(self):
+        self.start()
+        if self._eof and self.messages.empty():
+            return None
+        return (yield from self.messages.get())
+
+    @asyncio.coroutine
+    def send(self, message):
+        """
+        Sends a string as a text message and any object supporting the
+        buffer protocol as a binary message, without converting it to bytes
+        first. aiohttp still copies payloads of up to 16 KiB into the frame.
+        """
+
+        if isinstance(message, str):
+            yield from self.response.send_str(message)
+        else:
+            yield from self.response.send_bytes(as_buffer(message))
+
+    @asyncio.coroutine
+    def ping(self, data=b''):
+        """
+        Sends a ping and returns a future that is completed by the next pong.
+        """
+
+        waiter = asyncio.Future()
+        self._pong_waiters.append(waiter)
+        self.response.ping(data)
+        yield from self.response.drain()
+        return waiter
+
+    @asyncio.coroutine
+    def close(self):
+        if self._reader is not None and not self._reader.done():
+            # aiohttp only waits for the closing handshake of the client
+            # when nothing else is receiving
+            self._reader.cancel()
+            yield from asyncio.wait([self._reader])
+        yield from self.response.close()
+
+
 class WebsocketMapper(AsyncioMapperBase):
 
     use_bytes = False
+    # hand messages to views as they arrive, ignoring use_bytes
+    binary = False
+
+    # permessage-deflate for websockets served by the gunicorn worker, None
+    # follows the aiopyramid.websocket.compress setting
+    compress = None
+    # keyword arguments of DeflateWebSocketResponse
+    compress_options = {}
+    # :class:`~aiopyramid.websocket.registry.ConnectionRegistry` of the
+    # connections served by this mapper, if any
+    registry = None
+
+    def make_websocket_response(self, request):
+        compress = self.compress
+        if compress is None:
+            settings = request.registry.settings or {}
+            compress = asbool(settings.get('aiopyramid.websocket.compress'))
+        # pings are answered by the reader of AiohttpWebsocket, which also
+        # needs to see the pongs
+        if compress:
+            return DeflateWebSocketResponse(
+                autoping=False,
+                **self.compress_options
+            )
+        return WebSocketResponse(compress=False, autoping=False)
+
+    def run_view(self, view_callable, ws):
+        if self.registry is None:
+            return view_callable(ws)
+        return self.registry.serve(view_callable, ws)
+
+    def serve_natively(self, view_callable, request, aiohttp_request):
+        """
+        Returns a :term:`coroutine` function that the `gunicorn` worker
+        calls with the headers of the Pyramid response to perform the
+        handshake and run `view_callable` with aiohttp.
+        """
+
+        @asyncio.coroutine
+        def serve(headers):
+            response = self.make_websocket_response(request)
+            if not response.can_prepare(aiohttp_request):
+                return AiohttpResponse(
+                    status=400,
+                    text='Invalid WebSocket handshake.\n',
+                )
+            for name, value in headers:
+                if name.lower() not in ('content-length', 'content-type'):
+                    response.headers.add(name, value)
+            yield from response.prepare(aiohttp_request)
+            ws = AiohttpWebsocket(
+                response,
+                aiohttp_request.transport,
+                use_bytes=WebsocketMapper.use_bytes and not self.binary,
+            )
+            ws.start()
+            try:
+                yield from self.run_view(view_callable, ws)
+            finally:
+                yield from ws.close()
+            return response
+
+        return serve
 
     def launch_websocket_view(self, view):
 
         def websocket_view(context, request):
 
+            if self.registry is not None and self.registry.full:
+                self.registry.rejected += 1
+                return HTTPServiceUnavailable()
+
             if inspect.isclass(view):
                 view_callable = view(context, request)
             else:
                 view_callable = view
 
+            aiohttp_request = request.environ.get('aiohttp.request')
+            if aiohttp_request is not None:
+                # the worker takes over once the response is returned
+                request.environ[NATIVE_WEBSOCKET_KEY] = self.serve_natively(
+                    view_callable,
+                    request,
+                    aiohttp_request,
+                )
+                return Response(status=101)
+
             @asyncio.coroutine
             def _ensure_ws_close(ws):
-                if WebsocketMapper.use_bytes:
+                if WebsocketMapper.use_bytes and not self.binary:
                     ws.recv = _use_bytes(ws.recv)
+                ws.send = _send_buffers(ws.send)
 
                 ws.recv = _connection_closed_to_none(ws.recv)
 
-                yield from view_callable(ws)
+                yield from self.run_view(view_callable, ws)
                 yield from ws.close()
 
             def switch_protocols():
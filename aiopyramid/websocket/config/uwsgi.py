@@ -1,12 +1,17 @@
 import inspect
 import asyncio
+import functools
 from contextlib import suppress
 
 import greenlet
 
+from pyramid.exceptions import ConfigurationError
+from pyramid.httpexceptions import HTTPServiceUnavailable
+
 from aiopyramid.config import AsyncioMapperBase
 from aiopyramid.helpers import run_in_greenlet
 from aiopyramid.websocket.exceptions import WebsocketClosed
+from aiopyramid.websocket.helpers import as_buffer
 
 try:
     import uwsgi
@@ -26,15 +31,40 @@ class UWSGIWebsocket:
         self.q_in = q_in
         self.q_out = q_out
         self.open = True
+        # set by the bridge while it stops reading because q_in is full
+        self.paused = False
+        self._wake_scheduled = False
 
     @asyncio.coroutine
     def recv(self):
-        return (yield from self.q_in.get())
+        msg = yield from self.q_in.get()
+        if self.paused:
+            self.wake()
+        return msg
 
     @asyncio.coroutine
     def send(self, message):
+        if not isinstance(message, (str, bytes)):
+            # uWSGI takes read-only buffers only
+            message = bytes(as_buffer(message))
+        # waits while q_out is full
         yield from self.q_out.put(message)
-        self.back.switch()
+        self.wake()
+
+    def wake(self):
+        """
+        Schedules a switch to the request greenlet, which then sends every
+        queued message. Calls made before the switch share it.
+        """
+
+        if not self._wake_scheduled:
+            self._wake_scheduled = True
+            asyncio.get_event_loop().call_soon(self._switch)
+
+    def _switch(self):
+        self._wake_scheduled = False
+        if not self.back.dead:
+            self.back.switch()
 
     @asyncio.coroutine
     def close(self):
@@ -45,15 +75,32 @@ class UWSGIWebsocket:
 class UWSGIWebsocketMapper(AsyncioMapperBase):
 
     use_str = True
+    # hand messages to views as they arrive, ignoring use_str
+    binary = False
+    # number of messages queued in each direction before waiting
+    max_queue = 64
+    # :class:`~aiopyramid.websocket.registry.ConnectionRegistry` of the
+    # connections served by this mapper, if any
+    registry = None
 
     def launch_websocket_view(self, view):
+        if self.registry is not None and self.registry.ping_interval:
+            raise ConfigurationError(
+                'uWSGI pings websockets itself, set websockets-ping-freq '
+                'instead of the ping_interval of {}.'.format(self.registry)
+            )
 
         def websocket_view(context, request):
+            if self.registry is not None and self.registry.full:
+                self.registry.rejected += 1
+                return HTTPServiceUnavailable()
             uwsgi.websocket_handshake()
             this = greenlet.getcurrent()
             this.has_message = False
+            max_queue = UWSGIWebsocketMapper.max_queue
+            use_str = UWSGIWebsocketMapper.use_str and not self.binary
             q_in = asyncio.Queue()
-            q_out = asyncio.Queue()
+            q_out = asyncio.Queue(maxsize=max_queue)
 
             # make socket proxy
             if inspect.isclass(view):
@@ -63,16 +110,21 @@ class UWSGIWebsocketMapper(AsyncioMapperBase):
             ws = UWSGIWebsocket(this, q_in, q_out)
 
             # start monitoring websocket events
-            asyncio.get_event_loop().add_reader(
-                uwsgi.connection_fd(),
-                uwsgi_recv_msg,
-                this
-            )
+            loop = asyncio.get_event_loop()
+            fd = uwsgi.connection_fd()
+            loop.add_reader(fd, uwsgi_recv_msg, this)
+            reading = True
+            eof = False
 
             # NOTE: don't use synchronize because we aren't waiting
             # for this future, instead we are using the reader to return
             # to the child greenlet.
 
+            if self.registry is not None:
+                view_callable = functools.partial(
+                    self.registry.serve,
+                    view_callable,
+                )
             future = asyncio.Future()
             asyncio.ensure_future(
                 run_in_greenlet(this, future, view_callable, ws)
@@ -81,37 +133,58 @@ class UWSGIWebsocketMapper(AsyncioMapperBase):
             # switch to open
             this.parent.switch()
 
-            while True:
-                if future.done():
-                    if future.exception() is not None:
-                        raise WebsocketClosed from future.exception()
-                    raise WebsocketClosed
-
-                # message in
-                if this.has_message:
-                    this.has_message = False
-                    try:
-                        msg = uwsgi.websocket_recv_nb()
-                    except OSError:
-                        msg = None
-
-                    if UWSGIWebsocketMapper.use_str:
-                        with suppress(Exception):
-                            print('howdy')
-                            msg = bytes.decode(msg)
-
-                    if msg or msg is None:
-                        q_in.put_nowait(msg)
-
-                # message out
-                if not q_out.empty():
-                    msg = q_out.get_nowait()
-                    try:
-                        uwsgi.websocket_send(msg)
-                    except OSError:
-                        q_in.put_nowait(None)
-
-                this.parent.switch()
+            try:
+                while True:
+                    # messages in, all that uWSGI has buffered
+                    if this.has_message and not eof:
+                        this.has_message = False
+                        while q_in.qsize() < max_queue:
+                            try:
+                                msg = uwsgi.websocket_recv_nb()
+                            except OSError:
+                                eof = True
+                                q_in.put_nowait(None)
+                                break
+                            if not msg:
+                                break
+                            if use_str:
+                                with suppress(Exception):
+                                    msg = bytes.decode(msg)
+                            q_in.put_nowait(msg)
+                        else:
+                            # the view is behind, more may be buffered
+                            this.has_message = True
+                            ws.paused = True
+
+                    if reading and (eof or ws.paused):
+                        loop.remove_reader(fd)
+                        reading = False
+                    elif not eof and ws.paused and q_in.qsize() < max_queue:
+                        ws.paused = False
+                        loop.add_reader(fd, uwsgi_recv_msg, this)
+                        reading = True
+                        continue
+
+                    # messages out, all that are queued
+                    while not q_out.empty():
+                        msg = q_out.get_nowait()
+                        try:
+                            uwsgi.websocket_send(msg)
+                        except OSError:
+                            if not eof:
+                                eof = True
+                                q_in.put_nowait(None)
+
+                    # only after sending what the view queued before it ended
+                    if future.done():
+                        if future.exception() is not None:
+                            raise WebsocketClosed from future.exception()
+                        raise WebsocketClosed
+
+                    this.parent.switch()
+            finally:
+                if reading:
+                    loop.remove_reader(fd)
 
         return websocket_view
 
@@ -13,3 +13,18 @@ def ignore_websocket_closed(app):
                 raise
             return ('')
     return _call_app_ignoring_ws_closed
+
+
+def as_buffer(data):
+    """
+    Returns `data`, any object supporting the buffer protocol, as an object
+    of its bytes without copying them, i.e. the object itself for bytes and
+    bytearrays and a byte-wise memoryview otherwise.
+    """
+
+    if isinstance(data, (bytes, bytearray)):
+        return data
+    view = memoryview(data)
+    if view.itemsize != 1 or view.ndim != 1 or view.format != 'B':
+        view = view.cast('B')
+    return view
@@ -0,0 +1,209 @@
+"""
+Publish and subscribe for websockets.
+
+A :class:`Hub` keeps the websockets subscribed to each topic. Publishing
+encodes and frames a message once and writes the same frame to the transport
+of every subscriber, instead of framing it again for every connection. Large
+payloads are written after their header rather than copied into the frame.
+Websockets without an accessible transport, such as those of `uWSGI`, fall
+back to their ``send`` method.
+
+Subscribers whose transport buffers more than `max_buffer` bytes are slow
+readers. Depending on the policy, frames for them are dropped until they
+catch up, or they are disconnected.
+"""
+
+import asyncio
+import logging
+import struct
+
+from .helpers import as_buffer
+
+log = logging.getLogger(__name__)
+
+DROP = 'drop'
+DISCONNECT = 'disconnect'
+
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+
+
+# payloads larger than this are written after their header rather than
+# copied behind it, as aiohttp does
+MAX_COPY = 16384
+
+
+def frame_parts(message):
+    """
+    Returns the header and the payload of `message` as a single unmasked
+    websocket frame, a text frame for strings and a binary frame for
+    objects supporting the buffer protocol.
+    """
+
+    if isinstance(message, str):
+        opcode = OP_TEXT
+        message = message.encode('utf-8')
+    else:
+        opcode = OP_BINARY
+        message = as_buffer(message)
+    length = len(message)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header, message
+
+
+def encode_frame(message):
+    """ Returns `message` as a single unmasked websocket frame. """
+    header, payload = frame_parts(message)
+    return header + payload
+
+
+def frame_chunks(messages):
+    """
+    Returns the frames of `messages` as chunks to write in order. Small
+    frames are joined into one chunk, while payloads larger than
+    `MAX_COPY` bytes are chunks of their own, so they are not copied.
+    """
+
+    chunks = []
+    joined = []
+    for message in messages:
+        header, payload = frame_parts(message)
+        joined.append(header)
+        if len(payload) > MAX_COPY:
+            chunks.append(b''.join(joined))
+            chunks.append(payload)
+            joined = []
+        else:
+            joined.append(payload)
+    if joined:
+        chunks.append(b''.join(joined))
+    return chunks
+
+
+def get_transport(ws):
+    """ Returns the transport under `ws`, or `None` if there is none. """
+    transport = getattr(ws, 'transport', None)
+    if transport is None:
+        writer = getattr(ws, 'writer', None)
+        transport = getattr(writer, 'transport', None)
+    return transport
+
+
+def record_activity(ws):
+    """
+    Tells the :class:`~aiopyramid.websocket.registry.ConnectionRegistry`
+    tracking `ws`, if any, that a frame was written to its transport
+    directly rather than with ``send``.
+    """
+
+    touch = getattr(ws, 'touch', None)
+    if touch is not None:
+        touch()
+
+
+class Hub:
+    """
+    Topics of subscribed websockets.
+
+    :param int max_buffer: Number of bytes buffered by the transport of a
+        subscriber above which it is considered slow.
+    :param str policy: What to do with slow subscribers, ``'drop'`` frames
+        for them or ``'disconnect'`` them.
+    """
+
+    def __init__(self, max_buffer=1048576, policy=DROP):
+        if policy not in (DROP, DISCONNECT):
+            raise ValueError('Unknown policy {}.'.format(policy))
+        self.max_buffer = max_buffer
+        self.policy = policy
+        self.topics = {}
+        self.sent = 0
+        self.dropped = 0
+        self.disconnected = 0
+        # relays publishes to other processes, see
+        # :class:`~aiopyramid.websocket.backplane.Backplane`
+        self.backplane = None
+
+    def join(self, topic, ws):
+        if self.backplane is not None:
+            self.backplane.ensure_started()
+        self.topics.setdefault(topic, set()).add(ws)
+
+    def leave(self, topic, ws):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(ws)
+            if not subscribers:
+                del self.topics[topic]
+
+    def leave_all(self, ws):
+        for topic in list(self.topics):
+            self.leave(topic, ws)
+
+    def subscribers(self, topic):
+        return self.topics.get(topic, ())
+
+    def publish(self, topic, message):
+        """
+        Sends `message` to every subscriber of `topic` and returns the number
+        of local subscribers it was written or handed to.
+        """
+
+        if self.backplane is not None:
+            self.backplane.send(topic, message)
+        return self.publish_local(topic, message)
+
+    def publish_local(self, topic, message):
+        """ Sends `message` only to the subscribers in this process. """
+        subscribers = self.topics.get(topic)
+        if not subscribers:
+            return 0
+        chunks = frame_chunks([message])
+        sent = 0
+        for ws in list(subscribers):
+            if not getattr(ws, 'open', True):
+                self.leave(topic, ws)
+                continue
+            transport = get_transport(ws)
+            if transport is None:
+                asyncio.ensure_future(ws.send(message))
+                sent += 1
+                continue
+            if transport.is_closing():
+                self.leave(topic, ws)
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                self._slow(ws, transport)
+                continue
+            for chunk in chunks:
+                transport.write(chunk)
+            record_activity(ws)
+            sent += 1
+        self.sent += sent
+        return sent
+
+    def _slow(self, ws, transport):
+        if self.policy == DROP:
+            self.dropped += 1
+            return
+        log.info('Disconnecting slow websocket %r.', ws)
+        self.disconnected += 1
+        self.leave_all(ws)
+        transport.abort()
+
+    def stats(self):
+        return {
+            'topics': len(self.topics),
+            'subscriptions': sum(len(s) for s in self.topics.values()),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'disconnected': self.disconnected,
+        }
+
+
+default_hub = Hub()
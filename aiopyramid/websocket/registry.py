@@ -0,0 +1,282 @@
+"""
+Bookkeeping for the websockets open in a worker.
+
+A :class:`ConnectionRegistry` set on a websocket mapper records every
+connection the mapper serves along with when it last sent or received a
+message. A single periodic check over all connections pings them, closes
+those that stayed idle or did not answer a ping in time, and connections
+beyond `max_connections` are turned away, so that a worker does not
+accumulate half-dead clients over days of uptime.
+
+.. code-block:: python
+
+    # In the app constructor
+    from aiopyramid.websocket.config import WebsocketMapper
+    from aiopyramid.websocket.registry import ConnectionRegistry
+
+    WebsocketMapper.registry = ConnectionRegistry(
+        max_connections=10000,
+        ping_interval=30,
+        pong_timeout=10,
+        idle_timeout=600,
+    )
+"""
+
+import asyncio
+import functools
+import logging
+import time
+
+from .hub import get_transport
+
+log = logging.getLogger(__name__)
+
+
+class Connection:
+    """ What the registry knows about a websocket. """
+
+    __slots__ = (
+        'ws',
+        'opened',
+        'last_activity',
+        'last_received',
+        'last_ping',
+        'ping_sent',
+        'ping_task',
+    )
+
+    def __init__(self, ws, now):
+        self.ws = ws
+        self.opened = now
+        self.last_activity = now
+        self.last_received = now
+        self.last_ping = now
+        # time of the ping still waiting for its pong
+        self.ping_sent = None
+        self.ping_task = None
+
+    def buffered(self):
+        """
+        Returns the bytes waiting in the write buffer of the transport of
+        the connection.
+        """
+
+        transport = get_transport(self.ws)
+        if transport is None or transport.is_closing():
+            return 0
+        return transport.get_write_buffer_size()
+
+    def queued(self):
+        """
+        Returns the number of messages waiting in the queues of the
+        connection, e.g. those of uWSGI.
+        """
+
+        return sum(
+            queue.qsize()
+            for queue in (
+                getattr(self.ws, 'q_in', None),
+                getattr(self.ws, 'q_out', None),
+            )
+            if queue is not None
+        )
+
+
+class ConnectionRegistry:
+    """
+    Tracks open websockets.
+
+    :param int max_connections: Number of connections above which new ones
+        are rejected, `None` for no limit.
+    :param float ping_interval: Seconds between pings, `None` to not ping.
+    :param float pong_timeout: Seconds to wait for the pong to a ping
+        before closing the connection.
+    :param float idle_timeout: Seconds without a message in either direction
+        after which the connection is closed, `None` to keep idle
+        connections.
+    """
+
+    def __init__(
+        self,
+        max_connections=None,
+        ping_interval=None,
+        pong_timeout=10.0,
+        idle_timeout=None,
+        clock=time.monotonic,
+    ):
+        self.max_connections = max_connections
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.connections = {}
+        self.rejected = 0
+        self.idle_closed = 0
+        self.pong_closed = 0
+        timeouts = [
+            timeout
+            for timeout in (ping_interval, idle_timeout)
+            if timeout
+        ]
+        if ping_interval and pong_timeout:
+            timeouts.append(pong_timeout)
+        # one check over every connection at this interval
+        self.interval = min(timeouts) / 2 if timeouts else None
+        self._handle = None
+
+    def __len__(self):
+        return len(self.connections)
+
+    @property
+    def full(self):
+        return (
+            self.max_connections is not None
+            and len(self.connections) >= self.max_connections
+        )
+
+    def register(self, ws):
+        """
+        Starts tracking `ws` and returns `True`, or returns `False` if the
+        registry is full.
+        """
+
+        if self.full:
+            self.rejected += 1
+            return False
+        self.connections[ws] = Connection(ws, self.clock())
+        ws.recv = self._tracking(ws, ws.recv, received=True)
+        ws.send = self._tracking(ws, ws.send)
+        # called by what writes to the transport directly, e.g. the hub
+        ws.touch = functools.partial(self.touch, ws)
+        if self._handle is None and self.interval is not None:
+            self._schedule()
+        return True
+
+    def unregister(self, ws):
+        connection = self.connections.pop(ws, None)
+        if connection is not None and connection.ping_task is not None:
+            connection.ping_task.cancel()
+
+    def touch(self, ws, received=False):
+        connection = self.connections.get(ws)
+        if connection is not None:
+            connection.last_activity = self.clock()
+            if received:
+                connection.last_received = connection.last_activity
+
+    def _tracking(self, ws, func, received=False):
+
+        @asyncio.coroutine
+        @functools.wraps(func)
+        def _tracking_inner(*args, **kwargs):
+            result = yield from func(*args, **kwargs)
+            self.touch(ws, received)
+            return result
+
+        return _tracking_inner
+
+    @asyncio.coroutine
+    def serve(self, view_callable, ws):
+        """
+        Runs `view_callable` with `ws` while it is registered. Nothing is
+        run for connections over the limit.
+        """
+
+        if not self.register(ws):
+            log.warning('Rejecting websocket, %d are open.', len(self))
+            return
+        try:
+            yield from view_callable(ws)
+        finally:
+            self.unregister(ws)
+
+    def _schedule(self):
+        self._handle = asyncio.get_event_loop().call_later(
+            self.interval,
+            self.check,
+        )
+
+    def check(self):
+        """ Pings and closes connections as needed. """
+        self._handle = None
+        now = self.clock()
+        for connection in list(self.connections.values()):
+            if (
+                self.idle_timeout
+                and now - connection.last_activity > self.idle_timeout
+            ):
+                self.idle_closed += 1
+                self.close(connection.ws)
+            elif connection.ping_sent is not None:
+                if (
+                    self.pong_timeout
+                    and now - connection.ping_sent > self.pong_timeout
+                ):
+                    self.pong_closed += 1
+                    self.close(connection.ws)
+            elif (
+                # sending does not show that the client is still there
+                self.ping_interval
+                # a pong shows it as well as a message
+                and now - max(
+                    connection.last_received,
+                    connection.last_ping,
+                ) >= self.ping_interval
+                # servers like uWSGI answer and send pings themselves
+                and hasattr(connection.ws, 'ping')
+            ):
+                connection.ping_sent = now
+                connection.last_ping = now
+                connection.ping_task = asyncio.ensure_future(
+                    self._ping(connection),
+                )
+        if self.connections and self.interval is not None:
+            self._schedule()
+
+    @asyncio.coroutine
+    def _ping(self, connection):
+        try:
+            pong = yield from connection.ws.ping()
+            yield from pong
+        except Exception:
+            # closed in the meantime
+            return
+        connection.ping_sent = None
+        connection.ping_task = None
+
+    def close(self, ws):
+        """
+        Drops `ws` at once rather than waiting on a closing handshake with a
+        client that may be gone.
+        """
+
+        self.unregister(ws)
+        transport = get_transport(ws)
+        if transport is not None:
+            transport.abort()
+        else:
+            asyncio.ensure_future(ws.close())
+
+    def buffered(self):
+        """ Returns the bytes in the write buffers of all connections. """
+        return sum(
+            connection.buffered()
+            for connection in self.connections.values()
+        )
+
+    def queued(self):
+        """ Returns the messages queued for all connections. """
+        return sum(
+            connection.queued()
+            for connection in self.connections.values()
+        )
+
+    def stats(self):
+        return {
+            'connections': len(self.connections),
+            'buffered': self.buffered(),
+            'queued': self.queued(),
+            'rejected': self.rejected,
+            'idle_closed': self.idle_closed,
+            'pong_closed': self.pong_closed,
+        }
@@ -1,28 +1,147 @@
 import asyncio
+import logging
+
+from .coalesce import CoalescingSender
+from .hub import default_hub
+
+log = logging.getLogger(__name__)
 
 
 class WebsocketConnectionView:
-    """ :term:`view callable` for websocket connections. """
+    """
+    :term:`view callable` for websocket connections.
+
+    By default each message is handled before the next one is received.
+    Setting :attr:`concurrency` handles up to that many messages of a
+    connection at once; no more messages are received while the limit is
+    reached. Messages for which :meth:`message_key` returns the same key are
+    handled in the order they were received. Errors raised while handling
+    messages concurrently are logged and do not close the connection.
+
+    Setting :attr:`coalesce` to the options of a
+    :class:`~aiopyramid.websocket.coalesce.CoalescingSender` batches the
+    messages passed to :meth:`send`.
+    """
+
+    hub = default_hub
+    concurrency = None
+    coalesce = None
 
     def __init__(self, context, request):
         self.context = context
         self.request = request
+        self.topics = set()
+        self.sender = None
 
     @asyncio.coroutine
     def __call__(self, ws):
         self.ws = ws
-        yield from self.on_open()
-        while True:
-            message = yield from self.ws.recv()
-            if message is None:
-                yield from self.on_close()
-                break
+        if self.coalesce is not None:
+            self.sender = CoalescingSender(ws, **self.coalesce)
+        try:
+            yield from self.on_open()
+            if self.concurrency:
+                yield from self._receive_concurrently()
+                return
+            while True:
+                message = yield from self.ws.recv()
+                if message is None:
+                    yield from self.on_close()
+                    break
+                yield from self.on_message(message)
+        finally:
+            self.leave_all()
+            if self.sender is not None:
+                yield from self.sender.close()
+
+    @asyncio.coroutine
+    def _receive_concurrently(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = set()
+        # last task for each message key
+        tails = {}
+
+        def forget(key, task):
+            if tails.get(key) is task:
+                del tails[key]
+
+        try:
+            while True:
+                # stop reading from the socket while the limit is reached
+                yield from semaphore.acquire()
+                message = yield from self.ws.recv()
+                if message is None:
+                    semaphore.release()
+                    break
+                key = self.message_key(message)
+                previous = tails.get(key) if key is not None else None
+                task = asyncio.ensure_future(
+                    self._handle(message, previous, semaphore),
+                )
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                if key is not None:
+                    tails[key] = task
+                    task.add_done_callback(
+                        lambda task, key=key: forget(key, task),
+                    )
+            if pending:
+                yield from asyncio.wait(pending)
+            yield from self.on_close()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @asyncio.coroutine
+    def _handle(self, message, previous, semaphore):
+        try:
+            if previous is not None:
+                yield from asyncio.wait([previous])
             yield from self.on_message(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception('Error handling websocket message.')
+        finally:
+            semaphore.release()
+
+    def message_key(self, message):
+        """
+        Returns the key of `message` when messages are handled concurrently.
+        Messages with the same key are handled in order, messages with the
+        key `None` in any order. Default is `None` for all messages.
+        """
+        return None
 
     @asyncio.coroutine
-    def send(self, message):
+    def send(self, message, key=None):
+        """
+        Sends `message`, through :attr:`sender` if :attr:`coalesce` is set,
+        in which case a pending message with the same `key` is replaced.
+        """
+
+        if self.sender is not None:
+            self.sender.send(message, key)
+            return
         yield from self.ws.send(message)
 
+    def join(self, topic):
+        """ Subscribes the connection to `topic` on :attr:`hub`. """
+        self.topics.add(topic)
+        self.hub.join(topic, self.ws)
+
+    def leave(self, topic):
+        self.topics.discard(topic)
+        self.hub.leave(topic, self.ws)
+
+    def leave_all(self):
+        for topic in list(self.topics):
+            self.leave(topic)
+
+    def publish(self, topic, message):
+        """ Sends `message` to every connection subscribed to `topic`. """
+        return self.hub.publish(topic, message)
+
     @asyncio.coroutine
     def on_message(self, message):
         """
@@ -0,0 +1,74 @@
+"""
+Pyramid application driven by the load test harness in ``loadtest.py``.
+
+Each route exercises one of the code paths that ``Aiopyramid`` owns so that
+the harness can compare them under the same worker.
+"""
+
+import asyncio
+
+from pyramid.config import Configurator
+from pyramid.response import Response
+
+from aiopyramid.websocket.config import WebsocketMapper
+
+
+@asyncio.coroutine
+def coroutine_view(request):
+    yield from asyncio.sleep(0)
+    return Response(b'coroutine')
+
+
+def executor_view(request):
+    return Response(b'executor')
+
+
+def upload_view(request):
+    received = 0
+    while True:
+        chunk = request.body_file.read(65536)
+        if not chunk:
+            break
+        received += len(chunk)
+    return Response(str(received))
+
+
+_payloads = {}
+
+
+@asyncio.coroutine
+def download_view(request):
+    size = int(request.GET.get('size', 1048576))
+    try:
+        payload = _payloads[size]
+    except KeyError:
+        payload = _payloads[size] = b'x' * size
+    return Response(payload, content_type='application/octet-stream')
+
+
+@asyncio.coroutine
+def echo_view(ws):
+    while True:
+        message = yield from ws.recv()
+        if message is None:
+            break
+        yield from ws.send(message)
+
+
+def main(global_config=None, **settings):
+    config = Configurator(settings=settings)
+    config.include('aiopyramid')
+    config.add_route('coroutine', '/coroutine')
+    config.add_route('executor', '/executor')
+    config.add_route('upload', '/upload')
+    config.add_route('download', '/download')
+    config.add_route('echo', '/echo')
+    config.add_view(coroutine_view, route_name='coroutine')
+    config.add_view(executor_view, route_name='executor')
+    config.add_view(upload_view, route_name='upload')
+    config.add_view(download_view, route_name='download')
+    config.add_view(echo_view, route_name='echo', mapper=WebsocketMapper)
+    return config.make_wsgi_app()
+
+
+application = main()
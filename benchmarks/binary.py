@@ -0,0 +1,210 @@
+"""
+Copies and throughput of binary websocket messages.
+
+Sends messages of several sizes and types through
+:class:`~aiopyramid.websocket.config.gunicorn.AiohttpWebsocket` and the frame
+writer of aiohttp, and publishes them on a hub, into a transport that only
+counts bytes. Receives them with and without the ``use_bytes`` transcoding.
+For every case it reports the throughput in MB/s and the bytes allocated per
+frame relative to the size of the message, as traced with tracemalloc, which
+approximates the number of copies made of each message. Payloads of up to
+16 KiB are copied into their frame on purpose.
+
+::
+
+    python benchmarks/binary.py
+    python benchmarks/binary.py -s 1024 -s 1048576 -n 200
+"""
+
+import argparse
+import array
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from aiohttp import WSMessage, WSMsgType
+from aiohttp.http_websocket import WebSocketWriter
+from aiohttp.web import WebSocketResponse
+
+from aiopyramid.websocket.config.gunicorn import AiohttpWebsocket
+from aiopyramid.websocket.hub import Hub
+
+
+class Transport:
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def is_closing(self):
+        return False
+
+    def get_write_buffer_size(self):
+        return 0
+
+
+class Subscriber:
+
+    def __init__(self):
+        self.transport = Transport()
+
+
+class Stream:
+
+    def __init__(self):
+        self.transport = Transport()
+
+    @asyncio.coroutine
+    def drain(self):
+        pass
+
+
+class Frames:
+    """ Stands in for a websocket response that receives `message`. """
+
+    def __init__(self, message):
+        self.message = message
+
+    @asyncio.coroutine
+    def receive(self):
+        return self.message
+
+    @asyncio.coroutine
+    def close(self):
+        pass
+
+
+def _websocket(use_bytes=False):
+    response = WebSocketResponse(compress=False)
+    # skip the handshake, frames go straight to the counting transport
+    response._writer = WebSocketWriter(Stream())
+    return AiohttpWebsocket(response, None, use_bytes=use_bytes)
+
+
+def _payloads(size):
+    backing = bytearray(size * 2)
+    view = memoryview(backing)[size // 2:size // 2 + size]
+    return [
+        ('bytes', bytes(size)),
+        ('bytearray', bytearray(size)),
+        ('memoryview slice', view),
+        ('array', array.array('d', bytes(size - size % 8))),
+        # what callers had to do when only bytes were accepted
+        ('slice copied', view),
+    ]
+
+
+def _run(loop, operation, count):
+    """
+    Returns the bytes allocated by one `operation` and the time taken by
+    `count` of them.
+    """
+
+    @asyncio.coroutine
+    def repeat(times):
+        for _ in range(times):
+            yield from operation()
+
+    loop.run_until_complete(repeat(1))
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    loop.run_until_complete(repeat(1))
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    start = time.perf_counter()
+    loop.run_until_complete(repeat(count))
+    return peak, time.perf_counter() - start
+
+
+def measure_send(loop, name, payload, count):
+    ws = _websocket()
+    size = memoryview(payload).nbytes
+
+    @asyncio.coroutine
+    def send():
+        if name == 'slice copied':
+            yield from ws.send(bytes(payload))
+        else:
+            yield from ws.send(payload)
+
+    peak, elapsed = _run(loop, send, count)
+    return peak / size, size * count / elapsed / 1e6
+
+
+def measure_publish(loop, name, payload, count):
+    hub = Hub()
+    hub.join('benchmark', Subscriber())
+    size = memoryview(payload).nbytes
+    if name == 'slice copied':
+        message = payload
+    else:
+        message = None
+
+    @asyncio.coroutine
+    def publish():
+        if message is not None:
+            hub.publish('benchmark', bytes(message))
+        else:
+            hub.publish('benchmark', payload)
+
+    peak, elapsed = _run(loop, publish, count)
+    return peak / size, size * count / elapsed / 1e6
+
+
+def measure_recv(loop, size, count, use_bytes):
+    ws = _websocket(use_bytes)
+    if use_bytes:
+        ws.response = Frames(WSMessage(WSMsgType.TEXT, 'x' * size, None))
+    else:
+        ws.response = Frames(WSMessage(WSMsgType.BINARY, bytes(size), None))
+    peak, elapsed = _run(loop, ws.recv, count)
+    loop.run_until_complete(ws.close())
+    return peak / size, size * count / elapsed / 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '-s',
+        '--size',
+        type=int,
+        action='append',
+        help='message sizes in bytes, 1 KiB, 64 KiB and 1 MiB by default',
+    )
+    parser.add_argument('-n', '--count', type=int, default=500)
+    options = parser.parse_args(argv)
+    loop = asyncio.get_event_loop()
+    print('{:<8} {:<20} {:>14} {:>10}'.format(
+        'size', 'message', 'copies/frame', 'MB/s',
+    ))
+    for size in options.size or [1024, 65536, 1048576]:
+        for name, payload in _payloads(size):
+            copies, rate = measure_send(loop, name, payload, options.count)
+            print('{:<8} {:<20} {:>14.2f} {:>10.0f}'.format(
+                size, 'send ' + name, copies, rate,
+            ))
+        for name, payload in _payloads(size):
+            copies, rate = measure_publish(
+                loop,
+                name,
+                payload,
+                options.count,
+            )
+            print('{:<8} {:<20} {:>14.2f} {:>10.0f}'.format(
+                size, 'hub ' + name, copies, rate,
+            ))
+        for use_bytes in (True, False):
+            copies, rate = measure_recv(loop, size, options.count, use_bytes)
+            print('{:<8} {:<20} {:>14.2f} {:>10.0f}'.format(
+                size,
+                'recv use_bytes' if use_bytes else 'recv binary',
+                copies,
+                rate,
+            ))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Memory and bandwidth of permessage-deflate settings for websockets.
+
+Opens a number of simulated connections with
+:class:`~aiopyramid.websocket.compression.DeflateWriter`, sends the same
+JSON messages on each and reports, for every combination of window bits and
+context takeover, the bytes sent relative to the uncompressed messages, the
+time spent per message and the memory held per connection between messages
+as measured with tracemalloc.
+
+::
+
+    python benchmarks/compression.py
+    python benchmarks/compression.py -n 500 -w 9 -w 15 --threshold 256
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from aiopyramid.websocket.compression import DeflateWriter
+
+
+class Transport:
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+class Stream:
+
+    def __init__(self):
+        self.transport = Transport()
+
+    def drain(self):
+        pass
+
+
+def _messages(count, seed=0):
+    rng = random.Random(seed)
+    words = ['price', 'volume', 'bid', 'ask', 'symbol', 'venue', 'status']
+    messages = []
+    for i in range(count):
+        rows = [
+            {
+                word: rng.choice([rng.random(), rng.randrange(10 ** 6), word])
+                for word in rng.sample(words, 5)
+            }
+            for _ in range(rng.randrange(1, 20))
+        ]
+        messages.append(json.dumps({'seq': i, 'rows': rows}).encode())
+    return messages
+
+
+def measure(connections, messages, window_bits, notakeover, threshold):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    writers = [
+        DeflateWriter(
+            Stream(),
+            compress=window_bits,
+            notakeover=notakeover,
+            threshold=threshold,
+        )
+        for _ in range(connections)
+    ]
+    start = time.perf_counter()
+    for message in messages:
+        for writer in writers:
+            writer.send(message)
+    elapsed = time.perf_counter() - start
+    idle, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    raw = sum(len(message) for message in messages) * connections
+    sent = sum(writer.stream.transport.size for writer in writers)
+    return {
+        'window_bits': window_bits,
+        'context_takeover': not notakeover,
+        'ratio': sent / raw,
+        'us_per_message': elapsed / (len(messages) * connections) * 1e6,
+        'idle_bytes_per_connection': (idle - before) / connections,
+        'peak_bytes': peak - before,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--connections', type=int, default=200)
+    parser.add_argument('-m', '--messages', type=int, default=50)
+    parser.add_argument(
+        '-w',
+        '--window-bits',
+        type=int,
+        action='append',
+        help='window bits to measure, all of 9, 12 and 15 by default',
+    )
+    parser.add_argument('--threshold', type=int, default=128)
+    options = parser.parse_args(argv)
+    messages = _messages(options.messages)
+    print('{:>5} {:>9} {:>7} {:>10} {:>14} {:>12}'.format(
+        'wbits', 'takeover', 'ratio', 'us/msg', 'idle B/conn', 'peak KiB',
+    ))
+    for window_bits in options.window_bits or [9, 12, 15]:
+        for notakeover in (False, True):
+            result = measure(
+                options.connections,
+                messages,
+                window_bits,
+                notakeover,
+                options.threshold,
+            )
+            print('{:>5} {:>9} {:>7.3f} {:>10.1f} {:>14.0f} {:>12.0f}'.format(
+                result['window_bits'],
+                'yes' if result['context_takeover'] else 'no',
+                result['ratio'],
+                result['us_per_message'],
+                result['idle_bytes_per_connection'],
+                result['peak_bytes'] / 1024,
+            ))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
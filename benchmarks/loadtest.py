@@ -0,0 +1,447 @@
+"""
+Load test harness for ``Aiopyramid``.
+
+Starts the application in ``app.py`` under
+:class:`~aiopyramid.gunicorn.worker.AsyncGunicornWorker` on localhost and
+drives it with a small asyncio client at fixed concurrency levels. For every
+scenario and concurrency level the harness reports throughput, p50/p95/p99
+latency and the RSS of the worker processes sampled over time.
+
+::
+
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py -s coroutine -s websocket -c 1 -c 50
+    python benchmarks/loadtest.py --json baseline.json
+    python benchmarks/loadtest.py --compare baseline.json --tolerance 0.1
+
+When ``--compare`` is given, the exit status is 1 if the throughput of any
+scenario dropped by more than ``--tolerance`` relative to the baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKER_CLASS = 'aiopyramid.gunicorn.worker.AsyncGunicornWorker'
+
+
+class HTTPConnection:
+    """ Minimal HTTP/1.1 client that keeps its connection alive. """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    @asyncio.coroutine
+    def request(self, method, path, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = yield from asyncio.open_connection(
+                self.host,
+                self.port,
+            )
+        head = (
+            '{} {} HTTP/1.1\r\n'
+            'Host: {}:{}\r\n'
+            'Content-Length: {}\r\n'
+            '\r\n'
+        ).format(method, path, self.host, self.port, len(body))
+        self.writer.write(head.encode('latin-1'))
+        if body:
+            self.writer.write(body)
+        yield from self.writer.drain()
+        return (yield from self._read_response())
+
+    @asyncio.coroutine
+    def _read_response(self):
+        status_line = yield from self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Server closed the connection.')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = yield from self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            size = 0
+            while True:
+                line = yield from self.reader.readline()
+                chunk_size = int(line.split(b';')[0], 16)
+                if not chunk_size:
+                    yield from self.reader.readline()
+                    break
+                yield from self._discard(chunk_size + 2)
+                size += chunk_size
+        else:
+            size = int(headers.get('content-length', 0))
+            yield from self._discard(size)
+
+        if headers.get('connection') == 'close':
+            self.close()
+        return status, size
+
+    @asyncio.coroutine
+    def _discard(self, size):
+        while size:
+            data = yield from self.reader.read(min(size, 262144))
+            if not data:
+                raise ConnectionError('Truncated response body.')
+            size -= len(data)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class HTTPClient:
+    """ Repeats one HTTP request over a keep-alive connection. """
+
+    def __init__(self, host, port, method, path, body=b''):
+        self.connection = HTTPConnection(host, port)
+        self.method = method
+        self.path = path
+        self.body = body
+
+    @asyncio.coroutine
+    def step(self):
+        status, _ = yield from self.connection.request(
+            self.method,
+            self.path,
+            self.body,
+        )
+        if status != 200:
+            raise ValueError('Unexpected status {}.'.format(status))
+
+    def reset(self):
+        self.connection.close()
+
+    @asyncio.coroutine
+    def close(self):
+        self.connection.close()
+
+
+class WebsocketClient:
+    """ Sends a message over a websocket and waits for the echo. """
+
+    def __init__(self, host, port, path, message):
+        self.url = 'ws://{}:{}{}'.format(host, port, path)
+        self.message = message
+        self.ws = None
+
+    @asyncio.coroutine
+    def step(self):
+        import websockets
+
+        if self.ws is None:
+            self.ws = yield from websockets.connect(self.url)
+        yield from self.ws.send(self.message)
+        reply = yield from self.ws.recv()
+        if len(reply) != len(self.message):
+            raise ValueError('Echo does not match the message sent.')
+
+    def reset(self):
+        if self.ws is not None:
+            self.ws.writer.close()
+        self.ws = None
+
+    @asyncio.coroutine
+    def close(self):
+        if self.ws is not None:
+            yield from self.ws.close()
+        self.ws = None
+
+
+def _scenarios(options):
+    host, port = options.host, options.port
+    upload = b'x' * options.upload_size
+    message = 'x' * options.message_size
+    return {
+        'coroutine': lambda: HTTPClient(host, port, 'GET', '/coroutine'),
+        'executor': lambda: HTTPClient(host, port, 'GET', '/executor'),
+        'upload': lambda: HTTPClient(host, port, 'POST', '/upload', upload),
+        'download': lambda: HTTPClient(
+            host,
+            port,
+            'GET',
+            '/download?size={}'.format(options.download_size),
+        ),
+        'websocket': lambda: WebsocketClient(host, port, '/echo', message),
+    }
+
+
+SCENARIOS = ('coroutine', 'executor', 'upload', 'download', 'websocket')
+
+
+class GunicornServer:
+    """ Runs ``app.py`` under Gunicorn with the aiopyramid worker. """
+
+    def __init__(self, host, port, workers):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.process = None
+
+    def start(self, timeout=30):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            filter(None, [os.path.dirname(HERE), env.get('PYTHONPATH')])
+        )
+        self.process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn',
+                '--worker-class', WORKER_CLASS,
+                '--workers', str(self.workers),
+                '--bind', '{}:{}'.format(self.host, self.port),
+                '--chdir', HERE,
+                '--log-level', 'warning',
+                'app:application',
+            ],
+            env=env,
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('Gunicorn exited during startup.')
+            if len(self.worker_pids()) >= self.workers:
+                try:
+                    socket.create_connection((self.host, self.port)).close()
+                except OSError:
+                    pass
+                else:
+                    return
+            time.sleep(0.1)
+        self.stop()
+        raise RuntimeError('Gunicorn did not start in time.')
+
+    def worker_pids(self):
+        pid = self.process.pid
+        path = '/proc/{0}/task/{0}/children'.format(pid)
+        try:
+            with open(path) as children:
+                return [int(child) for child in children.read().split()]
+        except OSError:
+            return []
+
+    def rss(self):
+        """ Total resident set size of the workers in KiB. """
+        total = 0
+        for pid in self.worker_pids():
+            try:
+                with open('/proc/{}/status'.format(pid)) as status:
+                    for line in status:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1])
+            except OSError:
+                pass
+        return total or None
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@asyncio.coroutine
+def run_level(make_client, concurrency, duration, warmup, interval, server):
+    latencies = []
+    errors = 0
+    rss = []
+    start = time.perf_counter()
+    record_from = start + warmup
+    stop = record_from + duration
+
+    @asyncio.coroutine
+    def drive(client):
+        nonlocal errors
+        while True:
+            began = time.perf_counter()
+            if began >= stop:
+                break
+            try:
+                yield from client.step()
+            except Exception:
+                errors += 1
+                client.reset()
+            else:
+                if began >= record_from:
+                    latencies.append(time.perf_counter() - began)
+        yield from client.close()
+
+    @asyncio.coroutine
+    def sample():
+        while True:
+            now = time.perf_counter()
+            if now >= stop:
+                break
+            if server is not None:
+                rss.append((round(now - start, 3), server.rss()))
+            yield from asyncio.sleep(interval)
+
+    clients = [make_client() for _ in range(concurrency)]
+    yield from asyncio.gather(sample(), *[drive(c) for c in clients])
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / duration,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'rss': rss,
+    }
+
+
+def _ms(seconds):
+    return '-' if seconds is None else '{:.2f}'.format(seconds * 1000)
+
+
+def report(results, stream=sys.stdout):
+    header = '{:<10} {:>5} {:>9} {:>7} {:>10} {:>8} {:>8} {:>8} {:>9}'
+    stream.write(header.format(
+        'scenario', 'conc', 'requests', 'errors', 'req/s',
+        'p50 ms', 'p95 ms', 'p99 ms', 'rss MiB',
+    ) + '\n')
+    for result in results:
+        peak = max((kb for _, kb in result['rss'] if kb), default=None)
+        stream.write(header.format(
+            result['scenario'],
+            result['concurrency'],
+            result['requests'],
+            result['errors'],
+            '{:.1f}'.format(result['throughput']),
+            _ms(result['p50']),
+            _ms(result['p95']),
+            _ms(result['p99']),
+            '-' if peak is None else '{:.1f}'.format(peak / 1024),
+        ) + '\n')
+
+
+def compare(results, baseline, tolerance, stream=sys.stdout):
+    """ Returns the list of results that regressed against the baseline. """
+    previous = {
+        (result['scenario'], result['concurrency']): result
+        for result in baseline
+    }
+    regressions = []
+    for result in results:
+        old = previous.get((result['scenario'], result['concurrency']))
+        if old is None or not old['throughput']:
+            continue
+        change = result['throughput'] / old['throughput'] - 1
+        stream.write('{:<10} {:>5} {:+.1%}\n'.format(
+            result['scenario'],
+            result['concurrency'],
+            change,
+        ))
+        if change < -tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def _free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '-s', '--scenario', action='append', choices=SCENARIOS,
+        help='scenario to run, may be repeated (default: all)')
+    parser.add_argument(
+        '-c', '--concurrency', action='append', type=int,
+        help='number of concurrent clients, may be repeated '
+             '(default: 1, 10, 50)')
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument(
+        '--port', type=int,
+        help='port for the spawned server (default: any free port)')
+    parser.add_argument(
+        '--connect', action='store_true',
+        help='drive an already running server on --host/--port '
+             'instead of spawning one')
+    parser.add_argument('--rss-interval', type=float, default=0.5)
+    parser.add_argument('--upload-size', type=int, default=8 * 1048576)
+    parser.add_argument('--download-size', type=int, default=8 * 1048576)
+    parser.add_argument('--message-size', type=int, default=128)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='baseline results to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    options = parser.parse_args(argv)
+
+    if options.connect and options.port is None:
+        parser.error('--connect requires --port')
+    if options.port is None:
+        options.port = _free_port(options.host)
+
+    server = None
+    if not options.connect:
+        server = GunicornServer(options.host, options.port, options.workers)
+        server.start()
+
+    scenarios = _scenarios(options)
+    loop = asyncio.get_event_loop()
+    results = []
+    try:
+        for name in options.scenario or SCENARIOS:
+            for concurrency in options.concurrency or (1, 10, 50):
+                result = loop.run_until_complete(run_level(
+                    scenarios[name],
+                    concurrency,
+                    options.duration,
+                    options.warmup,
+                    options.rss_interval,
+                    server,
+                ))
+                result['scenario'] = name
+                results.append(result)
+    finally:
+        if server is not None:
+            server.stop()
+
+    report(results)
+
+    if options.json:
+        with open(options.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if options.compare:
+        with open(options.compare) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  options.tolerance)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
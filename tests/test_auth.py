@@ -69,3 +69,319 @@ class TestAuthentication:
             wrapped_policy,
             web_request,
         ))
+
+
+class TestAuthenticationCache:
+
+    @pytest.yield_fixture
+    def calls(self):
+        yield []
+
+    @pytest.yield_fixture
+    def policy_class(self):
+        from pyramid.authentication import CallbackAuthenticationPolicy
+
+        class TestAuthenticationPolicy(CallbackAuthenticationPolicy):
+            def __init__(self, callback):
+                self.callback = callback
+
+            def unauthenticated_userid(self, request):
+                return request.environ.get('userid', 'theone')
+
+            def remember(self, request, userid, **kw):
+                return [('Set-Cookie', userid)]
+
+            def forget(self, request):
+                return [('Set-Cookie', '')]
+
+        yield TestAuthenticationPolicy
+
+    @pytest.yield_fixture
+    def callback(self, calls):
+
+        @asyncio.coroutine
+        def callback(userid, request):
+            calls.append(userid)
+            yield from asyncio.sleep(0)
+            return ['group:' + userid]
+
+        yield callback
+
+    def run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(spawn_greenlet(func, *args))
+
+    def test_request_memo(self, policy_class, callback, calls, web_request):
+        from aiopyramid.auth import authn_policy_factory
+        policy = authn_policy_factory(policy_class, callback)
+
+        def check(request):
+            for _ in range(3):
+                policy.effective_principals(request)
+                policy.authenticated_userid(request)
+
+        self.run(check, web_request)
+        assert calls == ['theone', 'theone']
+        self.run(check, testing.DummyRequest())
+        assert len(calls) == 4
+
+    def test_memo_in_coroutine(self, policy_class, callback, calls):
+        from aiopyramid.auth import authn_policy_factory
+        policy = authn_policy_factory(policy_class, callback)
+        request = testing.DummyRequest()
+
+        @asyncio.coroutine
+        def check():
+            first = yield from policy.effective_principals(request)
+            cached = policy.effective_principals(request)
+            assert isinstance(cached, asyncio.Future)
+            assert (yield from cached) is first
+
+        asyncio.get_event_loop().run_until_complete(check())
+        assert calls == ['theone']
+
+    def test_principals_cache(self, policy_class, callback, calls):
+        from aiopyramid.auth import authn_policy_factory
+        from aiopyramid.cache import LRUCache
+        policy = authn_policy_factory(
+            policy_class,
+            callback,
+            principals_cache=LRUCache(maxsize=10, ttl=60),
+        )
+
+        for _ in range(3):
+            out = self.run(
+                policy.effective_principals,
+                testing.DummyRequest(),
+            )
+        assert 'group:theone' in out
+        assert calls == ['theone']
+
+        other = testing.DummyRequest(environ={'userid': 'other'})
+        self.run(policy.effective_principals, other)
+        assert calls == ['theone', 'other']
+
+        policy.invalidate('theone')
+        self.run(policy.effective_principals, testing.DummyRequest())
+        assert calls == ['theone', 'other', 'theone']
+
+    def test_forget_invalidates(self, policy_class, callback, calls):
+        from aiopyramid.auth import authn_policy_factory
+        from aiopyramid.cache import LRUCache
+        policy = authn_policy_factory(
+            policy_class,
+            callback,
+            principals_cache=LRUCache(),
+        )
+        request = testing.DummyRequest()
+
+        def logout(request):
+            policy.effective_principals(request)
+            headers = policy.forget(request)
+            policy.effective_principals(request)
+            return headers
+
+        assert self.run(logout, request) == [('Set-Cookie', '')]
+        assert calls == ['theone', 'theone']
+
+    def test_basic_auth_credentials_checked(self):
+        import base64
+        from pyramid.authentication import BasicAuthAuthenticationPolicy
+        from aiopyramid.auth import CoroutineAuthenticationPolicyProxy
+        from aiopyramid.cache import LRUCache
+        checks = []
+
+        @asyncio.coroutine
+        def check(username, password, request):
+            checks.append(username)
+            yield from asyncio.sleep(0)
+            if password == 'secret':
+                return ['group:' + username]
+
+        policy = CoroutineAuthenticationPolicyProxy(
+            BasicAuthAuthenticationPolicy(synchronize(check)),
+            principals_cache=LRUCache(),
+        )
+
+        def login(password):
+            credentials = base64.b64encode(
+                ('alice:' + password).encode('utf-8'),
+            ).decode('ascii')
+            request = testing.DummyRequest(
+                headers={'Authorization': 'Basic ' + credentials},
+            )
+            return self.run(policy.authenticated_userid, request)
+
+        assert login('wrong') is None
+        # failures are not cached
+        assert login('secret') == 'alice'
+        assert login('wrong') is None
+        assert login('secret') == 'alice'
+        assert checks == ['alice', 'alice', 'alice']
+
+
+class TestSecurityPolicy:
+
+    @pytest.yield_fixture
+    def calls(self):
+        yield []
+
+    @pytest.yield_fixture
+    def policy(self, calls):
+        from aiopyramid.auth import CoroutineSecurityPolicyProxy
+
+        class TestSecurityPolicy:
+
+            @asyncio.coroutine
+            def identity(self, request):
+                calls.append('identity')
+                yield from asyncio.sleep(0)
+                return {'userid': 'theone'}
+
+            @asyncio.coroutine
+            def authenticated_userid(self, request):
+                identity = yield from self.identity(request)
+                return identity['userid']
+
+            @asyncio.coroutine
+            def permits(self, request, context, permission):
+                calls.append(permission)
+                yield from asyncio.sleep(0)
+                return permission == 'view'
+
+            def remember(self, request, userid, **kw):
+                return [('Set-Cookie', userid)]
+
+            def forget(self, request, **kw):
+                return [('Set-Cookie', '')]
+
+        yield CoroutineSecurityPolicyProxy(TestSecurityPolicy())
+
+    def test_in_coroutine(self, policy, calls, web_request):
+
+        @asyncio.coroutine
+        def check():
+            pending = policy.identity(web_request)
+            assert asyncio.iscoroutine(pending)
+            assert (yield from pending) == {'userid': 'theone'}
+            assert (yield from policy.identity(web_request))['userid']
+            assert (yield from policy.permits(web_request, None, 'view'))
+            assert not (yield from policy.permits(web_request, None, 'edit'))
+            headers = yield from policy.remember(web_request, 'theone')
+            assert headers == [('Set-Cookie', 'theone')]
+
+        asyncio.get_event_loop().run_until_complete(check())
+        assert calls == ['identity', 'view', 'edit']
+
+    def test_in_sync(self, policy, calls, web_request):
+
+        def check(request):
+            assert policy.authenticated_userid(request) == 'theone'
+            assert policy.authenticated_userid(request) == 'theone'
+            assert policy.permits(request, None, 'view')
+            assert policy.forget(request) == [('Set-Cookie', '')]
+            assert policy.identity(request) == {'userid': 'theone'}
+
+        asyncio.get_event_loop().run_until_complete(
+            spawn_greenlet(check, web_request),
+        )
+        assert calls == ['identity', 'view', 'identity']
+
+
+class TestHasPermissions:
+
+    @pytest.yield_fixture
+    def config(self):
+        from pyramid.authorization import ACLAuthorizationPolicy
+        config = testing.setUp()
+        config.set_authorization_policy(ACLAuthorizationPolicy())
+        yield config
+        testing.tearDown()
+
+    @pytest.yield_fixture
+    def resources(self):
+        from pyramid.security import Allow, Deny, Everyone
+
+        class Root:
+            __name__ = ''
+            __parent__ = None
+            __acl__ = [(Allow, 'group:editors', 'edit')]
+
+        class Item:
+            lookups = []
+            in_flight = [0, 0]
+
+            def __init__(self, name, parent, private=False):
+                self.__name__ = name
+                self.__parent__ = parent
+                self.private = private
+
+            @synchronize
+            @asyncio.coroutine
+            def __acl__(self):
+                self.lookups.append(self.__name__)
+                self.in_flight[0] += 1
+                self.in_flight[1] = max(self.in_flight)
+                yield from asyncio.sleep(0.01)
+                self.in_flight[0] -= 1
+                if self.private:
+                    return [(Deny, Everyone, 'view')]
+                return [(Allow, Everyone, 'view')]
+
+        root = Root()
+        items = [Item(str(i), root, private=i % 3 == 0) for i in range(12)]
+        yield root, items
+
+    def run(self, coroutine):
+        return asyncio.get_event_loop().run_until_complete(coroutine)
+
+    def test_acl(self, config, resources):
+        from pyramid.authentication import RemoteUserAuthenticationPolicy
+        from aiopyramid.auth import authn_policy_factory, has_permissions
+
+        @asyncio.coroutine
+        def callback(userid, request):
+            return ['group:editors']
+
+        config.set_authentication_policy(authn_policy_factory(
+            RemoteUserAuthenticationPolicy,
+            callback,
+        ))
+        root, items = resources
+        request = testing.DummyRequest(environ={'REMOTE_USER': 'theone'})
+        checks = [('view', item) for item in items]
+        checks += [('edit', items[0]), ('delete', items[1])]
+
+        out = self.run(has_permissions(request, checks, limit=4))
+
+        assert out == [i % 3 != 0 for i in range(12)] + [True, False]
+        assert sorted(items[0].lookups, key=int) == [
+            str(i) for i in range(12)
+        ]
+        assert items[0].in_flight[1] == 4
+
+    def test_no_authentication_policy(self, config, resources):
+        from aiopyramid.auth import has_permissions
+        root, items = resources
+        request = testing.DummyRequest()
+        out = self.run(has_permissions(request, [('view', items[0])]))
+        assert out == [True]
+
+    def test_custom_authorization_policy(self, config, resources):
+        from pyramid.authentication import RemoteUserAuthenticationPolicy
+        from aiopyramid.auth import has_permissions
+
+        class Policy:
+            def permits(self, context, principals, permission):
+                return 'theone' in principals and permission == 'view'
+
+        config.set_authentication_policy(RemoteUserAuthenticationPolicy())
+        config.set_authorization_policy(Policy())
+        root, items = resources
+        request = testing.DummyRequest(environ={'REMOTE_USER': 'theone'})
+        request.context = items[0]
+        out = self.run(has_permissions(
+            request,
+            [('view', None), ('edit', items[1])],
+        ))
+        assert out == [True, False]
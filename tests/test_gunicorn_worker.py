@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+
+from aiohttp import test_utils
+from aiohttp.web import Application
+from pyramid.config import Configurator
+
+from aiopyramid.gunicorn.worker import AiopyramidWSGIHandler
+from aiopyramid.streaming import StreamingResponse
+from aiopyramid.websocket.view import WebsocketConnectionView
+
+try:
+    from aiopyramid.websocket.config.gunicorn import (
+        AiohttpWebsocket,
+        WebsocketMapper,
+    )
+except SyntaxError:
+    # websockets releases before 4.0 do not parse on Python 3.7
+    WebsocketMapper = None
+
+
+class GatedChunks:
+    """ Produces a first chunk, then waits to be released for the rest. """
+
+    def __init__(self):
+        self.released = asyncio.Future()
+        self.produced = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        if self.produced == 1:
+            yield from self.released
+        if self.produced >= 2:
+            raise StopAsyncIteration
+        self.produced += 1
+        return 'chunk {}\n'.format(self.produced).encode()
+
+    @asyncio.coroutine
+    def aclose(self):
+        self.closed = True
+
+
+class TestWorkerHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.config = Configurator()
+        self.config.include('aiopyramid')
+
+    def _client(self):
+        app = Application(loop=self.loop)
+        app.router.add_route(
+            '*',
+            '/{path_info:.*}',
+            AiopyramidWSGIHandler(
+                self.config.make_wsgi_app(),
+                loop=self.loop,
+            ),
+        )
+        client = test_utils.TestClient(
+            test_utils.TestServer(app),
+            loop=self.loop,
+        )
+        self.loop.run_until_complete(client.start_server())
+        self.addCleanup(self.loop.run_until_complete, client.close())
+        return client
+
+    def test_streaming_response_written_per_chunk(self):
+        chunks = GatedChunks()
+
+        @asyncio.coroutine
+        def stream_view(request):
+            return StreamingResponse(chunks, content_type='text/plain')
+
+        self.config.add_route('stream', '/stream')
+        self.config.add_view(stream_view, route_name='stream')
+        client = self._client()
+
+        @asyncio.coroutine
+        def first_chunk():
+            response = yield from client.get('/stream')
+            self.assertEqual(response.status, 200)
+            return response, (yield from response.content.readline())
+
+        @asyncio.coroutine
+        def fetch():
+            # arrives while the body still waits for the second chunk
+            response, first = yield from asyncio.wait_for(first_chunk(), 5)
+            chunks.released.set_result(None)
+            rest = yield from response.content.read()
+            return first, rest
+
+        first, rest = self.loop.run_until_complete(fetch())
+        self.assertEqual(first, b'chunk 1\n')
+        self.assertEqual(rest, b'chunk 2\n')
+        self.assertTrue(chunks.closed)
+
+    @unittest.skipIf(WebsocketMapper is None, 'websockets does not import')
+    def test_websocket_served_natively(self):
+        served = []
+
+        class EchoView(WebsocketConnectionView):
+            __view_mapper__ = WebsocketMapper
+
+            @asyncio.coroutine
+            def on_message(self, message):
+                served.append(self.ws)
+                yield from self.send(message)
+
+        self.config.add_route('ws', '/ws')
+        self.config.add_view(EchoView, route_name='ws')
+        client = self._client()
+
+        @asyncio.coroutine
+        def echo():
+            ws = yield from client.ws_connect('/ws')
+            yield from ws.send_str('hello')
+            message = yield from asyncio.wait_for(ws.receive(), 5)
+            yield from ws.close()
+            return message.data
+
+        self.assertEqual(self.loop.run_until_complete(echo()), 'hello')
+        self.assertEqual(len(served), 1)
+        self.assertIsInstance(served[0], AiohttpWebsocket)
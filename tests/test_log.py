@@ -0,0 +1,158 @@
+import logging
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+
+class _CollectingHandler(logging.Handler):
+
+    def __init__(self, gate=None):
+        super().__init__()
+        self.records = []
+        self.flushes = 0
+        self.gate = gate
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait()
+        self.records.append(self.format(record))
+
+    def flush(self):
+        self.flushes += 1
+
+
+class TestBatchingHandler(unittest.TestCase):
+
+    def _logger(self, handler):
+        logger = logging.getLogger('aiopyramid.tests.{}'.format(id(handler)))
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_batches(self):
+        from aiopyramid.log import batch_logger
+
+        target = _CollectingHandler()
+        logger = self._logger(target)
+        handler = batch_logger(logger, batch_size=10, flush_interval=10)
+        self.addCleanup(handler.close)
+        self.assertEqual(logger.handlers, [handler])
+
+        for i in range(25):
+            logger.info('message %s', i)
+        handler.flush(timeout=5)
+
+        self.assertEqual(target.records, [
+            'message {}'.format(i) for i in range(25)
+        ])
+        self.assertLess(target.flushes, 25)
+        self.assertEqual(handler.written, 25)
+        self.assertEqual(handler.dropped, 0)
+
+    def test_one_writer_thread(self):
+        from aiopyramid.log import BatchingHandler
+
+        target = _CollectingHandler()
+        handler = BatchingHandler(target, flush_interval=0.01)
+        self.addCleanup(handler.close)
+        logger = self._logger(handler)
+        started = []
+        run = handler._run
+
+        def counting_run():
+            started.append(threading.current_thread())
+            run()
+
+        handler._run = counting_run
+        barrier = threading.Barrier(8)
+
+        def log():
+            barrier.wait()
+            for i in range(50):
+                logger.info('message %s', i)
+
+        getpid = os.getpid
+
+        def slow_getpid():
+            # widens the window between checking and starting the thread
+            time.sleep(0.001)
+            return getpid()
+
+        threads = [threading.Thread(target=log) for _ in range(8)]
+        with mock.patch('os.getpid', slow_getpid):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        handler.flush(timeout=5)
+
+        self.assertEqual(len(started), 1)
+        self.assertEqual(len(target.records), 400)
+        self.assertEqual(handler.written, 400)
+
+    def test_exception_text(self):
+        from aiopyramid.log import BatchingHandler
+
+        target = _CollectingHandler()
+        target.setFormatter(logging.Formatter('%(message)s|%(exc_text)s'))
+        handler = BatchingHandler(target, flush_interval=0.01)
+        self.addCleanup(handler.close)
+        logger = self._logger(handler)
+        try:
+            raise KeyError('missing')
+        except KeyError:
+            logger.exception('failed')
+        handler.flush(timeout=5)
+
+        self.assertTrue(target.records[0].startswith('failed|Traceback'))
+
+    def test_drop_on_overflow(self):
+        from aiopyramid.log import BatchingHandler
+
+        gate = threading.Event()
+        target = _CollectingHandler(gate)
+        handler = BatchingHandler(
+            target,
+            capacity=5,
+            batch_size=1,
+            flush_interval=0.01,
+        )
+        self.addCleanup(handler.close)
+        logger = self._logger(handler)
+
+        logger.info('first')
+        # wait for the writer to pick up the first record and block on it
+        while handler._pending and handler._buffer:
+            pass
+        for i in range(10):
+            logger.info('message %s', i)
+        self.assertEqual(handler.dropped, 5)
+
+        gate.set()
+        handler.flush(timeout=5)
+        self.assertEqual(len(target.records), 6)
+
+    def test_block_on_overflow(self):
+        from aiopyramid.log import BatchingHandler
+
+        target = _CollectingHandler()
+        handler = BatchingHandler(
+            target,
+            capacity=2,
+            batch_size=2,
+            flush_interval=0.01,
+            overflow='block',
+        )
+        self.addCleanup(handler.close)
+        logger = self._logger(handler)
+
+        for i in range(20):
+            logger.info('message %s', i)
+        handler.flush(timeout=5)
+
+        self.assertEqual(len(target.records), 20)
+        self.assertEqual(handler.dropped, 0)
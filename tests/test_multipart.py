@@ -0,0 +1,129 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+
+from pyramid.httpexceptions import HTTPBadRequest, HTTPRequestEntityTooLarge
+from pyramid.request import Request
+
+from aiopyramid.multipart import MultipartReader
+
+BOUNDARY = 'xXxBoundaryxXx'
+
+
+def make_request(parts, preamble=b''):
+    body = preamble
+    for headers, data in parts:
+        body += b'--' + BOUNDARY.encode() + b'\r\n'
+        for header in headers:
+            body += header.encode() + b'\r\n'
+        body += b'\r\n' + data + b'\r\n'
+    body += b'--' + BOUNDARY.encode() + b'--\r\n'
+    return Request.blank(
+        '/',
+        method='POST',
+        body=body,
+        content_type='multipart/form-data; boundary=' + BOUNDARY,
+    )
+
+
+class TestMultipartReader(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.upload = os.urandom(100000) + b'\r\n--' + BOUNDARY.encode()[:5]
+        self.request = make_request([
+            (['Content-Disposition: form-data; name="title"'], b'hello'),
+            ([
+                'Content-Disposition: form-data; name="file"; '
+                'filename="data.bin"',
+                'Content-Type: application/octet-stream',
+            ], self.upload),
+            (['Content-Disposition: form-data; name="after"'], b'bye'),
+        ], preamble=b'ignored preamble\r\n')
+
+    def run_reader(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_parts(self):
+        reader = MultipartReader(self.request, chunk_size=1000)
+
+        @asyncio.coroutine
+        def read_all():
+            out = []
+            while True:
+                part = yield from reader.next_part()
+                if part is None:
+                    return out
+                data = yield from part.read()
+                out.append((part.name, part.filename, data))
+
+        out = self.run_reader(read_all())
+        self.assertEqual(out, [
+            ('title', None, b'hello'),
+            ('file', 'data.bin', self.upload),
+            ('after', None, b'bye'),
+        ])
+
+    def test_save_and_skip(self):
+        reader = MultipartReader(self.request, chunk_size=4096)
+        sink = io.BytesIO()
+
+        @asyncio.coroutine
+        def save():
+            title = yield from reader.next_part()
+            part = yield from reader.next_part()
+            size = yield from part.save(sink)
+            last = yield from reader.next_part()
+            return title.name, size, (yield from last.text())
+
+        name, size, text = self.run_reader(save())
+        self.assertEqual(
+            (name, size, text),
+            ('title', len(self.upload), 'bye'),
+        )
+        self.assertEqual(sink.getvalue(), self.upload)
+
+    def test_save_to_path(self):
+        reader = MultipartReader(self.request)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'upload')
+
+            @asyncio.coroutine
+            def save():
+                yield from reader.next_part()
+                part = yield from reader.next_part()
+                yield from part.save(path)
+
+            self.run_reader(save())
+            with open(path, 'rb') as saved:
+                self.assertEqual(saved.read(), self.upload)
+
+    def test_part_limit(self):
+        reader = MultipartReader(self.request, max_part_size=1000)
+
+        @asyncio.coroutine
+        def read_file():
+            yield from reader.next_part()
+            part = yield from reader.next_part()
+            yield from part.read()
+
+        with self.assertRaises(HTTPRequestEntityTooLarge):
+            self.run_reader(read_file())
+
+    def test_truncated(self):
+        self.request.body = self.request.body[:-200]
+        reader = MultipartReader(self.request)
+
+        @asyncio.coroutine
+        def read_all():
+            while (yield from reader.next_part()) is not None:
+                pass
+
+        with self.assertRaises(HTTPBadRequest):
+            self.run_reader(read_all())
+
+    def test_not_multipart(self):
+        with self.assertRaises(HTTPBadRequest):
+            MultipartReader(Request.blank('/', POST={'a': '1'}))
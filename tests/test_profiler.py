@@ -0,0 +1,64 @@
+import asyncio
+import time
+import unittest
+
+from aiopyramid.helpers import spawn_greenlet, synchronize
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_merges_greenlet_and_coroutine_stacks(self):
+        from aiopyramid.profiler import SamplingProfiler
+
+        @synchronize
+        @asyncio.coroutine
+        def _busy_coroutine():
+            for _ in range(10):
+                time.sleep(0.01)
+                yield from asyncio.sleep(0)
+
+        def _request_greenlet():
+            return _busy_coroutine()
+
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        try:
+            self.loop.run_until_complete(spawn_greenlet(_request_greenlet))
+        finally:
+            profiler.stop()
+
+        self.assertTrue(profiler.samples)
+        merged = [
+            stack for stack in profiler.stacks
+            if any(label.startswith('_busy_coroutine ') for label in stack)
+        ]
+        self.assertTrue(merged)
+        for stack in merged:
+            names = [label.split(' ', 1)[0] for label in stack]
+            # the greenlet is the root of the logical trace
+            self.assertEqual(names[0], '_request_greenlet')
+            self.assertNotIn('run_until_complete', names)
+            self.assertLess(
+                names.index('_wrapped_coroutine'),
+                names.index('_busy_coroutine'),
+            )
+
+    def test_collapsed_output(self):
+        from aiopyramid.profiler import SamplingProfiler
+
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        time.sleep(0.05)
+        profiler.stop()
+
+        lines = list(profiler.collapsed())
+        self.assertTrue(lines)
+        total = 0
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack)
+            total += int(count)
+        self.assertEqual(total, profiler.samples)
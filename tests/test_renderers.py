@@ -0,0 +1,91 @@
+import asyncio
+import json
+import threading
+import unittest
+
+from pyramid import testing
+from pyramid.renderers import JSON, RendererHelper
+
+from aiopyramid.helpers import spawn_greenlet
+from aiopyramid.renderers import OffloadingRendererFactory
+
+
+class TestOffloadingRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.loop = asyncio.get_event_loop()
+        self.threads = []
+        json_factory = JSON()
+
+        def tracking_factory(info):
+            renderer = json_factory(info)
+
+            def _render(value, system):
+                self.threads.append(threading.current_thread())
+                return renderer(value, system)
+            return _render
+
+        self.factory = OffloadingRendererFactory(
+            tracking_factory,
+            min_items=10,
+            min_duration=None,
+        )
+        self.config.add_renderer('offload', self.factory)
+        self.helper = RendererHelper(
+            'offload',
+            registry=self.config.registry,
+        )
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _render(self, value):
+        request = testing.DummyRequest()
+        return self.loop.run_until_complete(spawn_greenlet(
+            self.helper.render,
+            value,
+            None,
+            request,
+        ))
+
+    def test_small_inline(self):
+        out = self._render([1, 2, 3])
+        self.assertEqual(json.loads(out), [1, 2, 3])
+        self.assertIs(self.threads[0], threading.current_thread())
+
+    def test_large_in_executor(self):
+        value = list(range(100))
+        out = self._render(value)
+        self.assertEqual(json.loads(out), value)
+        self.assertIsNot(self.threads[0], threading.current_thread())
+
+    def test_slow_renderer_in_executor(self):
+        self.factory.min_items = None
+        self.factory.min_duration = 1e-9
+        self._render({'a': 1})
+        self._render({'a': 1})
+        self.assertIs(self.threads[0], threading.current_thread())
+        self.assertIsNot(self.threads[1], threading.current_thread())
+
+    def test_async_renderer(self):
+
+        def async_factory(info):
+            @asyncio.coroutine
+            def _render(value, system):
+                yield from asyncio.sleep(0)
+                return 'async {}'.format(value['name'])
+            return _render
+
+        self.config.add_renderer(
+            'async',
+            OffloadingRendererFactory(async_factory),
+        )
+        helper = RendererHelper('async', registry=self.config.registry)
+        out = self.loop.run_until_complete(spawn_greenlet(
+            helper.render,
+            {'name': 'value'},
+            None,
+            testing.DummyRequest(),
+        ))
+        self.assertEqual(out, 'async value')
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import unittest
+
+from pyramid.request import Request
+
+from aiopyramid.helpers import spawn_greenlet
+
+
+class TestLazyBody(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_body_not_parsed(self):
+        from aiopyramid.config import CoroutineOrExecutorMapper
+
+        @asyncio.coroutine
+        def view(request):
+            return request.body
+
+        mapped = CoroutineOrExecutorMapper()(view)
+        request = Request.blank('/', POST={'a': '1'})
+        out = self.loop.run_until_complete(
+            spawn_greenlet(mapped, None, request),
+        )
+        self.assertEqual(out, b'a=1')
+        self.assertNotIn('webob._parsed_post_vars', request.environ)
+        self.assertTrue(request.is_body_seekable)
+
+    def test_stream_not_copied(self):
+        from aiopyramid.config import CoroutineOrExecutorMapper
+
+        class Stream:
+            """ Input that can only be read once, like uWSGI's. """
+
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, size=-1):
+                data, self.data = self.data, b''
+                return data
+
+        @asyncio.coroutine
+        def view(request):
+            return request.body_file_raw
+
+        mapped = CoroutineOrExecutorMapper()(view)
+        stream = Stream(b'a=1')
+        request = Request.blank('/', method='POST')
+        request.environ.update({
+            'wsgi.input': stream,
+            'CONTENT_LENGTH': '3',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'webob.is_body_seekable': False,
+        })
+        out = self.loop.run_until_complete(
+            spawn_greenlet(mapped, None, request),
+        )
+        self.assertIs(out, stream)
+        self.assertEqual(stream.data, b'a=1')
+        self.assertFalse(request.is_body_seekable)
+
+    def test_aio_params(self):
+        from aiopyramid.request import aio_params
+        request = Request.blank('/?b=2', POST={'a': '1'})
+        params = self.loop.run_until_complete(aio_params(request))
+        self.assertEqual(params['a'], '1')
+        self.assertEqual(params['b'], '2')
+
+    def test_aio_params_in_executor(self):
+        from aiopyramid.request import aio_params
+        threads = []
+
+        class Tracking(Request):
+            @property
+            def POST(self):
+                threads.append(threading.current_thread())
+                return super().POST
+
+        request = Tracking.blank('/', POST={'a': 'x' * 100})
+        params = self.loop.run_until_complete(
+            aio_params(request, threshold=10),
+        )
+        self.assertEqual(params['a'], 'x' * 100)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_aio_json(self):
+        from aiopyramid.request import aio_json
+        request = Request.blank(
+            '/',
+            method='POST',
+            body=json.dumps({'a': [1, 2]}).encode(),
+            content_type='application/json',
+        )
+        data = self.loop.run_until_complete(aio_json(request, threshold=0))
+        self.assertEqual(data, {'a': [1, 2]})
+        again = self.loop.run_until_complete(aio_json(request))
+        self.assertIs(again, data)
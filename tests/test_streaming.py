@@ -0,0 +1,198 @@
+import asyncio
+import json
+import unittest
+
+from pyramid import testing
+from pyramid.renderers import RendererHelper
+
+from aiopyramid.helpers import spawn_greenlet
+from aiopyramid.streaming import (
+    AsyncAppIter,
+    JSONStream,
+    NDJSONStream,
+    StreamingResponse,
+)
+
+
+class Rows:
+    """ Asynchronous iterable that pauses before every row. """
+
+    def __init__(self, count):
+        self.count = count
+        self.produced = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        yield from asyncio.sleep(0)
+        if self.closed or self.produced >= self.count:
+            raise StopAsyncIteration
+        self.produced += 1
+        return {'id': self.produced}
+
+    @asyncio.coroutine
+    def aclose(self):
+        self.closed = True
+
+
+class TestAsyncAppIter(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def _collect(self, app_iter):
+        chunks = []
+
+        @asyncio.coroutine
+        def collect():
+            while True:
+                try:
+                    chunks.append((yield from app_iter.__anext__()))
+                except StopAsyncIteration:
+                    return chunks
+
+        return self.loop.run_until_complete(collect())
+
+    def test_async_iteration(self):
+        out = self._collect(AsyncAppIter(['a', b'b']))
+        self.assertEqual(out, [b'a', b'b'])
+
+    def test_sync_iteration_in_greenlet(self):
+        rows = Rows(3)
+        response = StreamingResponse(rows)
+        app_iter = response.app_iter
+        self.assertIsInstance(app_iter, AsyncAppIter)
+
+        def consume():
+            out = [row['id'] for row in app_iter]
+            app_iter.close()
+            return out
+
+        out = self.loop.run_until_complete(spawn_greenlet(consume))
+        self.assertEqual(out, [1, 2, 3])
+        self.assertTrue(rows.closed)
+
+    def test_close_stops_source(self):
+        rows = Rows(10)
+        app_iter = AsyncAppIter(rows)
+        self.loop.run_until_complete(app_iter.__anext__())
+        self.loop.run_until_complete(app_iter.aclose())
+        self.assertTrue(rows.closed)
+
+
+class TestStreamRenderers(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.add_renderer('jsonstream', JSONStream(chunk_size=20))
+        self.config.add_renderer('ndjson', NDJSONStream())
+        self.loop = asyncio.get_event_loop()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _render(self, name, value):
+        request = testing.DummyRequest()
+        helper = RendererHelper(name, registry=self.config.registry)
+        response = helper.render_to_response(value, None, request)
+        chunks = []
+
+        @asyncio.coroutine
+        def collect():
+            while True:
+                try:
+                    chunks.append((yield from response.app_iter.__anext__()))
+                except StopAsyncIteration:
+                    return response, chunks
+
+        return self.loop.run_until_complete(collect())
+
+    def test_json_array(self):
+        response, chunks = self._render('jsonstream', Rows(5))
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(
+            json.loads(b''.join(chunks).decode()),
+            [{'id': i} for i in range(1, 6)],
+        )
+
+    def test_empty_json_array(self):
+        response, chunks = self._render('jsonstream', Rows(0))
+        self.assertEqual(b''.join(chunks), b'[]')
+
+    def test_ndjson(self):
+        response, chunks = self._render('ndjson', Rows(3))
+        self.assertEqual(response.content_type, 'application/x-ndjson')
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{'id': i} for i in range(1, 4)],
+        )
+
+    def test_sync_iterable(self):
+        response, chunks = self._render('jsonstream', range(3))
+        self.assertEqual(b''.join(chunks), b'[0,1,2]')
+
+
+class TestEventStream(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def _take(self, app_iter, count):
+
+        @asyncio.coroutine
+        def take():
+            out = []
+            for _ in range(count):
+                try:
+                    out.append((yield from app_iter.__anext__()))
+                except StopAsyncIteration:
+                    break
+            return out
+
+        return self.loop.run_until_complete(take())
+
+    def test_events(self):
+        from aiopyramid.streaming import Event, EventStreamResponse
+        response = EventStreamResponse(
+            [
+                'hello\nworld',
+                Event({'a': 1}, event='update', id=7),
+                Event('bye', retry=10),
+            ],
+            heartbeat=None,
+            retry=1000,
+        )
+        self.assertEqual(response.content_type, 'text/event-stream')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        out = self._take(response.app_iter, 10)
+        self.assertEqual(out, [
+            b'retry: 1000\n\n',
+            b'data: hello\ndata: world\n\n',
+            b'event: update\nid: 7\ndata: {"a": 1}\n\n',
+            b'retry: 10\ndata: bye\n\n',
+        ])
+
+    def test_heartbeat_and_close(self):
+        from aiopyramid.streaming import EventStreamResponse
+        rows = Rows(5)
+        rows.__anext__ = self._slow(rows.__anext__)
+        response = EventStreamResponse(rows, heartbeat=0.01)
+        out = self._take(response.app_iter, 4)
+        self.assertIn(b':\n\n', out)
+        self.assertIn(b'data: {"id": 1}\n\n', out)
+        self.loop.run_until_complete(response.app_iter.aclose())
+        self.assertTrue(rows.closed)
+
+    def _slow(self, anext):
+
+        @asyncio.coroutine
+        def slow():
+            yield from asyncio.sleep(0.025)
+            return (yield from anext())
+
+        return slow
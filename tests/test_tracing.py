@@ -0,0 +1,119 @@
+import asyncio
+import sys
+import threading
+import unittest
+
+from aiopyramid.helpers import spawn_greenlet, synchronize, use_executor
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'requires contextvars')
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        from aiopyramid import tracing
+
+        self.loop = asyncio.get_event_loop()
+        self.exporter = tracing.InMemoryExporter()
+        tracing.set_exporter(self.exporter)
+        self.addCleanup(tracing.set_exporter, None)
+
+    def test_request_id_crosses_bridges(self):
+        from aiopyramid.tracing import request_id
+
+        seen = {}
+
+        @use_executor
+        def _in_thread():
+            seen['thread'] = (request_id.get(), threading.get_ident())
+
+        @synchronize
+        @asyncio.coroutine
+        def _in_coroutine():
+            seen['coroutine'] = request_id.get()
+            yield from _in_thread()
+
+        def _request(rid):
+            request_id.set(rid)
+            _in_coroutine()
+            return request_id.get()
+
+        out = self.loop.run_until_complete(asyncio.gather(
+            spawn_greenlet(_request, 'first'),
+            spawn_greenlet(_request, 'second'),
+        ))
+        self.assertEqual(out, ['first', 'second'])
+        self.assertIn(seen['coroutine'], ('first', 'second'))
+        self.assertEqual(seen['thread'][0], seen['coroutine'])
+        self.assertNotEqual(seen['thread'][1], threading.get_ident())
+        # nothing leaked into the context of the event loop
+        self.assertIsNone(request_id.get())
+
+    def test_nested_spans(self):
+        from aiopyramid.tracing import span, traced, current_span
+
+        @traced
+        def _blocking():
+            return current_span.get()
+
+        @synchronize
+        @traced(name='fetch')
+        @asyncio.coroutine
+        def _fetch():
+            yield from asyncio.sleep(0.01)
+            return (yield from use_executor(_blocking)())
+
+        def _request():
+            with span('request', path='/') as root:
+                innermost = _fetch()
+            return root, innermost
+
+        root, innermost = self.loop.run_until_complete(
+            spawn_greenlet(_request),
+        )
+
+        fetch, = self.exporter.named('fetch')
+        blocking, = self.exporter.named(_blocking.__qualname__)
+        self.assertIs(innermost, blocking)
+        self.assertEqual(root.parent_id, None)
+        self.assertEqual(fetch.parent_id, root.span_id)
+        self.assertEqual(blocking.parent_id, fetch.span_id)
+        self.assertEqual(
+            {s.trace_id for s in self.exporter.spans},
+            {root.trace_id},
+        )
+        self.assertGreaterEqual(fetch.duration_us, 10000)
+        self.assertGreaterEqual(root.duration, fetch.duration)
+        self.assertEqual(
+            [s.name for s in self.exporter.spans],
+            [blocking.name, 'fetch', 'request'],
+        )
+        self.assertIsNone(current_span.get())
+
+    def test_error_tag(self):
+        from aiopyramid.tracing import span
+
+        with self.assertRaises(KeyError):
+            with span('failing'):
+                raise KeyError
+        self.assertEqual(self.exporter.spans[0].tags['error'], 'KeyError')
+
+    def test_tween(self):
+        from pyramid import testing
+        from pyramid.response import Response
+        from aiopyramid.tracing import tracing_tween_factory, request_id
+
+        def _handler(request):
+            return Response(request_id.get())
+
+        tween = tracing_tween_factory(_handler, None)
+        request = testing.DummyRequest(
+            path='/things',
+            headers={'X-Request-ID': 'abc'},
+        )
+        response = self.loop.run_until_complete(spawn_greenlet(tween, request))
+
+        self.assertEqual(response.text, 'abc')
+        self.assertEqual(response.headers['X-Request-ID'], 'abc')
+        request_span, = self.exporter.named('request')
+        self.assertEqual(request_span.request_id, 'abc')
+        self.assertEqual(request_span.tags['status'], 200)
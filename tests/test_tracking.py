@@ -0,0 +1,145 @@
+import asyncio
+import subprocess
+import sys
+import unittest
+
+import greenlet
+
+from aiopyramid import tracking
+from aiopyramid.helpers import spawn_greenlet, synchronize
+
+
+class TestBridgeTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def tearDown(self):
+        tracking.disable()
+
+    def _abandon(self, func):
+        """ Cancels a request greenlet while it waits on a coroutine. """
+        task = asyncio.ensure_future(spawn_greenlet(func))
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(task)
+
+    def test_no_leaks(self):
+        tracker = tracking.enable()
+
+        @synchronize
+        @asyncio.coroutine
+        def _sample(pass_back):
+            yield from asyncio.sleep(0)
+            return pass_back
+
+        def _request():
+            return _sample(1) + _sample(2)
+
+        out = self.loop.run_until_complete(spawn_greenlet(_request))
+        self.assertEqual(out, 3)
+        self.assertEqual(tracker.stats(), {
+            'requests': 0,
+            'leaked_tasks': 0,
+            'leaked_greenlets': 0,
+            'collected': 0,
+            'orphans': 0,
+        })
+
+    def test_cancelled_sub_task_unwinds_request(self):
+        tracker = tracking.enable()
+
+        @synchronize
+        @asyncio.coroutine
+        def _slow():
+            yield from asyncio.sleep(10)
+
+        self._abandon(_slow)
+        self.assertEqual(tracker.leaked_tasks, 0)
+        self.assertEqual(tracker.leaked_greenlets, 0)
+
+    def test_abandoned_request(self):
+        tracker = tracking.enable()
+        waiter = asyncio.Future()
+
+        def _request():
+            greenlet.getcurrent().parent.switch(waiter)
+
+        self._abandon(_request)
+
+        self.assertEqual(tracker.leaked_greenlets, 1)
+        self.assertEqual(len(tracker.report()), 1)
+
+    def test_leaked_task(self):
+        tracker = tracking.enable()
+        request = greenlet.greenlet(lambda: None)
+        task = asyncio.ensure_future(asyncio.sleep(10))
+        tracker.track_task(request, task)
+        self.assertIs(tracker.owner(task), request)
+
+        tracker.finish_request(request)
+        self.assertEqual(tracker.leaked_tasks, 1)
+        self.assertEqual(tracker.report()[0][0], task)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(task)
+        self.assertEqual(tracker.report(), [])
+
+    def test_collect(self):
+        tracker = tracking.enable(collect=True)
+        request_greenlets = []
+
+        def _request():
+            this = greenlet.getcurrent()
+            request_greenlets.append(this)
+            this.parent.switch(asyncio.Future())
+
+        self._abandon(_request)
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(tracker.leaked_greenlets, 1)
+        self.assertEqual(tracker.collected, 1)
+        self.assertTrue(request_greenlets[0].dead)
+        self.assertEqual(tracker.report(), [])
+
+    def test_nested_greenlet_belongs_to_request(self):
+        tracker = tracking.enable()
+        owners = []
+
+        @asyncio.coroutine
+        def _inner():
+            return (yield from spawn_greenlet(_nested))
+
+        def _nested():
+            owners.append(tracker.owner(greenlet.getcurrent()))
+            return 5
+
+        def _request():
+            owners.append(greenlet.getcurrent())
+            return synchronize(_inner)()
+
+        out = self.loop.run_until_complete(spawn_greenlet(_request))
+        self.assertEqual(out, 5)
+        self.assertIs(owners[0], owners[1])
+
+
+class TestImport(unittest.TestCase):
+
+    def test_import_on_this_interpreter(self):
+        subprocess.check_call([
+            sys.executable,
+            '-c',
+            'import aiopyramid.helpers, aiopyramid.tracking',
+        ])
+
+    def test_current_task(self):
+
+        @asyncio.coroutine
+        def _current():
+            yield from asyncio.sleep(0)
+            return [tracking._current_task()]
+
+        task = asyncio.ensure_future(_current())
+        current, = asyncio.get_event_loop().run_until_complete(task)
+        self.assertIs(current, task)
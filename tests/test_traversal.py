@@ -1,9 +1,20 @@
 import unittest
 import asyncio
 
+from pyramid.interfaces import VH_ROOT_KEY
+from pyramid import testing
 from pyramid.traversal import traverse
 
 from aiopyramid.helpers import spawn_greenlet, synchronize
+from aiopyramid.traversal import (
+    AsyncioTraverser,
+    TraversalCache,
+    find_resource,
+    invalidate_traversal,
+    lineage,
+    resource_url,
+    resource_urls,
+)
 
 
 class DummyResource:
@@ -69,3 +80,303 @@ class TestTraversal(unittest.TestCase):
         )
         self.assertListEqual(list(out['traversed']), ['cat'])
         self.assertEqual(out['view_name'], 'mouse')
+
+
+class CountingResource:
+    """ Resource with a coroutine `__getitem__` that counts lookups. """
+
+    lookups = []
+
+    def __init__(self, name, parent):
+        self.__name__ = name
+        self.__parent__ = parent
+        self._dict = {}
+
+    @asyncio.coroutine
+    def __getitem__(self, key):
+        self.lookups.append(key)
+        yield from asyncio.sleep(0)
+        return self._dict[key]
+
+    def add_child(self, name):
+        self._dict[name] = child = CountingResource(name, self)
+        return child
+
+
+class TestTraversalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.root = CountingResource('', None)
+        self.root.__cache_key__ = 'site'
+        self.root.add_child('a').add_child('b').add_child('c').add_child('d')
+        del CountingResource.lookups[:]
+        self.cache = TraversalCache(maxsize=100)
+        self.traverser = AsyncioTraverser(self.root)
+        self.traverser.cache = self.cache
+
+    def _traverse(self, path, environ=None):
+        request = testing.DummyRequest(path=path, environ=environ)
+        request.matchdict = None
+        return self.loop.run_until_complete(
+            spawn_greenlet(self.traverser, request),
+        )
+
+    def test_warm_path(self):
+        out = self._traverse('/a/b')
+        self.assertEqual(CountingResource.lookups, ['a', 'b'])
+        again = self._traverse('/a/b')
+        self.assertEqual(CountingResource.lookups, ['a', 'b'])
+        self.assertIs(again['context'], out['context'])
+        self.assertEqual(again['traversed'], ('a', 'b'))
+
+    def test_cached_prefix(self):
+        self._traverse('/a/b/c')
+        out = self._traverse('/a/b/c/d')
+        self.assertEqual(CountingResource.lookups, ['a', 'b', 'c', 'd'])
+        self.assertEqual(out['context'].__name__, 'd')
+        self.assertEqual(out['view_name'], '')
+
+    def test_view_name_after_cached_prefix(self):
+        self._traverse('/a/b')
+        out = self._traverse('/a/b/edit/x')
+        self.assertEqual(CountingResource.lookups, ['a', 'b', 'edit'])
+        self.assertEqual(out['context'].__name__, 'b')
+        self.assertEqual(out['view_name'], 'edit')
+        self.assertEqual(out['subpath'], ('x',))
+        out = self._traverse('/a/@@view')
+        self.assertEqual(out['context'].__name__, 'a')
+        self.assertEqual(out['view_name'], 'view')
+
+    def test_virtual_root(self):
+        out = self._traverse('/c', environ={VH_ROOT_KEY: '/a/b'})
+        self.assertEqual(out['context'].__name__, 'c')
+        self.assertEqual(out['virtual_root'].__name__, 'b')
+        out = self._traverse('/c/d', environ={VH_ROOT_KEY: '/a/b'})
+        self.assertEqual(CountingResource.lookups, ['a', 'b', 'c', 'd'])
+        self.assertEqual(out['virtual_root'].__name__, 'b')
+        self.assertEqual(out['traversed'], ('a', 'b', 'c', 'd'))
+
+    def test_invalidate(self):
+        self._traverse('/a/b/c')
+        self.cache.invalidate('/a/b')
+        self._traverse('/a/b/c')
+        self.assertEqual(
+            CountingResource.lookups,
+            ['a', 'b', 'c', 'b', 'c'],
+        )
+
+    def test_invalidate_resource(self):
+        out = self._traverse('/a/b/c')
+        invalidate_traversal(out['context'].__parent__)
+        self.assertEqual(self.cache.lookup(self.root, ('a', 'b', 'c')), (
+            out['context'].__parent__.__parent__,
+        ))
+
+    def test_roots_not_shared(self):
+        self._traverse('/a')
+        other = CountingResource('', None)
+        other.__cache_key__ = 'tenant'
+        other.add_child('a')
+        self.traverser = AsyncioTraverser(other)
+        self.traverser.cache = self.cache
+        out = self._traverse('/a')
+        self.assertIs(out['context'].__parent__, other)
+        self.assertEqual(CountingResource.lookups, ['a', 'a'])
+
+    def test_root_without_key(self):
+        del self.root.__cache_key__
+        self._traverse('/a')
+        self._traverse('/a')
+        self.assertEqual(CountingResource.lookups, ['a', 'a'])
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_root_key_callable(self):
+        del self.root.__cache_key__
+        self.cache.root_key = lambda root: 'site'
+        self._traverse('/a')
+        self._traverse('/a')
+        self.assertEqual(CountingResource.lookups, ['a'])
+        cache = TraversalCache(root_key=lambda root: None)
+        self.assertIsNone(cache.root_key(self.root))
+
+    def test_ttl(self):
+        self.cache.entries.ttl = 0
+        self._traverse('/a')
+        self._traverse('/a')
+        self.assertEqual(CountingResource.lookups, ['a', 'a'])
+
+    def test_lru(self):
+        self.cache.entries.maxsize = 2
+        self._traverse('/a/b/c')
+        self.assertEqual(
+            sorted(key[1] for key in self.cache.entries.keys()),
+            [('a', 'b'), ('a', 'b', 'c')],
+        )
+
+
+class BulkResource(CountingResource):
+    """ Resource that resolves a whole path in one lookup. """
+
+    queries = []
+
+    @asyncio.coroutine
+    def __traverse__(self, segments):
+        self.queries.append(segments)
+        yield from asyncio.sleep(0)
+        found = []
+        ob = self
+        for segment in segments:
+            if not isinstance(ob, BulkResource):
+                break
+            try:
+                ob = ob._dict[segment]
+            except KeyError:
+                break
+            found.append(ob)
+        return found
+
+    def add_child(self, name, klass=None):
+        self._dict[name] = child = (klass or BulkResource)(name, self)
+        return child
+
+
+class TestBulkTraversal(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.root = BulkResource('', None)
+        self.root.add_child('a').add_child('b').add_child('c')
+        del BulkResource.queries[:]
+        del CountingResource.lookups[:]
+
+    def _traverse(self, path, cache=None):
+        traverser = AsyncioTraverser(self.root)
+        traverser.cache = cache
+        request = testing.DummyRequest(path=path)
+        request.matchdict = None
+        return self.loop.run_until_complete(
+            spawn_greenlet(traverser, request),
+        )
+
+    def test_one_query(self):
+        out = self._traverse('/a/b/c')
+        self.assertEqual(BulkResource.queries, [('a', 'b', 'c')])
+        self.assertEqual(CountingResource.lookups, [])
+        self.assertEqual(out['context'].__name__, 'c')
+        self.assertEqual(out['traversed'], ('a', 'b', 'c'))
+
+    def test_view_name_and_subpath(self):
+        out = self._traverse('/a/b/edit/x/y')
+        self.assertEqual(out['context'].__name__, 'b')
+        self.assertEqual(out['view_name'], 'edit')
+        self.assertEqual(out['subpath'], ('x', 'y'))
+        self.assertEqual(out['traversed'], ('a', 'b'))
+
+    def test_view_selector(self):
+        out = self._traverse('/a/b/@@edit/x')
+        self.assertEqual(BulkResource.queries, [('a', 'b')])
+        self.assertEqual(out['view_name'], 'edit')
+        self.assertEqual(out['subpath'], ('x',))
+
+    def test_fallback_to_getitem(self):
+        b = self.root._dict['a']._dict['b']
+        mount = b.add_child('m', CountingResource)
+        mount.add_child('n')
+        out = self._traverse('/a/b/m/n')
+        self.assertEqual(out['context'].__name__, 'n')
+        self.assertEqual(BulkResource.queries, [('a', 'b', 'm', 'n')])
+        self.assertEqual(CountingResource.lookups, ['n'])
+
+    def test_cache(self):
+        cache = TraversalCache(root_key=id)
+        self._traverse('/a/b', cache=cache)
+        out = self._traverse('/a/b/c', cache=cache)
+        self.assertEqual(BulkResource.queries, [('a', 'b'), ('c',)])
+        self.assertEqual(out['context'].__name__, 'c')
+
+
+class LazyResource:
+    """ Resource that looks up its parent lazily. """
+
+    parent_lookups = []
+
+    def __init__(self, name, parent=None):
+        self.__name__ = name
+        self._parent = parent
+        self._dict = {}
+
+    @asyncio.coroutine
+    def __parent__(self):
+        self.parent_lookups.append(self.__name__)
+        yield from asyncio.sleep(0)
+        return self._parent
+
+    @asyncio.coroutine
+    def __getitem__(self, key):
+        yield from asyncio.sleep(0)
+        return self._dict[key]
+
+    def add_child(self, name):
+        self._dict[name] = child = LazyResource(name, self)
+        return child
+
+
+class TestAsyncLocation(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.loop = asyncio.get_event_loop()
+        self.root = LazyResource('')
+        self.a = self.root.add_child('a')
+        self.b = self.a.add_child('b')
+        self.c = self.a.add_child('c')
+        del LazyResource.parent_lookups[:]
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_lineage(self):
+        out = self.loop.run_until_complete(lineage(self.b))
+        self.assertEqual(out, (self.b, self.a, self.root))
+
+    def test_lineage_of_plain_resources(self):
+        root = DummyResource('', None)
+        root.add_child('x', DummyResource)
+        out = self.loop.run_until_complete(lineage(root._dict['x']))
+        self.assertEqual(out, (root._dict['x'], root))
+
+    def test_resource_urls(self):
+        request = testing.DummyRequest()
+        urls = self.loop.run_until_complete(
+            resource_urls(request, [self.b, self.c, self.a], 'edit'),
+        )
+        self.assertEqual(urls, [
+            'http://example.com/a/b/edit',
+            'http://example.com/a/c/edit',
+            'http://example.com/a/edit',
+        ])
+        # the shared parents were only looked up once
+        self.assertEqual(
+            sorted(LazyResource.parent_lookups),
+            ['', 'a', 'b', 'c'],
+        )
+
+    def test_memoized_per_request(self):
+        request = testing.DummyRequest()
+        self.loop.run_until_complete(resource_url(request, self.b))
+        url = self.loop.run_until_complete(resource_url(request, self.b))
+        self.assertEqual(url, 'http://example.com/a/b/')
+        self.assertEqual(len(LazyResource.parent_lookups), 3)
+
+    def test_find_resource(self):
+        out = self.loop.run_until_complete(find_resource(self.c, '/a/b'))
+        self.assertIs(out, self.b)
+        out = self.loop.run_until_complete(find_resource(self.a, 'c'))
+        self.assertIs(out, self.c)
+        out = self.loop.run_until_complete(
+            find_resource(self.c, ('', 'a')),
+        )
+        self.assertIs(out, self.a)
+        with self.assertRaises(KeyError):
+            self.loop.run_until_complete(find_resource(self.a, 'missing'))
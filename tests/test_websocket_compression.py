@@ -0,0 +1,73 @@
+import unittest
+import zlib
+
+from aiopyramid.websocket.compression import (
+    DeflateWebSocketResponse,
+    DeflateWriter,
+)
+
+
+class Transport:
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(data)
+
+
+class Stream:
+
+    def __init__(self):
+        self.transport = Transport()
+
+    def drain(self):
+        pass
+
+
+class TestDeflateWriter(unittest.TestCase):
+
+    def _writer(self, **kw):
+        return DeflateWriter(Stream(), compress=15, threshold=64, **kw)
+
+    def _payload(self, frame):
+        length = frame[1] & 0x7f
+        if length == 126:
+            return frame[4:]
+        return frame[2:]
+
+    def test_small_messages_uncompressed(self):
+        writer = self._writer()
+        writer.send('small')
+        frame = writer.stream.transport.frames[0]
+        self.assertEqual(frame[0] & 0x40, 0)
+        self.assertEqual(self._payload(frame), b'small')
+
+    def test_large_messages_compressed(self):
+        writer = self._writer()
+        message = b'{"key": "value"}' * 100
+        writer.send(message)
+        frame = writer.stream.transport.frames[0]
+        self.assertEqual(frame[0] & 0x40, 0x40)
+        payload = self._payload(frame)
+        self.assertLess(len(payload), len(message))
+        decompress = zlib.decompressobj(-15)
+        self.assertEqual(
+            decompress.decompress(payload + b'\x00\x00\xff\xff'),
+            message,
+        )
+
+    def test_no_context_takeover_frees_compressor(self):
+        writer = self._writer(notakeover=True)
+        writer.send(b'x' * 100)
+        self.assertIsNone(writer._compressobj)
+        writer = self._writer()
+        writer.send(b'x' * 100)
+        self.assertIsNotNone(writer._compressobj)
+
+
+class TestDeflateWebSocketResponse(unittest.TestCase):
+
+    def test_window_bits_range(self):
+        with self.assertRaises(ValueError):
+            DeflateWebSocketResponse(window_bits=8)
@@ -0,0 +1,206 @@
+import array
+import asyncio
+import unittest
+
+from aiohttp import WSMessage, WSMsgType
+from pyramid import testing
+
+from aiopyramid.websocket.compression import DeflateWebSocketResponse
+
+try:
+    from aiopyramid.websocket.config import gunicorn as gunicorn_config
+    from aiopyramid.websocket.config.gunicorn import (
+        AiohttpWebsocket,
+        NATIVE_WEBSOCKET_KEY,
+        WebsocketMapper,
+    )
+except SyntaxError:
+    # websockets releases before 4.0 do not parse on Python 3.7
+    gunicorn_config = None
+
+
+class FakeWebSocketResponse:
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+        self.closed = False
+
+    @asyncio.coroutine
+    def receive(self):
+        if self.messages:
+            return self.messages.pop(0)
+        return WSMessage(WSMsgType.CLOSED, None, None)
+
+    @asyncio.coroutine
+    def send_str(self, data):
+        self.sent.append(('str', data))
+
+    @asyncio.coroutine
+    def send_bytes(self, data):
+        self.sent.append(('bytes', data))
+
+    @asyncio.coroutine
+    def close(self):
+        self.closed = True
+
+
+class QueuedWebSocketResponse(FakeWebSocketResponse):
+    """ Receives the frames fed to it, waiting when there are none. """
+
+    def __init__(self):
+        super().__init__([])
+        self.frames = asyncio.Queue()
+        self.pings = []
+        self.pongs = []
+
+    @asyncio.coroutine
+    def receive(self):
+        return (yield from self.frames.get())
+
+    def feed(self, msg_type, data):
+        self.frames.put_nowait(WSMessage(msg_type, data, None))
+
+    def ping(self, data):
+        self.pings.append(data)
+
+    def pong(self, data):
+        self.pongs.append(data)
+
+    @asyncio.coroutine
+    def drain(self):
+        yield from asyncio.sleep(0)
+
+
+@unittest.skipIf(gunicorn_config is None, 'websockets does not import')
+class TestAiohttpWebsocket(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def _recv_all(self, ws):
+        messages = []
+        while True:
+            message = self.loop.run_until_complete(ws.recv())
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def test_recv(self):
+        response = FakeWebSocketResponse([
+            WSMessage(WSMsgType.TEXT, 'text', None),
+            WSMessage(WSMsgType.BINARY, b'bin', None),
+        ])
+        ws = AiohttpWebsocket(response, None)
+        self.assertEqual(self._recv_all(ws), ['text', b'bin'])
+
+    def test_recv_bytes(self):
+        response = FakeWebSocketResponse([
+            WSMessage(WSMsgType.TEXT, 'text', None),
+        ])
+        ws = AiohttpWebsocket(response, None, use_bytes=True)
+        self.assertEqual(self._recv_all(ws), [b'text'])
+
+    def test_send_and_close(self):
+        response = FakeWebSocketResponse([])
+        ws = AiohttpWebsocket(response, None)
+        self.loop.run_until_complete(ws.send('a'))
+        self.loop.run_until_complete(ws.send(b'b'))
+        self.assertEqual(response.sent, [('str', 'a'), ('bytes', b'b')])
+        self.assertTrue(ws.open)
+        self.loop.run_until_complete(ws.close())
+        self.assertFalse(ws.open)
+
+    def test_send_buffers(self):
+        response = FakeWebSocketResponse([])
+        ws = AiohttpWebsocket(response, None)
+        payload = bytearray(b'payload')
+        self.loop.run_until_complete(ws.send(payload))
+        self.loop.run_until_complete(ws.send(array.array('H', [1, 2])))
+        self.assertIs(response.sent[0][1], payload)
+        self.assertEqual(response.sent[1][1].nbytes, 4)
+        self.assertEqual(len(response.sent[1][1]), 4)
+
+    def _spin(self):
+        for _ in range(3):
+            self.loop.run_until_complete(asyncio.sleep(0))
+
+    def test_ping(self):
+        response = QueuedWebSocketResponse()
+        ws = AiohttpWebsocket(response, None)
+        ws.start()
+        pong = self.loop.run_until_complete(ws.ping(b'check'))
+        self.assertEqual(response.pings, [b'check'])
+        self.assertFalse(pong.done())
+        response.feed(WSMsgType.PONG, b'check')
+        self.loop.run_until_complete(asyncio.wait_for(pong, 1))
+        # a pong still outstanding when the connection closes is cancelled
+        pong = self.loop.run_until_complete(ws.ping())
+        response.feed(WSMsgType.CLOSE, 1000)
+        self.assertIsNone(self.loop.run_until_complete(ws.recv()))
+        self.assertTrue(pong.cancelled())
+
+    def test_pings_answered_without_recv(self):
+        response = QueuedWebSocketResponse()
+        ws = AiohttpWebsocket(response, None)
+        ws.start()
+        response.feed(WSMsgType.TEXT, 'first')
+        response.feed(WSMsgType.PING, b'are you there')
+        self._spin()
+        self.assertEqual(response.pongs, [b'are you there'])
+        self.assertEqual(self.loop.run_until_complete(ws.recv()), 'first')
+        self.loop.run_until_complete(ws.close())
+        self._spin()
+        self.assertIsNone(self.loop.run_until_complete(ws.recv()))
+        self.assertIsNone(self.loop.run_until_complete(ws.recv()))
+
+    def test_reader_waits_for_recv(self):
+        response = QueuedWebSocketResponse()
+        ws = AiohttpWebsocket(response, None, max_queue=2)
+        ws.start()
+        for i in range(4):
+            response.feed(WSMsgType.TEXT, str(i))
+        self._spin()
+        self.assertEqual(response.frames.qsize(), 1)
+        messages = [
+            self.loop.run_until_complete(ws.recv())
+            for _ in range(4)
+        ]
+        self.assertEqual(messages, ['0', '1', '2', '3'])
+        self.loop.run_until_complete(ws.close())
+
+
+@unittest.skipIf(gunicorn_config is None, 'websockets does not import')
+class TestNativeWebsocketView(unittest.TestCase):
+
+    def test_marks_environ(self):
+
+        @asyncio.coroutine
+        def view(ws):
+            pass
+
+        request = testing.DummyRequest()
+        request.environ['aiohttp.request'] = object()
+        websocket_view = WebsocketMapper()(view)
+        response = websocket_view(None, request)
+        self.assertEqual(response.status_int, 101)
+        self.assertTrue(callable(request.environ[NATIVE_WEBSOCKET_KEY]))
+
+    def test_compression_setting(self):
+        config = testing.setUp(settings={
+            'aiopyramid.websocket.compress': 'true',
+        })
+        try:
+            request = testing.DummyRequest()
+            request.registry = config.registry
+            mapper = WebsocketMapper()
+            response = mapper.make_websocket_response(request)
+            self.assertIsInstance(response, DeflateWebSocketResponse)
+
+            class PlainMapper(WebsocketMapper):
+                compress = False
+
+            response = PlainMapper().make_websocket_response(request)
+            self.assertNotIsInstance(response, DeflateWebSocketResponse)
+        finally:
+            testing.tearDown()
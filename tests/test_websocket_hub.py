@@ -0,0 +1,618 @@
+import array
+import asyncio
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from aiopyramid.websocket.backplane import (
+    Backplane,
+    decode_batch,
+    encode_batch,
+)
+from aiopyramid.websocket.coalesce import CoalescingSender
+from aiopyramid.websocket.helpers import as_buffer
+from aiopyramid.websocket.hub import Hub, encode_frame
+from aiopyramid.websocket.registry import ConnectionRegistry
+from aiopyramid.websocket.view import WebsocketConnectionView
+
+
+class FakeTransport:
+
+    def __init__(self, buffered=0):
+        self.buffered = buffered
+        self.written = []
+        self.aborted = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def is_closing(self):
+        return self.aborted
+
+    def abort(self):
+        self.aborted = True
+
+
+class FakeWebsocket:
+
+    def __init__(self, transport=None, messages=()):
+        self.transport = transport
+        self.messages = list(messages)
+        self.sent = []
+
+    @asyncio.coroutine
+    def recv(self):
+        yield from asyncio.sleep(0)
+        if self.messages:
+            return self.messages.pop(0)
+        return None
+
+    @asyncio.coroutine
+    def send(self, message):
+        self.sent.append(message)
+
+
+class TestEncodeFrame(unittest.TestCase):
+
+    def test_text(self):
+        self.assertEqual(encode_frame('hi'), b'\x81\x02hi')
+
+    def test_binary(self):
+        self.assertEqual(encode_frame(b'\x00'), b'\x82\x01\x00')
+
+    def test_buffers(self):
+        self.assertEqual(encode_frame(memoryview(b'ab')), b'\x82\x02ab')
+        frame = encode_frame(array.array('H', [1]))
+        self.assertEqual(frame[:2], b'\x82\x02')
+
+    def test_as_buffer(self):
+        data = b'data'
+        self.assertIs(as_buffer(data), data)
+        view = as_buffer(array.array('I', [1, 2]))
+        self.assertEqual((view.format, len(view)), ('B', 8))
+
+    def test_extended_lengths(self):
+        frame = encode_frame(b'x' * 300)
+        self.assertEqual(frame[:2], b'\x82\x7e')
+        self.assertEqual(struct.unpack('!H', frame[2:4])[0], 300)
+        frame = encode_frame(b'x' * 70000)
+        self.assertEqual(frame[:2], b'\x82\x7f')
+        self.assertEqual(struct.unpack('!Q', frame[2:10])[0], 70000)
+        self.assertEqual(len(frame), 70010)
+
+
+class TestHub(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_frame_is_shared(self):
+        hub = Hub()
+        sockets = [FakeWebsocket(FakeTransport()) for _ in range(3)]
+        for ws in sockets:
+            hub.join('news', ws)
+        self.assertEqual(hub.publish('news', 'hello'), 3)
+        frames = [ws.transport.written[0] for ws in sockets]
+        self.assertEqual(frames[0], b'\x81\x05hello')
+        self.assertTrue(all(frame is frames[0] for frame in frames))
+        self.assertEqual(hub.publish('other', 'hello'), 0)
+
+    def test_large_payload_not_copied(self):
+        hub = Hub()
+        ws = FakeWebsocket(FakeTransport())
+        hub.join('files', ws)
+        payload = bytes(70000)
+        hub.publish('files', payload)
+        header, written = ws.transport.written
+        self.assertEqual(header, struct.pack('!BBQ', 0x82, 127, 70000))
+        self.assertIs(written, payload)
+
+    def test_leave(self):
+        hub = Hub()
+        ws = FakeWebsocket(FakeTransport())
+        hub.join('a', ws)
+        hub.join('b', ws)
+        hub.leave('a', ws)
+        self.assertEqual(hub.publish('a', 'x'), 0)
+        hub.leave_all(ws)
+        self.assertEqual(hub.topics, {})
+
+    def test_slow_subscriber_dropped(self):
+        hub = Hub(max_buffer=10)
+        slow = FakeWebsocket(FakeTransport(buffered=11))
+        fast = FakeWebsocket(FakeTransport())
+        hub.join('t', slow)
+        hub.join('t', fast)
+        self.assertEqual(hub.publish('t', 'x'), 1)
+        self.assertEqual(slow.transport.written, [])
+        self.assertEqual(hub.dropped, 1)
+        self.assertIn(slow, hub.subscribers('t'))
+
+    def test_slow_subscriber_disconnected(self):
+        hub = Hub(max_buffer=10, policy='disconnect')
+        slow = FakeWebsocket(FakeTransport(buffered=11))
+        hub.join('t', slow)
+        hub.publish('t', 'x')
+        self.assertTrue(slow.transport.aborted)
+        self.assertEqual(hub.disconnected, 1)
+        self.assertEqual(hub.topics, {})
+
+    def test_send_without_transport(self):
+        hub = Hub()
+        ws = FakeWebsocket()
+        hub.join('t', ws)
+        hub.publish('t', 'x')
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(ws.sent, ['x'])
+
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            Hub(policy='ignore')
+
+
+class TestViewTopics(unittest.TestCase):
+
+    def test_leaves_topics_on_close(self):
+        hub = Hub()
+
+        class ChatView(WebsocketConnectionView):
+
+            @asyncio.coroutine
+            def on_open(self):
+                self.join('chat')
+
+            @asyncio.coroutine
+            def on_message(self, message):
+                self.publish('chat', message)
+
+        ChatView.hub = hub
+        ws = FakeWebsocket(FakeTransport(), messages=['hi'])
+        view = ChatView(None, None)
+        asyncio.get_event_loop().run_until_complete(view(ws))
+        self.assertEqual(ws.transport.written, [b'\x81\x02hi'])
+        self.assertEqual(hub.topics, {})
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_round_trip(self):
+        messages = [('a', 'text'), ('b', b'\x00bytes'), ('é', '')]
+        packet = encode_batch(messages)
+        self.assertEqual(decode_batch(packet[4:]), messages)
+
+
+class TestBackplane(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.directory = tempfile.mkdtemp()
+        self.backplanes = []
+
+    def tearDown(self):
+        for backplane in self.backplanes:
+            backplane.close()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        shutil.rmtree(self.directory)
+
+    def _worker(self, name):
+        hub = Hub()
+        backplane = Backplane(hub, self.directory, name=name)
+        self.backplanes.append(backplane)
+        self.loop.run_until_complete(backplane.ensure_started())
+        return hub
+
+    def _settle(self):
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+
+    def test_relay(self):
+        hubs = [self._worker(name) for name in ('a', 'b', 'c')]
+        self._settle()
+        sockets = []
+        for hub in hubs:
+            ws = FakeWebsocket(FakeTransport())
+            hub.join('room', ws)
+            sockets.append(ws)
+        hubs[0].publish('room', 'one')
+        hubs[0].publish('room', 'two')
+        hubs[2].publish('room', b'three')
+        self._settle()
+        for ws in sockets:
+            self.assertEqual(
+                sorted(ws.transport.written),
+                sorted([b'\x81\x03one', b'\x81\x03two', b'\x82\x05three']),
+            )
+        # both messages from the first worker went out in one batch
+        self.assertEqual(self.backplanes[0].sent, 2)
+        self.assertEqual(self.backplanes[1].received, 3)
+
+    def test_one_connection_per_pair(self):
+        self._worker('a')
+        self._worker('b')
+        self._settle()
+        self.assertEqual(list(self.backplanes[0].peers), ['b'])
+        self.assertEqual(list(self.backplanes[1].peers), ['a'])
+
+    def test_stale_socket_removed(self):
+        stale = os.path.join(self.directory, 'dead.sock')
+        open(stale, 'w').close()
+        self._worker('a')
+        self.assertFalse(os.path.exists(stale))
+
+    def test_simultaneous_start(self):
+        for name in ('a', 'b'):
+            self.backplanes.append(Backplane(Hub(), self.directory, name))
+        self.loop.run_until_complete(asyncio.gather(
+            *[backplane.ensure_started() for backplane in self.backplanes]
+        ))
+        self._settle()
+        a, b = self.backplanes
+        # whether or not both connected, they agree on the connection kept
+        self.assertNotEqual(a.peers['b'].outbound, b.peers['a'].outbound)
+        ws = FakeWebsocket(FakeTransport())
+        b.hub.join('room', ws)
+        a.hub.publish('room', 'x')
+        self._settle()
+        self.assertEqual(ws.transport.written, [b'\x81\x01x'])
+
+
+class TestConcurrentMessages(unittest.TestCase):
+
+    def _run(self, view_class, messages):
+        ws = FakeWebsocket(FakeTransport(), messages=messages)
+        view = view_class(None, None)
+        asyncio.get_event_loop().run_until_complete(view(ws))
+        return view
+
+    def test_bounded_concurrency(self):
+
+        class SlowView(WebsocketConnectionView):
+            concurrency = 3
+
+            def __init__(self, context, request):
+                super().__init__(context, request)
+                self.running = 0
+                self.most = 0
+                self.done = []
+                self.closed_after = None
+
+            @asyncio.coroutine
+            def on_message(self, message):
+                self.running += 1
+                self.most = max(self.most, self.running)
+                yield from asyncio.sleep(0.01)
+                self.running -= 1
+                self.done.append(message)
+
+            @asyncio.coroutine
+            def on_close(self):
+                self.closed_after = len(self.done)
+
+        view = self._run(SlowView, list(range(10)))
+        self.assertEqual(view.most, 3)
+        self.assertEqual(sorted(view.done), list(range(10)))
+        self.assertEqual(view.closed_after, 10)
+
+    def test_order_per_key(self):
+
+        class KeyedView(WebsocketConnectionView):
+            concurrency = 10
+
+            def __init__(self, context, request):
+                super().__init__(context, request)
+                self.done = []
+
+            def message_key(self, message):
+                return message[0]
+
+            @asyncio.coroutine
+            def on_message(self, message):
+                # later messages finish sooner unless they are ordered
+                yield from asyncio.sleep(0.01 / int(message[1:]))
+                self.done.append(message)
+
+        view = self._run(KeyedView, ['a1', 'b1', 'a2', 'b2', 'a3'])
+        self.assertEqual([m for m in view.done if m[0] == 'a'],
+                         ['a1', 'a2', 'a3'])
+        self.assertEqual([m for m in view.done if m[0] == 'b'], ['b1', 'b2'])
+
+    def test_errors_are_logged(self):
+
+        class FailingView(WebsocketConnectionView):
+            concurrency = 2
+
+            def __init__(self, context, request):
+                super().__init__(context, request)
+                self.done = []
+
+            @asyncio.coroutine
+            def on_message(self, message):
+                if message == 'bad':
+                    raise ValueError(message)
+                self.done.append(message)
+
+        with self.assertLogs('aiopyramid.websocket.view', 'ERROR'):
+            view = self._run(FailingView, ['bad', 'good'])
+        self.assertEqual(view.done, ['good'])
+
+
+class PingingWebsocket(FakeWebsocket):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pongs = []
+
+    @asyncio.coroutine
+    def ping(self):
+        pong = asyncio.Future()
+        self.pongs.append(pong)
+        yield from asyncio.sleep(0)
+        return pong
+
+
+class TestConnectionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.now = 0.0
+
+    def _registry(self, **kw):
+        return ConnectionRegistry(clock=lambda: self.now, **kw)
+
+    def _spin(self):
+        for _ in range(3):
+            self.loop.run_until_complete(asyncio.sleep(0))
+
+    def test_max_connections(self):
+        registry = self._registry(max_connections=1)
+        first = FakeWebsocket(FakeTransport())
+        self.assertTrue(registry.register(first))
+        self.assertTrue(registry.full)
+        ran = []
+
+        @asyncio.coroutine
+        def view(ws):
+            ran.append(ws)
+
+        self.loop.run_until_complete(
+            registry.serve(view, FakeWebsocket(FakeTransport())),
+        )
+        self.assertEqual(ran, [])
+        self.assertEqual(registry.rejected, 1)
+        registry.unregister(first)
+        second = FakeWebsocket(FakeTransport())
+        self.loop.run_until_complete(registry.serve(view, second))
+        self.assertEqual(ran, [second])
+        self.assertEqual(len(registry), 0)
+
+    def test_idle_timeout(self):
+        registry = self._registry(idle_timeout=60)
+        quiet = FakeWebsocket(FakeTransport())
+        chatty = FakeWebsocket(FakeTransport(), messages=['hi'])
+        registry.register(quiet)
+        registry.register(chatty)
+        self.now = 50
+        self.loop.run_until_complete(chatty.send('x'))
+        self.now = 70
+        registry.check()
+        self.assertTrue(quiet.transport.aborted)
+        self.assertFalse(chatty.transport.aborted)
+        self.assertEqual(list(registry.connections), [chatty])
+        self.assertEqual(registry.idle_closed, 1)
+
+    def test_ping_pong(self):
+        registry = self._registry(ping_interval=30, pong_timeout=10)
+        ws = PingingWebsocket(FakeTransport())
+        registry.register(ws)
+        self.now = 30
+        registry.check()
+        self._spin()
+        self.assertEqual(len(ws.pongs), 1)
+        ws.pongs[0].set_result(None)
+        self._spin()
+        self.assertIsNone(registry.connections[ws].ping_sent)
+        # a message received postpones the next ping
+        self.now = 50
+        ws.messages.append('hi')
+        self.loop.run_until_complete(ws.recv())
+        self.now = 70
+        registry.check()
+        self.assertEqual(len(ws.pongs), 1)
+        self.now = 80
+        registry.check()
+        self._spin()
+        self.assertEqual(len(ws.pongs), 2)
+        self.now = 91
+        registry.check()
+        self.assertTrue(ws.transport.aborted)
+        self.assertEqual(registry.pong_closed, 1)
+        self.assertEqual(len(registry), 0)
+
+    def test_quiet_connection_pinged_once_per_interval(self):
+        registry = self._registry(ping_interval=30, pong_timeout=10)
+        ws = PingingWebsocket(FakeTransport())
+        registry.register(ws)
+        self.now = 30
+        registry.check()
+        self._spin()
+        ws.pongs[0].set_result(None)
+        self._spin()
+        # no messages, but the pong shows that the client is there
+        for now in (35, 45, 55):
+            self.now = now
+            registry.check()
+            self._spin()
+        self.assertEqual(len(ws.pongs), 1)
+        self.now = 60
+        registry.check()
+        self._spin()
+        self.assertEqual(len(ws.pongs), 2)
+
+    def test_no_ping_without_support(self):
+        registry = self._registry(ping_interval=30, pong_timeout=10)
+        ws = FakeWebsocket(FakeTransport())
+        registry.register(ws)
+        self.now = 100
+        registry.check()
+        self.assertIsNone(registry.connections[ws].ping_sent)
+
+    def test_buffered(self):
+        registry = self._registry()
+        ws = FakeWebsocket(FakeTransport(buffered=100))
+        ws.q_in = asyncio.Queue()
+        ws.q_in.put_nowait(b'12345')
+        ws.q_in.put_nowait(b'67890')
+        registry.register(ws)
+        self.assertEqual(registry.buffered(), 100)
+        self.assertEqual(registry.queued(), 2)
+        self.assertEqual(registry.stats()['connections'], 1)
+
+    def test_pushes_are_activity(self):
+        registry = self._registry(idle_timeout=60)
+        hub = Hub()
+        subscriber = FakeWebsocket(FakeTransport())
+        coalesced = FakeWebsocket(FakeTransport())
+        registry.register(subscriber)
+        registry.register(coalesced)
+        hub.join('news', subscriber)
+        self.now = 50
+        hub.publish('news', 'x')
+        sender = CoalescingSender(coalesced)
+        sender.send('x')
+        sender.flush()
+        self.now = 70
+        registry.check()
+        self.assertFalse(subscriber.transport.aborted)
+        self.assertFalse(coalesced.transport.aborted)
+        self.assertEqual(registry.idle_closed, 0)
+
+
+class TestCoalescingSender(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def _wait(self, seconds=0.02):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def test_one_write_per_flush(self):
+        ws = FakeWebsocket(FakeTransport())
+        sender = CoalescingSender(ws, interval=0.01)
+        for message in ('a', 'b', b'c'):
+            sender.send(message)
+        self.assertEqual(ws.transport.written, [])
+        self._wait()
+        self.assertEqual(
+            ws.transport.written,
+            [b'\x81\x01a\x81\x01b\x82\x01c'],
+        )
+        self.assertEqual(sender.frames, 3)
+        self.assertEqual(sender.writes, 1)
+        self.assertEqual(sender.frames_saved, 0)
+
+    def test_latest_value_wins(self):
+        ws = FakeWebsocket(FakeTransport())
+        sender = CoalescingSender(ws, interval=0.01)
+        sender.send('a1', key='a')
+        sender.send('b1', key='b')
+        sender.send('x')
+        sender.send('a2', key='a')
+        sender.send('a3', key='a')
+        sender.flush()
+        self.assertEqual(
+            ws.transport.written,
+            [b'\x81\x02a3\x81\x02b1\x81\x01x'],
+        )
+        self.assertEqual(sender.stats()['frames_saved'], 2)
+        # keys start over after a flush
+        sender.send('a4', key='a')
+        sender.flush()
+        self.assertEqual(ws.transport.written[-1], b'\x81\x02a4')
+
+    def test_combine(self):
+        ws = FakeWebsocket(FakeTransport())
+        sender = CoalescingSender(
+            ws,
+            combine=lambda pending, new: pending + new,
+        )
+        sender.send('a', key=1)
+        sender.send('b', key=1)
+        sender.flush()
+        self.assertEqual(ws.transport.written, [b'\x81\x02ab'])
+
+    def test_max_batch(self):
+        ws = FakeWebsocket(FakeTransport())
+        sender = CoalescingSender(ws, interval=10, max_batch=3)
+        sender.send('a')
+        sender.send('a', key='k')
+        sender.send('b', key='k')
+        self.assertEqual(ws.transport.written, [])
+        sender.send('c')
+        self.assertEqual(
+            ws.transport.written,
+            [b'\x81\x01a\x81\x01b\x81\x01c'],
+        )
+        self.assertIsNone(sender._handle)
+
+    def test_large_payloads_written_apart(self):
+        ws = FakeWebsocket(FakeTransport())
+        sender = CoalescingSender(ws)
+        payload = bytearray(70000)
+        for message in ('a', payload, 'b'):
+            sender.send(message)
+        sender.flush()
+        first, large, last = ws.transport.written
+        self.assertEqual(
+            first,
+            b'\x81\x01a' + struct.pack('!BBQ', 0x82, 127, 70000),
+        )
+        self.assertIs(large, payload)
+        self.assertEqual(last, b'\x81\x01b')
+        self.assertEqual(sender.writes, 3)
+
+    def test_pack(self):
+        ws = FakeWebsocket(FakeTransport())
+        sender = CoalescingSender(ws, pack=','.join)
+        for message in ('1', '2', '3'):
+            sender.send(message)
+        sender.flush()
+        self.assertEqual(ws.transport.written, [b'\x81\x051,2,3'])
+        self.assertEqual(sender.frames, 1)
+        self.assertEqual(sender.frames_saved, 2)
+
+    def test_closing_transport(self):
+        ws = FakeWebsocket(FakeTransport())
+        ws.transport.aborted = True
+        sender = CoalescingSender(ws)
+        sender.send('a')
+        sender.flush()
+        self.assertEqual(ws.transport.written, [])
+        self.assertEqual(sender.dropped, 1)
+
+    def test_send_without_transport(self):
+        ws = FakeWebsocket()
+        sender = CoalescingSender(ws, max_batch=2)
+        for message in ('a', 'b', 'c', 'd', 'e'):
+            sender.send(message)
+        self.loop.run_until_complete(sender.close())
+        self.assertEqual(ws.sent, ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(sender.frames, 5)
+
+    def test_view_flushes_on_close(self):
+
+        class TickerView(WebsocketConnectionView):
+            coalesce = {'interval': 10}
+
+            @asyncio.coroutine
+            def on_message(self, message):
+                yield from self.send(message, key='price')
+
+        ws = FakeWebsocket(FakeTransport(), messages=['1', '2', '3'])
+        view = TickerView(None, None)
+        self.loop.run_until_complete(view(ws))
+        self.assertEqual(ws.transport.written, [b'\x81\x013'])
+        self.assertEqual(view.sender.frames_saved, 2)
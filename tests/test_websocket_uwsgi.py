@@ -0,0 +1,213 @@
+import asyncio
+import socket
+import unittest
+
+import greenlet
+from pyramid.exceptions import ConfigurationError
+
+try:
+    from aiopyramid.websocket.config import uwsgi as uwsgi_config
+    from aiopyramid.websocket.config.uwsgi import UWSGIWebsocketMapper
+    from aiopyramid.websocket.registry import ConnectionRegistry
+except SyntaxError:
+    # the config package also imports websockets, whose releases before 4.0
+    # do not parse on Python 3.7
+    uwsgi_config = None
+
+
+class FakeUWSGI:
+    """
+    Stands in for the uwsgi module. Frames queued with `receive` become
+    readable together, the way uWSGI buffers them behind a single readable
+    event on the connection.
+    """
+
+    def __init__(self):
+        self.server, self.client = socket.socketpair()
+        self.server.setblocking(False)
+        self.inbound = []
+        self.sent = []
+        self.closed = False
+
+    def receive(self, *messages):
+        self.inbound.extend(messages)
+        self.client.send(b'x')
+
+    def disconnect(self):
+        self.closed = True
+        self.client.send(b'x')
+
+    def websocket_handshake(self):
+        pass
+
+    def connection_fd(self):
+        return self.server.fileno()
+
+    def websocket_recv_nb(self):
+        try:
+            self.server.recv(1024)
+        except BlockingIOError:
+            pass
+        if self.inbound:
+            return self.inbound.pop(0)
+        if self.closed:
+            raise OSError('unable to receive websocket message')
+        return b''
+
+    def websocket_send(self, message):
+        self.sent.append(message)
+
+
+@unittest.skipIf(uwsgi_config is None, 'websockets does not import')
+class TestUWSGIBridge(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.uwsgi = FakeUWSGI()
+        uwsgi_config.uwsgi = self.uwsgi
+        self.max_queue = UWSGIWebsocketMapper.max_queue
+
+    def tearDown(self):
+        UWSGIWebsocketMapper.max_queue = self.max_queue
+        del uwsgi_config.uwsgi
+        self.uwsgi.server.close()
+        self.uwsgi.client.close()
+
+    def _serve(self, view):
+        done = asyncio.Future()
+        view_callable = UWSGIWebsocketMapper()(view)
+
+        def request():
+            try:
+                view_callable(None, None)
+            finally:
+                done.set_result(None)
+
+        greenlet.greenlet(request).switch()
+        return done
+
+    def _wait(self, done):
+        self.loop.run_until_complete(asyncio.wait_for(done, 2))
+
+    def test_drains_buffered_frames(self):
+        received = []
+
+        @asyncio.coroutine
+        def echo(ws):
+            while True:
+                message = yield from ws.recv()
+                if message is None:
+                    break
+                received.append(message)
+                yield from ws.send(message)
+
+        done = self._serve(echo)
+        messages = [str(i).encode() for i in range(200)]
+        self.uwsgi.receive(*messages)
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertEqual(len(received), 200)
+        self.uwsgi.disconnect()
+        self._wait(done)
+        self.assertEqual(self.uwsgi.sent, messages)
+
+    def test_send_burst(self):
+        @asyncio.coroutine
+        def burst(ws):
+            for i in range(500):
+                yield from ws.send(str(i))
+            message = yield from ws.recv()
+            self.assertIsNone(message)
+
+        switches = []
+        done = self._serve(burst)
+        wake = uwsgi_config.UWSGIWebsocket._switch
+
+        def counting(ws):
+            switches.append(1)
+            wake(ws)
+
+        uwsgi_config.UWSGIWebsocket._switch = counting
+        try:
+            self.loop.run_until_complete(asyncio.sleep(0.05))
+        finally:
+            uwsgi_config.UWSGIWebsocket._switch = wake
+        self.assertEqual(self.uwsgi.sent, [str(i) for i in range(500)])
+        # one switch per full queue rather than per message
+        self.assertLessEqual(len(switches), 500 // self.max_queue + 1)
+        self.uwsgi.disconnect()
+        self._wait(done)
+
+    def test_pauses_reading_when_view_is_behind(self):
+        UWSGIWebsocketMapper.max_queue = 4
+        release = asyncio.Event()
+        received = []
+
+        @asyncio.coroutine
+        def slow(ws):
+            yield from release.wait()
+            while True:
+                message = yield from ws.recv()
+                if message is None:
+                    break
+                received.append(message)
+
+        done = self._serve(slow)
+        self.uwsgi.receive(*[b'm'] * 10)
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertEqual(len(self.uwsgi.inbound), 6)
+        release.set()
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertEqual(len(received), 10)
+        self.uwsgi.disconnect()
+        self._wait(done)
+
+    def test_binary_mode(self):
+        received = []
+
+        class BinaryMapper(UWSGIWebsocketMapper):
+            binary = True
+
+        @asyncio.coroutine
+        def collect(ws):
+            received.append((yield from ws.recv()))
+            yield from ws.send(memoryview(b'reply'))
+
+        UWSGIWebsocketMapper.use_str = True
+        try:
+            view_callable = BinaryMapper()(collect)
+            done = asyncio.Future()
+
+            def request():
+                try:
+                    view_callable(None, None)
+                finally:
+                    done.set_result(None)
+
+            greenlet.greenlet(request).switch()
+            self.uwsgi.receive(b'text')
+            self._wait(done)
+        finally:
+            UWSGIWebsocketMapper.use_str = False
+        self.assertEqual(received, [b'text'])
+        self.assertEqual(self.uwsgi.sent, [b'reply'])
+
+    def test_send_before_return(self):
+
+        @asyncio.coroutine
+        def goodbye(ws):
+            yield from ws.send(b'bye')
+
+        self._wait(self._serve(goodbye))
+        self.assertEqual(self.uwsgi.sent, [b'bye'])
+
+    def test_ping_interval_rejected(self):
+
+        class PingingMapper(UWSGIWebsocketMapper):
+            registry = ConnectionRegistry(ping_interval=30)
+
+        @asyncio.coroutine
+        def view(ws):
+            pass
+
+        with self.assertRaises(ConfigurationError):
+            PingingMapper()(view)